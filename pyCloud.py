@@ -9,8 +9,14 @@ from src.clouds_manager import (
     save_sync_folders,
     ROOT_FOLDER,
     sync_locals_folders,
+    watch_locals_folders,
     CLOUDS,
+    FOLDER_JOBS,
 )
+from src.async_sync import sync_folders_async, sync_locals_folders_async
+from src.watcher import FolderWatcher, watch_folders, DEBOUNCE_SECONDS
+
+ENGINES = ["threads", "async"]
 
 
 def validate_folder_path(ctx, param, value):
@@ -42,10 +48,10 @@ def validate_cloud_path(ctx, param, value):
 def validate_cloud_name(value, extension=False):
     value = int(value) - 1
     if extension:
-        if value < 0 or value > len(CLOUDS) + 1:
+        if value < 0 or value >= len(CLOUDS) + 1:
             raise click.BadParameter(f"Пункта {value + 1} в меню нет")
     else:
-        if value < 0 or value > len(CLOUDS):
+        if value < 0 or value >= len(CLOUDS):
             raise click.BadParameter(f"Пункта {value + 1} в меню нет")
 
     return value + 1
@@ -112,30 +118,138 @@ def watched_folders():
 
 
 @pyCloud.command()
-def sync_cloud():
+@click.option(
+    "--sequential",
+    is_flag=True,
+    help="Синхронизировать облака по очереди, а не одновременно",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=FOLDER_JOBS,
+    show_default=True,
+    help="Сколько отслеживаемых папок одного облака синхронизировать одновременно",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="threads",
+    show_default=True,
+    help="async - все запросы на одном event loop (только yandex и dropbox)",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Только вывести план синхронизации, ничего не меняя на облаках",
+)
+def sync_cloud(sequential, jobs, engine, dry_run):
     """Синхронизация пк -> облако"""
-    clouds = get_clouds_menu()
+    if dry_run and engine == "async":
+        click.echo("--dry-run поддерживается только с --engine threads")
+        return
+    clouds = get_clouds_menu(all_clouds=True)
     click.echo("Starting synchronization...")
-    sync_folders(clouds)
-    click.echo("Synchronization successfully")
+    if engine == "async":
+        failed_clouds = sync_folders_async(clouds)
+    else:
+        failed_clouds = sync_folders(
+            clouds, concurrent=not sequential, folder_jobs=jobs, dry_run=dry_run
+        )
+    if failed_clouds:
+        click.echo(f"Synchronization failed for: {', '.join(failed_clouds)}")
+    else:
+        click.echo("Synchronization successfully")
 
 
 @pyCloud.command()
-def sync_pc():
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="threads",
+    show_default=True,
+    help="async - все запросы на одном event loop, "
+    "только отслеживаемые папки (только yandex и dropbox)",
+)
+def sync_pc(engine):
     """Синхронизация облако -> пк"""
     cloud = get_clouds_menu()
     click.echo("Starting synchronization...")
-    sync_locals_folders(cloud)
+    if engine == "async":
+        if sync_locals_folders_async(cloud):
+            click.echo(f"Synchronization failed for: {cloud}")
+            return
+    else:
+        sync_locals_folders(cloud)
     click.echo("Synchronization successfully")
 
-def get_clouds_menu():
+
+@pyCloud.command()
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=FOLDER_JOBS,
+    show_default=True,
+    help="Сколько отслеживаемых папок одного облака синхронизировать одновременно",
+)
+@click.option(
+    "--debounce",
+    type=click.FloatRange(min=0),
+    default=DEBOUNCE_SECONDS,
+    show_default=True,
+    help="Сколько секунд ждать после последнего изменения перед синхронизацией",
+)
+def watch(jobs, debounce):
+    """Следить за отслеживаемыми папками и загружать изменения на облака"""
+    folders = get_and_update_sync_folders()
+    if not folders:
+        return
+    clouds = get_clouds_menu(all_clouds=True)
+
+    def sync(changed_folders):
+        click.echo(f"Изменены папки: {', '.join(changed_folders)}")
+        failed_clouds = sync_folders(clouds, folder_jobs=jobs, folders=changed_folders)
+        if failed_clouds:
+            click.echo(f"Synchronization failed for: {', '.join(failed_clouds)}")
+
+    try:
+        watcher = FolderWatcher(folders)
+    except OSError as e:
+        click.echo(f"Не удалось начать наблюдение: {e}")
+        return
+
+    try:
+        # изменения, сделанные пока наблюдение не работало
+        sync(folders)
+        click.echo("Наблюдение за папками запущено, Ctrl+C - остановить")
+        watch_folders(watcher, sync, debounce=debounce)
+    except KeyboardInterrupt:
+        click.echo("Наблюдение остановлено")
+    finally:
+        watcher.close()
+
+
+@pyCloud.command()
+def watch_pc():
+    """Следить за Dropbox и сразу переносить изменения на пк"""
+    click.echo("Starting synchronization...")
+    try:
+        watch_locals_folders("dropbox")
+    except KeyboardInterrupt:
+        click.echo("Наблюдение остановлено")
+
+
+def get_clouds_menu(all_clouds=False):
     keys = list(CLOUDS.keys())
     clouds_with_keys = {i: keys[i - 1] for i in range(1, len(keys) + 1)}
+    if all_clouds:
+        clouds_with_keys[len(keys) + 1] = "все облака"
     menu = "\n" + "\n".join([f"{k}: {v}" for k, v in clouds_with_keys.items()])
     number_in_menu = click.prompt(
         text="Выберите облако с которым вы хотите синхронизировать файлы на пк" + menu,
-        value_proc=validate_cloud_name,
+        value_proc=lambda value: validate_cloud_name(value, extension=all_clouds),
     )
+    if number_in_menu > len(keys):
+        return keys
     return clouds_with_keys[number_in_menu]
 
 def get_valid_folder_path(folder_name):
@@ -1,25 +1,45 @@
 from __future__ import print_function
 
-import hashlib
 import mimetypes
 import io
 
 import apiclient
+import concurrent.futures
 import httplib2
 import datetime
+import json
 import os
 import pickle
+import threading
+import time
+import weakref
 
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+import google_auth_httplib2
+from googleapiclient.http import HttpRequest, MediaFileUpload, MediaIoBaseDownload
 from oauth2client import client
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 
 from src.cloud_interface import CloudInterface
+from src.hash_cache import hash_cache
+from src.sync_plan import Operation, MKDIR, UPLOAD, REPLACE, DELETE, DOWNLOAD, MOVE
+from src.transfer import get_transfer_executor, file_size, remove_nested_folders
 from src.Yandex.yandex_disk import format_datetime
 
 TIME_DELTA = datetime.timedelta(seconds=5)
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# поля файлов, которые хранятся в дереве облака между синхронизациями
+TREE_FIELDS = "id, name, parents, mimeType, modifiedTime, md5Checksum, size"
+LIST_PAGE_SIZE = 1000
+# листинг всего диска делается один раз на клиента и общий для всех папок:
+# клиент -> Future с (токен changes, id -> поля TREE_FIELDS)
+_drive_listings = weakref.WeakKeyDictionary()
+_drive_listings_lock = threading.Lock()
+# файлы больше части загружаются возобновляемой загрузкой,
+# размер части должен быть кратен 256 КБ
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_RETRIES = 5
 SCOPES = ["https://www.googleapis.com/auth/drive"]
 APPLICATION_NAME = "Drive API Python Quickstart"
 GOOGLE_MIME_TYPES = {  # нужны для определения файлов google_docs и последующей конвертации для загрузки {docs: os_type}
@@ -83,21 +103,66 @@ def get_service():
         with open(token_path, "wb") as token:
             pickle.dump(creds, token)
 
-    service = build("drive", "v3", credentials=creds)
+    # httplib2.Http не потокобезопасен, поэтому у каждого потока пула передач
+    # свой http-клиент, а объект service общий
+    thread_local = threading.local()
+
+    def build_request(http, *args, **kwargs):
+        if not hasattr(thread_local, "http"):
+            thread_local.http = google_auth_httplib2.AuthorizedHttp(
+                creds, http=httplib2.Http()
+            )
+        return HttpRequest(thread_local.http, *args, **kwargs)
+
+    service = build("drive", "v3", credentials=creds, requestBuilder=build_request)
     return service
 
 
+def get_upload_key(os_file_path, kwargs):
+    """Ключ сессии загрузки: файл, его версия и куда он загружается"""
+    stat = os.stat(os_file_path)
+    target = kwargs.get("fileId") or ",".join(kwargs["body"]["parents"])
+    return (
+        f"upload:{os.path.abspath(os_file_path)}:{stat.st_size}:"
+        f"{stat.st_mtime_ns}:{target}"
+    )
+
+
+def get_children(tree):
+    children = {}
+    for file_id, item in tree.items():
+        for parent_id in item.get("parents", []):
+            children.setdefault(parent_id, []).append(file_id)
+    return children
+
+
+def get_subtree(tree, root_id):
+    """Часть tree, лежащая внутри папки root_id"""
+    children = get_children(tree)
+    subtree = {}
+    folders = [root_id]
+    while folders:
+        for file_id in children.get(folders.pop(), []):
+            if file_id not in subtree:
+                subtree[file_id] = tree[file_id]
+                folders.append(file_id)
+    return subtree
+
+
 def handle_response(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except client.AccessTokenRefreshError:
+            args[0].errors += 1
             print(
                 "The credentials have been revoked or expired, please re-authenticate."
             )
         except httplib2.ServerNotFoundError:
+            args[0].errors += 1
             print("No internet connection available.")
         except apiclient.errors.HttpError as error:
+            args[0].errors += 1
             code = error.resp.status
             if code == 403:
                 print("Access denied: the user does not have sufficient permissions.")
@@ -117,15 +182,31 @@ def handle_response(func):
 
 
 class GoogleDrive(CloudInterface):
-    def __init__(self, dir_name, full_path):
-        self.service = get_service()
+    HASH_ALGORITHM = "md5"
+    upload_chunk_size = UPLOAD_CHUNK_SIZE
+
+    def __init__(self, dir_name, full_path, client=None, planning=False):
+        # сервис общий для всех папок облака, http у каждого потока свой
+        self.service = client if client is not None else get_service()
         self.dir_name = dir_name
         self.full_path = full_path
         from src.clouds_manager import ROOT_FOLDER
 
         self.ROOT_FOLDER = ROOT_FOLDER
+        self.remote_files = {}
+        self.tree = None
+        # id папки -> id её содержимого, строится один раз на дерево
+        self.tree_children = None
+        self.tree_root = None
+        self.transfers = get_transfer_executor(self.__class__.__name__)
+        self.planning = planning
         if dir_name != "":
-            self.folder_id = self.check_upload()
+            # при планировании папку на облаке не создаём, только ищем
+            self.folder_id = self.find_folder() if planning else self.check_upload()
+
+    @property
+    def client(self):
+        return self.service
 
     @handle_response
     def check_upload(self):
@@ -172,6 +253,27 @@ class GoogleDrive(CloudInterface):
 
         return folder_id
 
+    @handle_response
+    def find_folder(self):
+        """id отслеживаемой папки на облаке, None если её там ещё нет"""
+        folder_id = "root"
+        for name in (self.ROOT_FOLDER, self.dir_name):
+            q = (
+                f"'{folder_id}' in parents and trashed != True and "
+                f"mimeType='{FOLDER_MIME_TYPE}'"
+            )
+            items = self.service.files().list(pageSize=100, q=q).execute()
+            ids = [
+                item["id"] for item in items.get("files", []) if item["name"] == name
+            ]
+            if not ids:
+                print(
+                    f"Папки {self.dir_name} нет на облаке, она будет загружена целиком"
+                )
+                return None
+            folder_id = ids[0]
+        return folder_id
+
     @handle_response
     def root_folder_upload(self, root_folder_id):
         parents_id = {}
@@ -195,13 +297,13 @@ class GoogleDrive(CloudInterface):
 
             for name in files:
                 file_metadata = {"name": name, "parents": [folder_id]}
-                media = MediaFileUpload(
+                self.execute_upload(
+                    self.service.files().create,
                     os.path.join(root, name),
-                    mimetype=mimetypes.MimeTypes().guess_type(name)[0],
+                    mimetypes.MimeTypes().guess_type(name)[0],
+                    body=file_metadata,
+                    fields="id",
                 )
-                self.service.files().create(
-                    body=file_metadata, media_body=media, fields="id"
-                ).execute()
 
             parents_id[last_dir] = folder_id
 
@@ -221,41 +323,173 @@ class GoogleDrive(CloudInterface):
     @handle_response
     def get_drive_tree(self, folder_name, tree_list, root):
         folder_id = self.parents_id[folder_name]
-
-        # получаем список папок
-        results = (
-            self.service.files()
-            .list(
-                pageSize=100,
-                q=(
-                    "%r in parents and \
-            mimeType = 'application/vnd.google-apps.folder'and \
-            trashed != True"
-                    % folder_id
-                ),
+        if folder_id is None:
+            # папки ещё нет на облаке (только при планировании)
+            self.tree, self.tree_children, self.tree_root = {}, {}, None
+            return
+        tree = self.load_tree(folder_id)
+        if self.tree_children is None:
+            self.tree_children = get_children(tree)
+        children = self.tree_children
+
+        # обход в глубину, как раньше при запросе каждой папки
+        stack = [(folder_id, root + folder_name + os.path.sep)]
+        while stack:
+            folder_id, root = stack.pop()
+            folders = [
+                tree[file_id]
+                for file_id in children.get(folder_id, [])
+                if tree[file_id]["mimeType"] == FOLDER_MIME_TYPE
+            ]
+            for item in reversed(folders):
+                self.parents_id[item["name"]] = item["id"]
+                stack.append((item["id"], root + item["name"] + os.path.sep))
+            tree_list += [root + item["name"] for item in folders]
+
+    def load_tree(self, root_id):
+        """Все файлы и папки внутри папки root_id: id -> поля TREE_FIELDS.
+
+        После полного обхода в sync_state сохраняется токен changes,
+        в следующий раз changes.list возвращает только изменения"""
+        if self.tree is not None and self.tree_root == root_id:
+            return self.tree
+
+        key = f"changes:{root_id}"
+        saved = self.sync_state.get_meta(key) if self.sync_state else None
+        if saved:
+            saved = json.loads(saved)
+            tree = saved["files"]
+            token = self.apply_changes(tree, root_id, saved["token"])
+        else:
+            token, tree = self.list_drive_tree(root_id)
+
+        if self.sync_state and not self.planning:
+            self.sync_state.set_meta(key, json.dumps({"token": token, "files": tree}))
+        self.tree = tree
+        self.tree_children = get_children(tree)
+        self.tree_root = root_id
+        return tree
+
+    def get_tree_items(self, folder_id):
+        """Содержимое папки из загруженного дерева, None если папки в нём нет"""
+        if self.tree is None or (
+            folder_id != self.tree_root and folder_id not in self.tree
+        ):
+            return None
+        if self.tree_children is None:
+            self.tree_children = get_children(self.tree)
+        return [self.tree[file_id] for file_id in self.tree_children.get(folder_id, [])]
+
+    def list_items(self, q):
+        """Все файлы запроса q, по LIST_PAGE_SIZE за запрос"""
+        page_token = None
+        while True:
+            results = (
+                self.service.files()
+                .list(
+                    pageSize=LIST_PAGE_SIZE,
+                    q=q,
+                    fields=f"nextPageToken, files({TREE_FIELDS})",
+                    pageToken=page_token,
+                )
+                .execute()
             )
-            .execute()
-        )
-
-        items = results.get("files", [])
-        root += folder_name + os.path.sep
-
-        for item in items:
-            self.parents_id[item["name"]] = item["id"]
-            tree_list.append(root + item["name"])
-            folder_name = item["name"]
-            self.get_drive_tree(folder_name, tree_list, root)
+            yield from results.get("files", [])
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return
+
+    def list_drive_tree(self, root_id):
+        """Содержимое папки root_id и токен changes на момент до листинга.
+
+        Диск листится одним постраничным запросом один раз на клиента,
+        папки облака берут из этого листинга свои поддеревья"""
+        with _drive_listings_lock:
+            listing = _drive_listings.get(self.service)
+            owner = listing is None
+            if owner:
+                listing = _drive_listings[self.service] = concurrent.futures.Future()
+
+        if owner:
+            try:
+                # токен берём до обхода, чтобы не потерять изменения во время него
+                token = (
+                    self.service.changes()
+                    .getStartPageToken()
+                    .execute()["startPageToken"]
+                )
+                items = {
+                    item["id"]: item for item in self.list_items("trashed = false")
+                }
+            except Exception as e:
+                # следующая папка попробует листинг заново
+                with _drive_listings_lock:
+                    _drive_listings.pop(self.service, None)
+                listing.set_exception(e)
+                raise
+            listing.set_result((token, items))
+
+        token, items = listing.result()
+        return token, get_subtree(items, root_id)
+
+    def list_subtree(self, tree, folder_id):
+        """Добавляет в tree всё содержимое папки folder_id, запрос на каждую папку"""
+        folders = [folder_id]
+        while folders:
+            parent_id = folders.pop()
+            q = f"'{parent_id}' in parents and trashed != True"
+            for item in self.list_items(q):
+                tree[item["id"]] = item
+                if item["mimeType"] == FOLDER_MIME_TYPE:
+                    folders.append(item["id"])
+
+    def apply_changes(self, tree, root_id, token):
+        """Применяет к tree изменения Drive после token, возвращает новый токен"""
+        new_folders = []
+        while True:
+            results = (
+                self.service.changes()
+                .list(
+                    pageToken=token,
+                    pageSize=LIST_PAGE_SIZE,
+                    fields="nextPageToken, newStartPageToken, "
+                    f"changes(fileId, removed, file({TREE_FIELDS}, trashed))",
+                )
+                .execute()
+            )
+            for change in results.get("changes", []):
+                item = change.get("file")
+                if change.get("removed") or not item or item.pop("trashed", False):
+                    tree.pop(change["fileId"], None)
+                    continue
+                if item["mimeType"] == FOLDER_MIME_TYPE and item["id"] not in tree:
+                    new_folders.append(item["id"])
+                tree[item["id"]] = item
+
+            if "newStartPageToken" in results:
+                token = results["newStartPageToken"]
+                break
+            token = results["nextPageToken"]
+
+        # файлы, которые ушли из папки или лежали в удалённых папках, убираем
+        subtree = get_subtree(tree, root_id)
+        tree.clear()
+        tree.update(subtree)
+
+        # о содержимом папки, перемещённой в дерево, changes не сообщает
+        for folder_id in new_folders:
+            if folder_id in tree:
+                self.list_subtree(tree, folder_id)
+
+        return token
 
     @handle_response
-    def upload_dir_on_cloud(self, upload_folders):
-        upload_folders = sorted(
-            upload_folders, key=lambda input_str: input_str.count(os.path.sep)
-        )
+    def plan_upload_dir_on_cloud(self, upload_folders):
+        operations = []
         for folder_dir in upload_folders:
             var = os.path.split(self.full_path)[0] + os.path.sep
             variable = var + folder_dir
             last_dir = folder_dir.split(os.path.sep)[-1]
-            pre_last_dir = folder_dir.split(os.path.sep)[-2]
 
             files = [
                 f
@@ -263,33 +497,153 @@ class GoogleDrive(CloudInterface):
                 if os.path.isfile(os.path.join(variable, f))
             ]
 
-            folder_metadata = {
-                "name": last_dir,
-                "parents": [self.parents_id[pre_last_dir]],
-                "mimeType": "application/vnd.google-apps.folder",
-            }
-            create_folder = (
-                self.service.files().create(body=folder_metadata, fields="id").execute()
+            operations.append(
+                Operation(MKDIR, folder_dir, self.create_folder, (folder_dir,))
             )
-            print(f"Папка {last_dir} успешно создана")
-            folder_id = create_folder.get("id", [])
-            self.parents_id[last_dir] = folder_id
 
             for os_file in files:
-                some_metadata = {"name": os_file, "parents": [folder_id]}
-                os_file_mimetype = mimetypes.MimeTypes().guess_type(
-                    os.path.join(variable, os_file)
-                )[0]
-                media = MediaFileUpload(
-                    os.path.join(variable, os_file), mimetype=os_file_mimetype
-                )
-                upload_this = (
-                    self.service.files()
-                    .create(body=some_metadata, media_body=media, fields="id")
-                    .execute()
+                os_file_path = os.path.join(variable, os_file)
+                operations.append(
+                    Operation(
+                        UPLOAD,
+                        os.path.join(folder_dir, os_file),
+                        self.upload_file_to_folder,
+                        (os_file_path, last_dir),
+                        size=file_size(os_file_path),
+                        os_path=os_file_path,
+                    )
                 )
-                upload_this = upload_this.get("id", [])
-                print(f"Файл {os_file} загружен в {last_dir}")
+        return operations
+
+    @handle_response
+    def create_folder(self, folder_dir):
+        last_dir = folder_dir.split(os.path.sep)[-1]
+        pre_last_dir = folder_dir.split(os.path.sep)[-2]
+        folder_metadata = {
+            "name": last_dir,
+            "parents": [self.parents_id[pre_last_dir]],
+            "mimeType": "application/vnd.google-apps.folder",
+        }
+        create_folder = (
+            self.service.files().create(body=folder_metadata, fields="id").execute()
+        )
+        print(f"Папка {last_dir} успешно создана")
+        self.parents_id[last_dir] = create_folder.get("id", [])
+
+    def upload_file_to_folder(self, os_file_path, folder_name):
+        # id новой папки известен только после её создания
+        self.upload_file(os_file_path, self.parents_id[folder_name], folder_name)
+
+    @handle_response
+    def upload_file(self, os_file_path, parent_id, parent_name):
+        file_metadata = {"name": os.path.basename(os_file_path), "parents": [parent_id]}
+        filemime = mimetypes.MimeTypes().guess_type(os_file_path)[0]
+        self.execute_upload(
+            self.service.files().create,
+            os_file_path,
+            filemime,
+            body=file_metadata,
+            fields="id",
+        )
+        print(f"Файл {os.path.basename(os_file_path)} загружен в {parent_name}")
+
+    @handle_response
+    def update_file(self, file_id, os_file_path, mimetype):
+        self.execute_upload(
+            self.service.files().update,
+            os_file_path,
+            mimetype,
+            fileId=file_id,
+            fields="id",
+        )
+        print(f"Файл {os.path.basename(os_file_path)} успешно обновлён")
+
+    def execute_upload(self, method, os_file_path, mimetype, **kwargs):
+        """Загружает файл запросом method (files().create или update).
+
+        Файлы до upload_chunk_size уходят одним запросом, большие - частями
+        возобновляемой загрузкой. Адрес сессии загрузки хранится в sync_state,
+        после обрыва связи или в следующий запуск загрузка продолжается
+        с последнего принятого сервером байта"""
+        if file_size(os_file_path) <= self.upload_chunk_size:
+            media_body = MediaFileUpload(os_file_path, mimetype=mimetype)
+            return method(media_body=media_body, **kwargs).execute()
+
+        key = get_upload_key(os_file_path, kwargs)
+        session_uri = self.sync_state.get_meta(key) if self.sync_state else None
+        request = self.create_upload_request(method, os_file_path, mimetype, kwargs)
+
+        response = None
+        failures = 0
+        while response is None:
+            try:
+                if session_uri and request.resumable_uri is None:
+                    response = self.resume_upload(request, session_uri)
+                    continue
+                _, response = request.next_chunk(num_retries=UPLOAD_RETRIES)
+            except apiclient.errors.HttpError as error:
+                if session_uri and error.resp.status in (404, 410):
+                    # сессия загрузки истекла, начинаем заново
+                    print(f"Загрузка {os.path.basename(os_file_path)} начата заново")
+                    session_uri = None
+                    request = self.create_upload_request(
+                        method, os_file_path, mimetype, kwargs
+                    )
+                    continue
+                raise
+            except (httplib2.HttpLib2Error, OSError):
+                failures += 1
+                if failures > UPLOAD_RETRIES:
+                    raise
+                time.sleep(2**failures)
+                continue
+
+            failures = 0
+            if self.sync_state and request.resumable_uri != session_uri:
+                session_uri = request.resumable_uri
+                self.sync_state.set_meta(key, session_uri)
+
+        if self.sync_state and session_uri:
+            self.sync_state.delete_meta(key)
+        return response
+
+    def resume_upload(self, request, session_uri):
+        """Продолжает сессию загрузки session_uri: спрашивает у сервера,
+        сколько байт уже принято, и ставит request на следующий байт.
+
+        Returns:
+            Ответ API, если файл уже загружен целиком, иначе None
+
+        """
+        headers = {
+            "Content-Range": f"bytes */{request.resumable.size()}",
+            "content-length": "0",
+        }
+        resp, content = request.http.request(session_uri, "PUT", headers=headers)
+        if resp.status in (200, 201):
+            return json.loads(content)
+        if resp.status != 308:
+            raise apiclient.errors.HttpError(resp, content, uri=session_uri)
+
+        request.resumable_uri = session_uri
+        # range: bytes=0-N, без него сервер ещё ничего не принял
+        if "range" in resp:
+            request.resumable_progress = int(resp["range"].split("-")[1]) + 1
+        return None
+
+    def create_upload_request(self, method, os_file_path, mimetype, kwargs):
+        media_body = MediaFileUpload(
+            os_file_path,
+            mimetype=mimetype,
+            chunksize=self.upload_chunk_size,
+            resumable=True,
+        )
+        return method(media_body=media_body, **kwargs)
+
+    @handle_response
+    def delete_file(self, file_id, name):
+        self.service.files().delete(fileId=file_id).execute()
+        print(f"Файл {name} успешно удалён на облаке")
 
     @handle_response
     def get_os_and_cloud_files(self, folder_id, os_path):
@@ -297,16 +651,20 @@ class GoogleDrive(CloudInterface):
             f for f in os.listdir(os_path) if os.path.isfile(os.path.join(os_path, f))
         ]
 
+        items = self.get_tree_items(folder_id)
+        if items is not None:
+            # файлы папки уже есть в дереве облака
+            clouds_files = [f for f in items if f["mimeType"] != FOLDER_MIME_TYPE]
+            return os_files, clouds_files
+
         results = (
             self.service.files()
             .list(
                 pageSize=1000,
-                q=(
-                    f'"{folder_id}" in parents and \
+                q=(f'"{folder_id}" in parents and \
                                 mimeType!="application/vnd.google-apps.folder" and \
-                                trashed != True'
-                ),
-                fields="files(id, name, mimeType, modifiedTime, md5Checksum)",
+                                trashed != True'),
+                fields="files(id, name, mimeType, modifiedTime, md5Checksum, size)",
             )
             .execute()
         )
@@ -325,7 +683,7 @@ class GoogleDrive(CloudInterface):
             f["modifiedTime"] for f in clouds_files if f["name"] == drive_file["name"]
         ][0]
         cloud_modified_time = datetime.datetime.fromisoformat(mtime)
-        os_file_md5 = hashlib.md5(open(file_dir, "rb").read()).hexdigest()
+        os_file_md5 = hash_cache.md5(file_dir)
         if "md5Checksum" in drive_file.keys():
             drive_md5 = drive_file["md5Checksum"]
         else:
@@ -334,14 +692,14 @@ class GoogleDrive(CloudInterface):
         return os_modified_time, cloud_modified_time, os_file_md5, drive_md5
 
     @handle_response
-    def update_dir_on_cloud(self, exact_folders):
+    def plan_update_dir_on_cloud(self, exact_folders):
+        operations = []
         for folder_dir in exact_folders:
             from src.clouds_manager import get_os_path_by_cloud_path
 
             os_path = get_os_path_by_cloud_path(folder_dir)
-            os_files, clouds_files = self.get_os_and_cloud_files(
-                self.parents_id[os.path.basename(folder_dir)], os_path
-            )
+            folder_id = self.parents_id[os.path.basename(folder_dir)]
+            os_files, clouds_files = self.get_os_and_cloud_files(folder_id, os_path)
             last_dir = os.path.split(folder_dir)[1]
 
             refresh_files = [f for f in clouds_files if f["name"] in os_files]
@@ -358,74 +716,99 @@ class GoogleDrive(CloudInterface):
                     self.get_data_for_comparison(os_path, drive_file, clouds_files)
                 )
 
-                a = abs(os_modified_time - cloud_modified_time)
                 if os_modified_time - cloud_modified_time > TIME_DELTA or (
                     drive_file["mimeType"] != "application/vnd.google-apps.document"
                     and drive_md5 != os_file_md5
                 ):
-                    file_id = [
-                        f["id"] for f in clouds_files if f["name"] == drive_file["name"]
-                    ][0]
-                    file_mime = [
-                        f["mimeType"]
-                        for f in clouds_files
-                        if f["name"] == drive_file["name"]
-                    ][0]
-
-                    file_metadata = {
-                        "name": drive_file["name"],
-                        "parents": [self.parents_id[last_dir]],
-                    }
-                    media_body = MediaFileUpload(
-                        os.path.join(os_path, drive_file["name"]), mimetype=file_mime
+                    os_file_path = os.path.join(os_path, drive_file["name"])
+                    operations.append(
+                        Operation(
+                            REPLACE,
+                            os.path.join(folder_dir, drive_file["name"]),
+                            self.update_file,
+                            (drive_file["id"], os_file_path, drive_file["mimeType"]),
+                            size=file_size(os_file_path),
+                        )
+                    )
+                else:
+                    self.remote_files[os.path.join(folder_dir, drive_file["name"])] = (
+                        drive_file["id"],
+                        drive_md5,
                     )
-                    self.service.files().update(
-                        fileId=file_id, media_body=media_body, fields="id"
-                    ).execute()
-                    print(f'Файл {drive_file["name"]} успешно обновлён')
 
             for drive_file in remove_files:
-                file_id = [
-                    f["id"] for f in clouds_files if f["name"] == drive_file["name"]
-                ][0]
-                self.service.files().delete(fileId=file_id).execute()
-                print(f'Файл {drive_file["name"]} успешно удалён на облаке')
+                operations.append(
+                    Operation(
+                        DELETE,
+                        os.path.join(folder_dir, drive_file["name"]),
+                        self.delete_file,
+                        (drive_file["id"], drive_file["name"]),
+                        size=int(drive_file.get("size", 0)),
+                        digest=drive_file.get("md5Checksum"),
+                        remote=(drive_file["id"], folder_id),
+                    )
+                )
 
             for os_file in upload_files:
                 file_dir = os.path.join(os_path, os_file)
-
-                # File's new content.
-                filemime = mimetypes.MimeTypes().guess_type(file_dir)[0]
-                file_metadata = {
-                    "name": os_file,
-                    "parents": [self.parents_id[last_dir]],
-                }
-                media_body = MediaFileUpload(file_dir, mimetype=filemime)
-
-                self.service.files().create(
-                    body=file_metadata, media_body=media_body, fields="id"
-                ).execute()
-                print(f"Файл {os_file} успешно загружен в {last_dir}")
-
-    @handle_response
-    def remove_old_dir_on_cloud(self, remove_folders):
-        remove_folders = sorted(
-            remove_folders,
-            key=lambda input_str: input_str.count(os.path.sep),
-            reverse=True,
+                operations.append(
+                    Operation(
+                        UPLOAD,
+                        os.path.join(folder_dir, os_file),
+                        self.upload_file,
+                        (file_dir, self.parents_id[last_dir], last_dir),
+                        size=file_size(file_dir),
+                        os_path=file_dir,
+                    )
+                )
+        return operations
+
+    def plan_move(self, delete, upload):
+        return Operation(
+            MOVE,
+            upload.path,
+            self.move_file,
+            (
+                *delete.remote,
+                os.path.basename(upload.path),
+                os.path.basename(os.path.dirname(upload.path)),
+            ),
+            size=upload.size,
+            source=delete.path,
         )
 
-        for folder_dir in remove_folders:
-            var = (os.path.sep).join(
-                self.full_path.split(os.path.sep)[0:-1]
-            ) + os.path.sep
-            variable = var + folder_dir
+    @handle_response
+    def move_file(self, file_id, old_parent_id, name, folder_name):
+        self.service.files().update(
+            fileId=file_id,
+            addParents=self.parents_id[folder_name],
+            removeParents=old_parent_id,
+            body={"name": name},
+            fields="id",
+        ).execute()
+        print(f"Файл {name} перемещён в {folder_name}")
+
+    def plan_remove_old_dir_on_cloud(self, remove_folders):
+        # удаление папки удаляет и вложенные в неё
+        operations = []
+        for folder_dir in remove_nested_folders(remove_folders):
             last_dir = folder_dir.split(os.path.sep)[
                 -1
             ]  # получаем название фала чтобы получит id
-            folder_id = self.parents_id[last_dir]
-            self.service.files().delete(fileId=folder_id).execute()  # и удаляем по id
-            print(f"Папка {last_dir} успешно удалена с облака")
+            operations.append(
+                Operation(
+                    DELETE,
+                    folder_dir,
+                    self.delete_folder,
+                    (self.parents_id[last_dir], last_dir),
+                )
+            )
+        return operations
+
+    @handle_response
+    def delete_folder(self, folder_id, name):
+        self.service.files().delete(fileId=folder_id).execute()  # и удаляем по id
+        print(f"Папка {name} успешно удалена с облака")
 
     @handle_response
     def check_root_folder(self):
@@ -445,10 +828,8 @@ class GoogleDrive(CloudInterface):
         return root_folder
 
     @handle_response
-    def downloading_folders(self, download_folders):
-        download_folders = sorted(
-            download_folders, key=lambda input_str: input_str.count(os.path.sep)
-        )
+    def plan_downloading_folders(self, download_folders):
+        operations = []
         for folder_dir in download_folders:
             from src.clouds_manager import get_os_path_by_cloud_path
 
@@ -456,15 +837,19 @@ class GoogleDrive(CloudInterface):
             last_dir = folder_dir.split(os.path.sep)[-1]
 
             folder_id = self.parents_id[last_dir]
-            results = (
-                self.service.files()
-                .list(pageSize=20, q=("%r in parents" % folder_id))
-                .execute()
+            items = self.get_tree_items(folder_id)
+            if items is None:
+                results = (
+                    self.service.files()
+                    .list(pageSize=20, q=("%r in parents" % folder_id))
+                    .execute()
+                )
+                items = results.get("files", [])
+            operations.append(
+                Operation(
+                    MKDIR, folder_dir, self.create_folder_on_pc, (os_path,), on_pc=True
+                )
             )
-
-            items = results.get("files", [])
-            os.makedirs(os_path)
-            print(f"Папка {os.path.basename(os_path)} создана на пк")
             files = [
                 f
                 for f in items
@@ -472,10 +857,29 @@ class GoogleDrive(CloudInterface):
             ]
 
             for drive_file in files:
-                self.download_file_from_drive(os_path, drive_file)
-                print(
-                    f'Файл {drive_file["name"]} загружен в папку {os.path.basename(os_path)}'
+                operations.append(
+                    Operation(
+                        DOWNLOAD,
+                        os.path.join(folder_dir, drive_file["name"]),
+                        self.download_file_with_message,
+                        (
+                            os_path,
+                            drive_file,
+                            f'Файл {drive_file["name"]} загружен в папку {os.path.basename(os_path)}',
+                        ),
+                        size=int(drive_file.get("size", 0)),
+                        on_pc=True,
+                    )
                 )
+        return operations
+
+    def create_folder_on_pc(self, os_path):
+        os.makedirs(os_path)
+        print(f"Папка {os.path.basename(os_path)} создана на пк")
+
+    def download_file_with_message(self, file_path, drive_file, message):
+        self.download_file_from_drive(file_path, drive_file)
+        print(message)
 
     @handle_response
     def download_file_from_drive(self, file_path, drive_file):
@@ -511,7 +915,8 @@ class GoogleDrive(CloudInterface):
             while done is False:
                 _, done = downloader.next_chunk()
 
-    def update_dir_on_pc(self, exact_folders):
+    def plan_update_dir_on_pc(self, exact_folders):
+        operations = []
         for folder_dir in exact_folders:
             from src.clouds_manager import get_os_path_by_cloud_path
 
@@ -519,7 +924,6 @@ class GoogleDrive(CloudInterface):
             os_files, cloud_files = self.get_os_and_cloud_files(
                 self.parents_id[os.path.split(folder_dir)[1]], os_path
             )
-            last_dir = os.path.split(folder_dir)[1]
 
             refresh_files = [f for f in cloud_files if f["name"] in os_files]
             remove_files = [
@@ -537,17 +941,54 @@ class GoogleDrive(CloudInterface):
                     or drive_file["mimeType"] != "application/vnd.google-apps.document"
                     and drive_md5 != os_file_md5
                 ):
-                    os.remove(os.path.join(os_path, drive_file["name"]))
-                    self.download_file_from_drive(os_path, drive_file)
-                    print(f'Файл {drive_file["name"]} обновлён на пк')
+                    operations.append(
+                        Operation(
+                            DOWNLOAD,
+                            os.path.join(folder_dir, drive_file["name"]),
+                            self.refresh_file_on_pc,
+                            (os_path, drive_file),
+                            size=int(drive_file.get("size", 0)),
+                            on_pc=True,
+                        )
+                    )
 
             for os_file in remove_files:
-                os.remove(os.path.join(os_path, os_file))
-                print(f"Файл {os.path.basename(os_file)} удалён с пк")
+                operations.append(
+                    Operation(
+                        DELETE,
+                        os.path.join(folder_dir, os_file),
+                        self.remove_file_on_pc,
+                        (os.path.join(os_path, os_file),),
+                        on_pc=True,
+                    )
+                )
 
             for drive_file in download_files:
-                self.download_file_from_drive(os_path, drive_file)
-                print(f'Файл {drive_file["name"]} загружен на пк')
+                operations.append(
+                    Operation(
+                        DOWNLOAD,
+                        os.path.join(folder_dir, drive_file["name"]),
+                        self.download_file_with_message,
+                        (
+                            os_path,
+                            drive_file,
+                            f'Файл {drive_file["name"]} загружен на пк',
+                        ),
+                        size=int(drive_file.get("size", 0)),
+                        on_pc=True,
+                    )
+                )
+        return operations
+
+    def refresh_file_on_pc(self, os_path, drive_file):
+        os.remove(os.path.join(os_path, drive_file["name"]))
+        self.download_file_with_message(
+            os_path, drive_file, f'Файл {drive_file["name"]} обновлён на пк'
+        )
+
+    def remove_file_on_pc(self, os_file_path):
+        os.remove(os_file_path)
+        print(f"Файл {os.path.basename(os_file_path)} удалён с пк")
 
     @handle_response
     def list_files(self, path):
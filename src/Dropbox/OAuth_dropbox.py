@@ -12,11 +12,20 @@ import requests
 class DropboxHeadersManager:
     def __init__(self):
         self.token_manager = DropboxTokenManager()
+        self._refresh_lock = threading.Lock()
 
     @property
     def token(self):
         return self.token_manager.get_access_token()
 
+    def refresh_token(self, expired_token=None):
+        """Обновляет токен один раз, даже если он истёк сразу в нескольких потоках"""
+        with self._refresh_lock:
+            # пока ждали блокировку, токен мог обновить другой поток
+            if expired_token is not None and self.token != expired_token:
+                return
+            self.token_manager.refresh_token()
+
     @property
     def headers(self):
         return {
@@ -0,0 +1,119 @@
+import datetime
+import json
+import os
+
+from src.async_cloud_interface import AsyncCloudInterface, RemoteEntry, MAX_REQUESTS
+from src.hash_cache import hash_cache
+from src.Dropbox.dropbox import DROPBOX_API_URL, DROPBOX_CONTENT_URL
+from src.Dropbox.OAuth_dropbox import DropboxHeadersManager
+
+LIST_LIMIT = 2000
+
+
+class AsyncDropBox(AsyncCloudInterface):
+    def __init__(self, client=None, max_requests=MAX_REQUESTS):
+        super().__init__(
+            client if client is not None else DropboxHeadersManager(), max_requests
+        )
+        from src.clouds_manager import ROOT_FOLDER
+
+        self.ROOT_FOLDER = ROOT_FOLDER
+
+    def cloud_path(self, path):
+        return f"/{self.ROOT_FOLDER}/{path}" if path else f"/{self.ROOT_FOLDER}"
+
+    async def call(self, endpoint, data, allowed_errors=()):
+        """Запрос к API, ошибки 409 с error_summary из allowed_errors возвращают None"""
+        status, body = await self.send(
+            "POST", f"{DROPBOX_API_URL}/{endpoint}", json=data
+        )
+        if 200 <= status < 300:
+            return json.loads(body) if body else {}
+
+        try:
+            error_message = json.loads(body).get("error_summary", "Нет описания ошибки")
+        except ValueError:
+            error_message = body.decode(errors="replace") or "Нет описания ошибки"
+        if status == 409 and error_message.startswith(allowed_errors):
+            return None
+        raise Exception(f"Ошибка {status}: {error_message}")
+
+    async def list_folder(self, path):
+        result = await self.call(
+            "files/list_folder",
+            {"path": self.cloud_path(path), "limit": LIST_LIMIT},
+            allowed_errors=("path/not_found",),
+        )
+        if result is None:
+            return []
+
+        items = result["entries"]
+        while result["has_more"]:
+            result = await self.call(
+                "files/list_folder/continue", {"cursor": result["cursor"]}
+            )
+            items += result["entries"]
+
+        return [
+            RemoteEntry(
+                item["name"],
+                item[".tag"] == "folder",
+                item.get("size"),
+                (
+                    datetime.datetime.fromisoformat(item["server_modified"])
+                    if "server_modified" in item
+                    else None
+                ),
+                item.get("content_hash"),
+            )
+            for item in items
+        ]
+
+    async def create_folder(self, path):
+        await self.call(
+            "files/create_folder_v2",
+            {"path": self.cloud_path(path), "autorename": False},
+            allowed_errors=("path/conflict",),
+        )
+
+    async def upload_file(self, os_path, path):
+        arg = {"path": self.cloud_path(path), "mode": "overwrite", "mute": True}
+        status, body = await self.send(
+            "POST",
+            f"{DROPBOX_CONTENT_URL}/files/upload",
+            headers={
+                "Dropbox-API-Arg": json.dumps(arg),
+                "Content-Type": "application/octet-stream",
+            },
+            upload=os_path,
+        )
+        if status != 200:
+            raise Exception(f"Ошибка {status}: {body.decode(errors='replace')}")
+
+    async def download_file(self, path, os_path):
+        status, body = await self.send(
+            "POST",
+            f"{DROPBOX_CONTENT_URL}/files/download",
+            headers={"Dropbox-API-Arg": json.dumps({"path": self.cloud_path(path)})},
+            save_to=os_path,
+        )
+        if status != 200:
+            raise Exception(f"Ошибка {status}: {body.decode(errors='replace')}")
+
+    async def delete(self, path):
+        await self.call(
+            "files/delete_v2",
+            {"path": self.cloud_path(path)},
+            allowed_errors=("path_lookup/not_found",),
+        )
+
+    def same_file(self, os_path, entry):
+        if entry.size != os.path.getsize(os_path):
+            return False
+        if entry.digest is not None:
+            return entry.digest == hash_cache.get(os_path, "content_hash")
+
+        os_modified_time = datetime.datetime.fromtimestamp(
+            os.path.getmtime(os_path), tz=datetime.timezone.utc
+        )
+        return os_modified_time <= entry.modified
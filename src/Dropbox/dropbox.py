@@ -1,7 +1,11 @@
 import json
+import tempfile
+import threading
+import time
 import traceback
-import hashlib
 import os
+import shutil
+import zipfile
 
 import requests
 import datetime
@@ -9,20 +13,206 @@ import datetime
 from src.Yandex.yandex_disk import format_datetime
 from .OAuth_dropbox import DropboxHeadersManager
 from src.cloud_interface import CloudInterface
+from src.hash_cache import hash_cache
+from src.sync_plan import Operation, MKDIR, UPLOAD, REPLACE, DELETE, DOWNLOAD, MOVE
+from src.transfer import get_transfer_executor, file_size, remove_nested_folders
+from src.transport import get_transport, DEFAULT_TIMEOUT
 
 URL = "https://api.dropboxapi.com/2/files"
 DROPBOX_API_URL = "https://api.dropboxapi.com/2"
 DROPBOX_CONTENT_URL = "https://content.dropboxapi.com/2"
+LIST_FOLDER_LIMIT = 2000
+# файлы больше части загружаются сессией, в режиме concurrent
+# части должны быть кратны 4 МБ и отправляются параллельно
+UPLOAD_SESSION_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_SESSION_POOL = "DropBoxUploadSession"
+UPLOAD_CHUNK_RETRIES = 3
+# сколько загруженных сессий коммитится одним finish_batch_v2, больше API не принимает
+FINISH_BATCH_LIMIT = 1000
+# больше путей create_folder_batch и delete_batch не принимают
+CREATE_FOLDER_BATCH_LIMIT = 10000
+DELETE_BATCH_LIMIT = 1000
+LONGPOLL_URL = "https://notify.dropboxapi.com/2/files/list_folder/longpoll"
+# дольше 480 секунд сервер запрос не держит, и добавляет до 90 секунд сверху
+LONGPOLL_TIMEOUT = 480
+LONGPOLL_JITTER = 90
+# ошибки download_zip, при которых папка скачивается по файлам
+DOWNLOAD_ZIP_LIMIT_ERRORS = ("too_large", "too_many_files")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# пауза между проверками асинхронного задания растёт до JOB_POLL_MAX_DELAY
+JOB_POLL_DELAY = 0.5
+JOB_POLL_MAX_DELAY = 5
+# поля записей листинга, которые сохраняются вместе с курсором
+LIST_FOLDER_FIELDS = (
+    ".tag",
+    "name",
+    "path_display",
+    "id",
+    "rev",
+    "size",
+    "server_modified",
+    "content_hash",
+)
+
+
+def apply_list_folder_entries(tree, entries):
+    """Применяет записи list_folder к дереву path_lower -> запись"""
+    for entry in entries:
+        path_lower = entry["path_lower"]
+        if entry[".tag"] == "deleted":
+            # удалённая папка удаляет и всё своё содержимое
+            prefix = path_lower + "/"
+            for path in [p for p in tree if p == path_lower or p.startswith(prefix)]:
+                del tree[path]
+            continue
+        tree[path_lower] = {k: v for k, v in entry.items() if k in LIST_FOLDER_FIELDS}
+
+
+def get_children(tree):
+    """Записи дерева по папкам: path_lower папки -> записи в ней"""
+    children = {}
+    for path_lower, item in tree.items():
+        children.setdefault(path_lower.rsplit("/", 1)[0], []).append(item)
+    return children
+
+
+def get_upload_session_key(loadfile):
+    """Ключ сессии загрузки, у изменённого файла он другой"""
+    stat = os.stat(loadfile)
+    return (
+        f"upload_session:{os.path.abspath(loadfile)}:{stat.st_size}:"
+        f"{stat.st_mtime_ns}"
+    )
+
+
+def is_changed(os_hash, cloud_hash, newer):
+    """Нужно ли передавать файл: по хэшу, а без хэша облака по времени изменения"""
+    if cloud_hash is None:
+        return newer
+    return os_hash != cloud_hash
+
+
+def is_path_error(entry, tag):
+    """Ошибка пакетного задания вида path/<tag>"""
+    failure = entry.get("failure") or {}
+    for key in ("path", "path_lookup"):
+        if isinstance(failure.get(key), dict) and failure[key].get(".tag") == tag:
+            return True
+    return False
+
+
+def get_error_summary(response):
+    """error_summary ответа 409 Dropbox, например path/not_found/..."""
+    if response.status_code != 409:
+        return ""
+    try:
+        return response.json().get("error_summary", "")
+    except ValueError:
+        return ""
+
+
+def get_commit_info(savefile, replace=False):
+    return {
+        "path": savefile,
+        "mode": "overwrite" if replace else "add",
+        "autorename": True,
+        "mute": False,
+    }
+
+
+class UploadBatch:
+    """Загрузка маленьких файлов пачкой.
+
+    Каждый файл загружается в свою сессию, а коммитятся они вместе
+    через finish_batch_v2: коммиты по одному файлу Dropbox выполняет
+    по очереди под блокировкой пространства имён"""
+
+    def __init__(self, cloud):
+        self.cloud = cloud
+        self.lock = threading.Lock()
+        self.entries = []
+
+    def upload(self, loadfile, savefile, replace=False):
+        try:
+            with open(loadfile, "rb") as f:
+                data = f.read()
+            result = self.cloud.send_content(
+                "files/upload_session/start", {"close": True}, data
+            )
+        except requests.exceptions.RequestException as e:
+            self.cloud.errors += 1
+            print(f"Ошибка при загрузке файла '{loadfile}': {e}")
+            return
+
+        entry = {
+            "cursor": {"session_id": result["session_id"], "offset": len(data)},
+            "commit": get_commit_info(savefile, replace),
+        }
+        with self.lock:
+            self.entries.append(entry)
+            if len(self.entries) < FINISH_BATCH_LIMIT:
+                return
+            entries, self.entries = self.entries, []
+        self.cloud.finish_batch(entries)
+
+    def commit(self):
+        with self.lock:
+            entries, self.entries = self.entries, []
+        if entries:
+            self.cloud.finish_batch(entries)
+
+
+class PathBatch:
+    """Папки, которые создаются или удаляются одним пакетным заданием
+    в конце этапа плана, а не запросом на каждый путь"""
+
+    def __init__(self, run, limit):
+        self.run = run
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.paths = []
+
+    def add(self, path):
+        with self.lock:
+            self.paths.append(path)
+
+    def commit(self):
+        with self.lock:
+            paths, self.paths = self.paths, []
+        for start in range(0, len(paths), self.limit):
+            self.run(paths[start : start + self.limit])
 
 
 class DropBox(CloudInterface):
-    def __init__(self, dir_name, full_path):
+    HASH_ALGORITHM = "content_hash"
+
+    def __init__(self, dir_name, full_path, client=None, planning=False):
         self.dir_name = dir_name
         self.full_path = full_path
         from src.clouds_manager import ROOT_FOLDER
 
         self.ROOT_FOLDER = ROOT_FOLDER
-        self.headers = DropboxHeadersManager()
+        self.remote_files = {}
+        self.tree = None
+        # содержимое папок дерева, строится один раз на листинг
+        self.tree_children = None
+        self.tree_path = None
+        self.tree_cursor = None
+        self.tree_changes = None
+        self.transfers = get_transfer_executor(self.__class__.__name__)
+        self.transport = get_transport(self.__class__.__name__)
+        self.upload_batch = UploadBatch(self)
+        self.create_folders = PathBatch(
+            self.create_folder_batch, CREATE_FOLDER_BATCH_LIMIT
+        )
+        self.delete_paths = PathBatch(self.delete_batch, DELETE_BATCH_LIMIT)
+        self.planning = planning
+        # менеджер токена общий для всех папок облака
+        self.headers = client if client is not None else DropboxHeadersManager()
+
+    @property
+    def client(self):
+        return self.headers
 
     def handle_response(self, response, retry_on_401=True):
         """Обработка ошибок HTTP-запросов с выводом стека вызовов при ошибках."""
@@ -38,10 +228,11 @@ class DropBox(CloudInterface):
             if response.status_code == 401 and retry_on_401:
                 # Обновляем токен и повторяем запрос
                 print("Ошибка 401: токен истёк. Обновление токена...")
-                self.headers.token_manager.refresh_token()
+                expired_token = response.request.headers.get("Authorization", "")
+                self.headers.refresh_token(expired_token.removeprefix("Bearer "))
 
                 new_headers = self.headers.headers
-                retry_response = requests.request(
+                retry_response = self.transport.request(
                     method=response.request.method,
                     url=response.request.url,
                     headers=new_headers,
@@ -60,15 +251,24 @@ class DropBox(CloudInterface):
         try:
             url = f"{DROPBOX_API_URL}/files/create_folder_v2"
             data = json.dumps({"path": path, "autorename": False})
-            response = requests.post(url, headers=self.headers.headers, data=data)
+            response = self.transport.post(url, headers=self.headers.headers, data=data)
             result = self.handle_response(response)
             if result:
                 print(f"Папка '{path}' успешно создана.")
         except requests.exceptions.RequestException as e:
+            self.errors += 1
             print(f"Ошибка при создании папки: {e}")
 
     def upload_file(self, loadfile, savefile, replace=False):
         try:
+            if file_size(loadfile) > UPLOAD_SESSION_CHUNK_SIZE:
+                result = self.upload_file_in_session(loadfile, savefile, replace)
+                if result:
+                    print(
+                        f"Файл '{os.path.basename(loadfile)}' успешно загружен как '{savefile}'."
+                    )
+                return
+
             url = f"{DROPBOX_CONTENT_URL}/files/upload"
             headers = self.headers.headers
             headers["Dropbox-API-Arg"] = json.dumps(
@@ -82,34 +282,378 @@ class DropBox(CloudInterface):
             headers["Content-Type"] = "application/octet-stream"
 
             with open(loadfile, "rb") as f:
-                response = requests.post(url, headers=headers, data=f)
+                response = self.transport.post(url, headers=headers, data=f)
                 result = self.handle_response(response)
                 if result:
                     print(
                         f"Файл '{os.path.basename(loadfile)}' успешно загружен как '{savefile}'."
                     )
         except requests.exceptions.RequestException as e:
+            self.errors += 1
             print(f"Ошибка при загрузке файла '{loadfile}': {e}")
 
+    def upload_file_in_session(self, loadfile, savefile, replace=False):
+        """Загружает большой файл сессией: части отправляются параллельно
+        через append_v2, затем finish собирает из них файл.
+
+        Сессия и отправленные части хранятся в sync_state, после сбоя
+        загрузка продолжается с неотправленных частей"""
+        size = file_size(loadfile)
+        key = get_upload_session_key(loadfile)
+        saved = self.sync_state.get_meta(key) if self.sync_state else None
+        if saved:
+            saved = json.loads(saved)
+            session_id, done = saved["session_id"], set(saved["done"])
+        else:
+            session_id, done = self.start_upload_session(), set()
+
+        try:
+            self.append_chunks(loadfile, size, session_id, done, key)
+        except Exception:
+            if not saved:
+                raise
+            # сессии Dropbox живут неделю, устаревшую начинаем заново
+            print(f"Сессия загрузки '{loadfile}' устарела, загрузка начата заново")
+            self.sync_state.delete_meta(key)
+            return self.upload_file_in_session(loadfile, savefile, replace)
+
+        result = self.send_content(
+            "files/upload_session/finish",
+            {
+                "cursor": {"session_id": session_id, "offset": size},
+                "commit": get_commit_info(savefile, replace),
+            },
+        )
+        if self.sync_state:
+            self.sync_state.delete_meta(key)
+        return result
+
+    def start_upload_session(self):
+        result = self.send_content(
+            "files/upload_session/start", {"session_type": "concurrent"}
+        )
+        return result["session_id"]
+
+    def append_chunks(self, loadfile, size, session_id, done, key):
+        offsets = range(0, size, UPLOAD_SESSION_CHUNK_SIZE)
+        last_offset = offsets[-1]
+        lock = threading.Lock()
+
+        def append(offset):
+            with open(loadfile, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(UPLOAD_SESSION_CHUNK_SIZE)
+            arg = {
+                "cursor": {"session_id": session_id, "offset": offset},
+                # последняя часть закрывает сессию
+                "close": offset == last_offset,
+            }
+            self.send_content("files/upload_session/append_v2", arg, chunk)
+            with lock:
+                done.add(offset)
+                if self.sync_state:
+                    value = {"session_id": session_id, "done": sorted(done)}
+                    self.sync_state.set_meta(key, json.dumps(value))
+
+        transfers = get_transfer_executor(UPLOAD_SESSION_POOL)
+        with transfers.batch() as batch:
+            for offset in offsets:
+                if offset not in done:
+                    chunk_size = min(UPLOAD_SESSION_CHUNK_SIZE, size - offset)
+                    batch.submit(append, offset, size=chunk_size)
+
+    def finish_batch(self, entries):
+        """Коммитит загруженные сессии, ошибки отдельных файлов
+        выводятся и пропускаются"""
+        try:
+            url = f"{DROPBOX_API_URL}/files/upload_session/finish_batch_v2"
+            data = json.dumps({"entries": entries})
+            response = self.transport.post(url, headers=self.headers.headers, data=data)
+            result = self.handle_response(response)
+        except requests.exceptions.RequestException as e:
+            self.errors += len(entries)
+            print(f"Ошибка при сохранении {len(entries)} загруженных файлов: {e}")
+            return
+
+        for entry, status in zip(entries, result["entries"]):
+            path = entry["commit"]["path"]
+            if status[".tag"] == "success":
+                print(f"Файл '{path}' успешно загружен.")
+            else:
+                self.errors += 1
+                print(f"Ошибка при загрузке файла '{path}': {status.get('failure')}")
+
+    def upload_operation(self, kind, path, loadfile, savefile, replace=False, **kw):
+        """Операция загрузки файла: большие файлы идут сессией по частям,
+        маленькие коммитятся пачкой после всех загрузок этапа"""
+        size = file_size(loadfile)
+        kwargs = {"replace": True} if replace else {}
+        if size > UPLOAD_SESSION_CHUNK_SIZE:
+            return Operation(
+                kind, path, self.upload_file, (loadfile, savefile), kwargs, size, **kw
+            )
+        return Operation(
+            kind,
+            path,
+            self.upload_batch.upload,
+            (loadfile, savefile),
+            kwargs,
+            size,
+            flush=self.upload_batch.commit,
+            **kw,
+        )
+
+    def send_content(self, endpoint, arg, data=b""):
+        """Запрос к content-эндпоинту, при обрыве связи повторяется"""
+        url = f"{DROPBOX_CONTENT_URL}/{endpoint}"
+        for attempt in range(UPLOAD_CHUNK_RETRIES + 1):
+            headers = dict(self.headers.headers)
+            headers["Dropbox-API-Arg"] = json.dumps(arg)
+            headers["Content-Type"] = "application/octet-stream"
+            try:
+                response = self.transport.post(url, headers=headers, data=data)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                if attempt == UPLOAD_CHUNK_RETRIES:
+                    raise
+                time.sleep(2**attempt)
+                continue
+            return self.handle_response(response)
+
     def delete(self, path):
         try:
             url = f"{DROPBOX_API_URL}/files/delete_v2"
             data = json.dumps({"path": path})
-            response = requests.post(url, headers=self.headers.headers, data=data)
+            response = self.transport.post(url, headers=self.headers.headers, data=data)
             result = self.handle_response(response)
             if result:
                 print(f"Ресурс '{path}' успешно удален.")
         except requests.exceptions.RequestException as e:
+            self.errors += 1
             print(f"Ошибка при удалении ресурса '{path}': {e}")
 
+    def create_folder_batch(self, paths):
+        try:
+            entries = self.run_batch_job(
+                "create_folder_batch", {"paths": paths, "autorename": False}
+            )
+        except requests.exceptions.RequestException as e:
+            self.errors += 1
+            print(f"Ошибка при создании {len(paths)} папок: {e}")
+            return
+
+        for path, entry in zip(paths, entries):
+            if entry[".tag"] == "success":
+                print(f"Папка '{path}' успешно создана.")
+            # папку уже создали вместе с вложенной
+            elif not is_path_error(entry, "conflict"):
+                self.errors += 1
+                print(f"Ошибка при создании папки '{path}': {entry.get('failure')}")
+
+    def delete_batch(self, paths):
+        try:
+            entries = self.run_batch_job(
+                "delete_batch", {"entries": [{"path": path} for path in paths]}
+            )
+        except requests.exceptions.RequestException as e:
+            self.errors += 1
+            print(f"Ошибка при удалении {len(paths)} ресурсов: {e}")
+            return
+
+        for path, entry in zip(paths, entries):
+            if entry[".tag"] == "success":
+                print(f"Ресурс '{path}' успешно удален.")
+            # ресурс уже удалён вместе с папкой
+            elif not is_path_error(entry, "not_found"):
+                self.errors += 1
+                print(f"Ошибка при удалении ресурса '{path}': {entry.get('failure')}")
+
+    def run_batch_job(self, endpoint, arg):
+        """Пакетный запрос, асинхронное задание опрашивается до завершения.
+
+        Returns:
+            Результаты для каждого пути в порядке запроса
+
+        """
+        url = f"{DROPBOX_API_URL}/files/{endpoint}"
+        response = self.transport.post(
+            url, headers=self.headers.headers, data=json.dumps(arg)
+        )
+        result = self.handle_response(response)
+        job_id = result.get("async_job_id")
+        delay = JOB_POLL_DELAY
+        while result[".tag"] in ("async_job_id", "in_progress"):
+            time.sleep(delay)
+            delay = min(delay * 2, JOB_POLL_MAX_DELAY)
+            response = self.transport.post(
+                f"{url}/check",
+                headers=self.headers.headers,
+                data=json.dumps({"async_job_id": job_id}),
+            )
+            result = self.handle_response(response)
+
+        if result[".tag"] == "failed":
+            raise Exception(f"Ошибка задания {endpoint}: {result.get('failed')}")
+        return result["entries"]
+
+    def move(self, from_path, path):
+        try:
+            url = f"{DROPBOX_API_URL}/files/move_v2"
+            data = json.dumps({"from_path": from_path, "to_path": path})
+            response = self.transport.post(url, headers=self.headers.headers, data=data)
+            result = self.handle_response(response)
+            if result:
+                print(f"Ресурс '{from_path}' перемещён в '{path}'.")
+        except requests.exceptions.RequestException as e:
+            self.errors += 1
+            print(f"Ошибка при перемещении ресурса '{from_path}': {e}")
+
     def list_folder(self, path):
         url = f"{DROPBOX_API_URL}/files/list_folder"
-        response = requests.post(
+        response = self.transport.post(
             url, headers=self.headers.headers, data=json.dumps({"path": path})
         )
         items = self.handle_response(response)
+        # большие папки приходят частями
+        result = items
+        while result and result.get("has_more"):
+            result = self.list_folder_continue(result["cursor"])
+            items["entries"] += result["entries"]
         return items
 
+    def list_folder_continue(self, cursor):
+        """Следующая часть листинга, None если курсор устарел и нужен новый листинг"""
+        url = f"{DROPBOX_API_URL}/files/list_folder/continue"
+        response = self.transport.post(
+            url, headers=self.headers.headers, data=json.dumps({"cursor": cursor})
+        )
+        if get_error_summary(response).startswith("reset"):
+            return None
+        return self.handle_response(response)
+
+    def load_tree(self, path):
+        """Рекурсивный листинг папки path: path_lower -> запись list_folder.
+
+        Курсор и листинг сохраняются в sync_state, в следующий раз
+        с облака приходят только изменения после прошлого листинга"""
+        if self.tree is not None and self.tree_path == path.lower():
+            return self.tree
+
+        key = f"list_folder:{path.lower()}"
+        saved = self.sync_state.get_meta(key) if self.sync_state else None
+        result = None
+        if saved:
+            saved = json.loads(saved)
+            tree = saved["entries"]
+            result = self.list_folder_continue(saved["cursor"])
+            changes = []
+        if result is None:
+            tree = {}
+            changes = None
+            url = f"{DROPBOX_API_URL}/files/list_folder"
+            data = json.dumps(
+                {"path": path, "recursive": True, "limit": LIST_FOLDER_LIMIT}
+            )
+            response = self.transport.post(url, headers=self.headers.headers, data=data)
+            if self.planning and get_error_summary(response).startswith(
+                "path/not_found"
+            ):
+                # папки ещё нет на облаке (только при планировании)
+                result = {"entries": [], "cursor": None, "has_more": False}
+            else:
+                result = self.handle_response(response)
+
+        while True:
+            apply_list_folder_entries(tree, result["entries"])
+            if changes is not None:
+                changes += result["entries"]
+            if not result["has_more"]:
+                break
+            result = self.list_folder_continue(result["cursor"])
+            if result is None:
+                raise Exception(
+                    f"Листинг {path} на облаке сброшен, повторите синхронизацию"
+                )
+
+        if self.sync_state and not self.planning:
+            self.sync_state.set_meta(
+                key, json.dumps({"cursor": result["cursor"], "entries": tree})
+            )
+        self.tree = tree
+        self.tree_children = get_children(tree)
+        self.tree_path = path.lower()
+        self.tree_cursor = result["cursor"]
+        self.tree_changes = changes
+        return tree
+
+    def list_changes(self, path):
+        """Изменения дерева path после прошлого листинга.
+
+        Returns:
+            Записи list_folder, None если листинг был загружен заново
+
+        """
+        self.tree = None
+        self.load_tree(path)
+        return self.tree_changes
+
+    def wait_for_changes(self, path, timeout=LONGPOLL_TIMEOUT):
+        """Ждёт изменений в дереве path без опроса: сервер держит запрос
+        до timeout секунд и отвечает сразу, как только что-то изменится"""
+        self.load_tree(path)
+        response = self.transport.post(
+            LONGPOLL_URL,
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"cursor": self.tree_cursor, "timeout": timeout}),
+            # к ожиданию сервер добавляет случайную задержку
+            timeout=(DEFAULT_TIMEOUT[0], timeout + LONGPOLL_JITTER),
+        )
+        result = self.handle_response(response)
+        # сервер просит подождать перед следующим запросом
+        time.sleep(result.get("backoff", 0))
+        return result["changes"]
+
+    def apply_changes_on_pc(self, entries):
+        """Переносит на пк изменения облака из листинга,
+        файлы с тем же содержимым не скачиваются"""
+        from src.clouds_manager import get_and_update_sync_folders
+        from src.clouds_manager import get_os_path_by_cloud_path
+
+        sync_folders = {os.path.basename(f) for f in get_and_update_sync_folders()}
+        for entry in entries:
+            cloud_path = entry.get("path_display", entry["path_lower"])
+            parts = cloud_path.strip("/").split("/")
+            # изменения вне отслеживаемых папок не переносим
+            if len(parts) < 2 or parts[1] not in sync_folders:
+                continue
+            os_path = get_os_path_by_cloud_path(os.path.sep.join(parts))
+            try:
+                self.apply_change_on_pc(entry, cloud_path, os_path)
+            except Exception as e:
+                # например файл удалили на облаке сразу после уведомления,
+                # ошибка одной записи не останавливает остальные
+                self.errors += 1
+                print(f"Изменение '{cloud_path}' не перенесено на пк: {e}")
+
+    def apply_change_on_pc(self, entry, cloud_path, os_path):
+        if entry[".tag"] == "deleted":
+            if os.path.isdir(os_path):
+                shutil.rmtree(os_path)
+            elif os.path.exists(os_path):
+                os.remove(os_path)
+            else:
+                return
+            print(f"'{os.path.basename(os_path)}' удалён с пк")
+        elif entry[".tag"] == "folder":
+            os.makedirs(os_path, exist_ok=True)
+        elif not os.path.isfile(os_path) or hash_cache.get(
+            os_path, self.HASH_ALGORITHM
+        ) != entry.get("content_hash"):
+            os.makedirs(os.path.dirname(os_path), exist_ok=True)
+            self.download_file(os.path.dirname(os_path), cloud_path)
+
     def check_root_folder(self):
         items = self.list_folder("")
         return self.ROOT_FOLDER in [item["name"] for item in items.get("entries", [])]
@@ -125,43 +669,48 @@ class DropBox(CloudInterface):
         #     print(f'start dir {self.dir_name} is exist')
 
     def get_cloud_tree(self, folder_name, tree_list, root):
-        root += folder_name + os.path.sep
-        if folder_name == "":
-            root = ""
-        items = self.list_folder(
-            f'/{self.ROOT_FOLDER}/{root.replace(os.path.sep, "/")}'
-        )
-        if not items:
-            return
-
-        for item in items["entries"]:
-            if item[".tag"] != "folder":
-                continue
-            tree_list.append(root + item["name"])
-            folder_name = item["name"]
-            self.get_cloud_tree(folder_name, tree_list, root)
-
-    def upload_dir_on_cloud(self, upload_folders):
-        upload_folders = sorted(
-            upload_folders, key=lambda input_str: input_str.count(os.path.sep)
-        )
+        root += folder_name
+        path = f'/{self.ROOT_FOLDER}/{root.replace(os.path.sep, "/")}'.rstrip("/")
+        # всё дерево приходит одним рекурсивным листингом
+        root_prefix = f"/{self.ROOT_FOLDER}/".lower()
+        folders = [
+            item["path_display"][len(root_prefix) :]
+            for path_lower, item in self.load_tree(path).items()
+            if item[".tag"] == "folder" and path_lower != path.lower()
+        ]
+        tree_list += [folder.replace("/", os.path.sep) for folder in sorted(folders)]
 
+    def plan_upload_dir_on_cloud(self, upload_folders):
+        operations = []
         for folder_dir in upload_folders:
             path = f"{os.path.sep.join(self.full_path.split(os.path.sep)[:-1])}{os.path.sep}{folder_dir}"
             files = [
                 f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))
             ]
 
-            self.create_folder(
-                f'/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}'
+            operations.append(
+                Operation(
+                    MKDIR,
+                    folder_dir,
+                    self.create_folders.add,
+                    (f'/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}',),
+                    flush=self.create_folders.commit,
+                )
             )
 
             for file_name in files:
                 path_to_file_os = f"{folder_dir}\\{file_name}"
-                self.upload_file(
-                    path_to_file_os,
-                    f'/{self.ROOT_FOLDER}/{path_to_file_os.replace(os.path.sep, "/")}',
+                os_path = os.path.join(path, file_name)
+                operations.append(
+                    self.upload_operation(
+                        UPLOAD,
+                        os.path.join(folder_dir, file_name),
+                        os_path,
+                        f'/{self.ROOT_FOLDER}/{path_to_file_os.replace(os.path.sep, "/")}',
+                        os_path=os_path,
+                    )
                 )
+        return operations
 
     def get_os_and_clouds_files(self, folder_dir, full_path):
         os_files = [
@@ -171,14 +720,23 @@ class DropBox(CloudInterface):
         ]
 
         # Получаем файлы из Dropbox
-        items = self.list_folder(
-            f'/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}'
-        )
-        if not items:
-            return os_files, []
+        path = f'/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}'
+        if self.tree is not None and (
+            path.lower() == self.tree_path
+            or path.lower().startswith(self.tree_path + "/")
+        ):
+            # папка уже есть в рекурсивном листинге, запрос не нужен
+            if self.tree_children is None:
+                self.tree_children = get_children(self.tree)
+            entries = self.tree_children.get(path.lower(), [])
+        else:
+            items = self.list_folder(path)
+            if not items:
+                return os_files, []
+            entries = items["entries"]
 
         # Файлы в облаке
-        cloud_files = [f for f in items["entries"] if f[".tag"] == "file"]
+        cloud_files = [f for f in entries if f[".tag"] == "file"]
 
         return os_files, cloud_files
 
@@ -194,14 +752,14 @@ class DropBox(CloudInterface):
             cloud_file["server_modified"]
         )
 
-        with open(os_path_file, "rb") as f:
-            os_file_md5 = hashlib.md5(f.read()).hexdigest()
+        os_file_md5 = hash_cache.get(os_path_file, self.HASH_ALGORITHM)
 
-        cloud_file_md5 = cloud_file["content_hash"]
+        cloud_file_md5 = cloud_file.get("content_hash")
 
         return os_modified_time, cloud_modified_time, os_file_md5, cloud_file_md5
 
-    def update_dir_on_cloud(self, exact_folders):
+    def plan_update_dir_on_cloud(self, exact_folders):
+        operations = []
         for folder_dir in exact_folders:
             full_path = (
                 os.path.sep.join(self.full_path.split(os.path.sep)[:-1])
@@ -218,27 +776,61 @@ class DropBox(CloudInterface):
 
             for cloud_file in refresh_files:
                 os_path_file = os.path.join(full_path, cloud_file["name"])
-                os_modified_time, cloud_modified_time, os_file_md5, cloud_file_md5 = (
-                    self.get_data_for_comparison(os_path_file, cloud_file)
-                )
-
-                # по хэшу тут не сравнить, потомучто у них свои алгоритмы как его считать
-                # if (os_modified_time > cloud_modified_time) or (cloud_file_md5 != os_file_md5):
-                if os_modified_time > cloud_modified_time:
-                    self.upload_file(
-                        os_path_file, cloud_file["path_display"], replace=True
+                (
+                    os_modified_time,
+                    cloud_modified_time,
+                    os_file_md5,
+                    cloud_file_md5,
+                ) = self.get_data_for_comparison(os_path_file, cloud_file)
+
+                # файл с тем же содержимым не загружаем, даже если он новее
+                if is_changed(
+                    os_file_md5, cloud_file_md5, os_modified_time > cloud_modified_time
+                ):
+                    operations.append(
+                        self.upload_operation(
+                            REPLACE,
+                            os.path.join(folder_dir, cloud_file["name"]),
+                            os_path_file,
+                            cloud_file["path_display"],
+                            replace=True,
+                        )
+                    )
+                else:
+                    self.remote_files[os.path.join(folder_dir, cloud_file["name"])] = (
+                        cloud_file.get("id"),
+                        cloud_file.get("rev"),
                     )
 
             for remove_file in remove_files:
-                self.delete(remove_file["path_display"])
+                operations.append(
+                    Operation(
+                        DELETE,
+                        os.path.join(folder_dir, remove_file["name"]),
+                        self.delete_paths.add,
+                        (remove_file["path_display"],),
+                        flush=self.delete_paths.commit,
+                        size=remove_file.get("size", 0),
+                        digest=remove_file.get("content_hash"),
+                        remote=remove_file["path_display"],
+                    )
+                )
 
             for file_name in upload_files:
-                self.upload_file(
-                    os.path.join(full_path, file_name),
-                    f'/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}/{file_name}',
+                os_path = os.path.join(full_path, file_name)
+                operations.append(
+                    self.upload_operation(
+                        UPLOAD,
+                        os.path.join(folder_dir, file_name),
+                        os_path,
+                        f'/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}/{file_name}',
+                        os_path=os_path,
+                    )
                 )
+        return operations
 
-    def update_dir_on_pc(self, exact_folders):
+    def plan_update_dir_on_pc(self, exact_folders):
+        operations = []
         for folder_dir in exact_folders:
             from src.clouds_manager import get_os_path_by_cloud_path
 
@@ -253,31 +845,80 @@ class DropBox(CloudInterface):
 
             for cloud_file in refresh_files:
                 os_path_file = os.path.join(full_path, cloud_file["name"])
-                os_modified_time, cloud_modified_time, os_file_md5, cloud_file_md5 = (
-                    self.get_data_for_comparison(os_path_file, cloud_file)
-                )
-
-                if os_modified_time < cloud_modified_time:
-                    self.download(
-                        full_path, cloud_file["path_display"], is_folder=False
-                    )
-                    print(
-                        f'Файл {cloud_file["name"]} обновлён в папке {os.path.basename(full_path)}'
+                (
+                    os_modified_time,
+                    cloud_modified_time,
+                    os_file_md5,
+                    cloud_file_md5,
+                ) = self.get_data_for_comparison(os_path_file, cloud_file)
+
+                if is_changed(
+                    os_file_md5, cloud_file_md5, os_modified_time < cloud_modified_time
+                ):
+                    operations.append(
+                        Operation(
+                            DOWNLOAD,
+                            os.path.join(folder_dir, cloud_file["name"]),
+                            self.refresh_file_on_pc,
+                            (full_path, cloud_file),
+                            size=cloud_file.get("size", 0),
+                            on_pc=True,
+                        )
                     )
 
             for remove_file in remove_files:
-                os.remove(f"{full_path}{os.path.sep}{remove_file}")
+                operations.append(
+                    Operation(
+                        DELETE,
+                        os.path.join(folder_dir, remove_file),
+                        os.remove,
+                        (f"{full_path}{os.path.sep}{remove_file}",),
+                        on_pc=True,
+                    )
+                )
 
             for clouds_download_file in download_files:
-                self.download(
-                    full_path, clouds_download_file["path_display"], is_folder=False
+                operations.append(
+                    Operation(
+                        DOWNLOAD,
+                        os.path.join(folder_dir, clouds_download_file["name"]),
+                        self.download,
+                        (full_path, clouds_download_file["path_display"]),
+                        {"is_folder": False},
+                        size=clouds_download_file.get("size", 0),
+                        on_pc=True,
+                    )
                 )
+        return operations
+
+    def refresh_file_on_pc(self, full_path, cloud_file):
+        self.download(full_path, cloud_file["path_display"], is_folder=False)
+        print(
+            f'Файл {cloud_file["name"]} обновлён в папке {os.path.basename(full_path)}'
+        )
 
-    def remove_old_dir_on_cloud(self, remove_folders):
-        for remove_folder in remove_folders:
-            self.delete(
-                f'/{self.ROOT_FOLDER}/{remove_folder.replace(os.path.sep, "/")}'
+    def plan_remove_old_dir_on_cloud(self, remove_folders):
+        # удаление папки удаляет и вложенные в неё
+        return [
+            Operation(
+                DELETE,
+                remove_folder,
+                self.delete_paths.add,
+                (f'/{self.ROOT_FOLDER}/{remove_folder.replace(os.path.sep, "/")}',),
+                flush=self.delete_paths.commit,
             )
+            for remove_folder in remove_nested_folders(remove_folders)
+        ]
+
+    def plan_move(self, delete, upload):
+        return Operation(
+            MOVE,
+            upload.path,
+            self.move,
+            (delete.remote, upload.args[1]),
+            size=upload.size,
+            source=delete.path,
+        )
 
     def list_files(self, path):
         result = []
@@ -287,7 +928,7 @@ class DropBox(CloudInterface):
 
         url = f"{DROPBOX_API_URL}/files/list_folder"
         data = json.dumps({"path": path, "limit": 1000})
-        response = requests.post(url, headers=self.headers.headers, data=data)
+        response = self.transport.post(url, headers=self.headers.headers, data=data)
         folder_info = self.handle_response(response)
 
         if not folder_info:
@@ -313,12 +954,10 @@ class DropBox(CloudInterface):
 
         return result
 
-    def downloading_folders(self, download_folders):
-        download_folders = sorted(
-            download_folders, key=lambda input_str: input_str.count(os.path.sep)
-        )
-
-        for clouds_folder in download_folders:
+    def plan_downloading_folders(self, download_folders):
+        # папка скачивается вместе с вложенными, поэтому скачиваем только верхние
+        operations = []
+        for clouds_folder in remove_nested_folders(download_folders):
             from src.clouds_manager import get_os_path_by_cloud_path
 
             root_path = get_os_path_by_cloud_path(
@@ -328,15 +967,27 @@ class DropBox(CloudInterface):
             if os.path.exists(root_path):
                 continue
 
-            self.download(
-                os.path.sep.join(root_path.split(os.path.sep)[:-1]),
-                f"/{self.ROOT_FOLDER}/{clouds_folder.replace('\\', '/')}",
-                is_folder=True,
+            operations.append(
+                Operation(
+                    DOWNLOAD,
+                    clouds_folder,
+                    self.download,
+                    (
+                        os.path.sep.join(root_path.split(os.path.sep)[:-1]),
+                        f"/{self.ROOT_FOLDER}/{clouds_folder.replace('\\', '/')}",
+                    ),
+                    {"is_folder": True},
+                    on_pc=True,
+                )
             )
+        return operations
 
     def download(self, downloaded_path, save_path, is_folder=False):
         """Основной метод для загрузки файлов и папок из Dropbox."""
         if is_folder:
+            if self.download_zip(downloaded_path, save_path):
+                return
+
             items = self.list_folder(save_path)
 
             local_folder_path = os.path.join(
@@ -347,9 +998,54 @@ class DropBox(CloudInterface):
             for item in items["entries"]:
                 if item[".tag"] == "file":
                     self.download_file(local_folder_path, item["path_display"])
+                else:
+                    # вложенная папка может уложиться в лимиты архива
+                    self.download(
+                        local_folder_path, item["path_display"], is_folder=True
+                    )
         else:
             self.download_file(downloaded_path, save_path)
 
+    def download_zip(self, downloaded_path, save_path, retry_on_401=True):
+        """Скачивает папку одним архивом и распаковывает её в downloaded_path.
+
+        Архив пишется во временный файл рядом с папкой по мере получения,
+        оглавление zip лежит в конце, поэтому распаковка идёт после загрузки.
+
+        Returns:
+            False, если папку нужно скачать по файлам
+
+        """
+        url = f"{DROPBOX_CONTENT_URL}/files/download_zip"
+        token = self.headers.token
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Dropbox-API-Arg": json.dumps({"path": f"{save_path}"}),
+        }
+
+        response = self.transport.post(url, headers=headers, stream=True)
+        if response.status_code == 409 and any(
+            error in response.text for error in DOWNLOAD_ZIP_LIMIT_ERRORS
+        ):
+            print(f"Папка '{save_path}' больше лимитов архива, скачиваем по файлам")
+            return False
+        if response.status_code == 401 and retry_on_401:
+            # повтор через handle_response потерял бы Dropbox-API-Arg
+            print("Ошибка 401: токен истёк. Обновление токена...")
+            self.headers.refresh_token(token)
+            return self.download_zip(downloaded_path, save_path, retry_on_401=False)
+        if response.status_code != 200:
+            self.handle_response(response, retry_on_401=False)
+
+        with tempfile.TemporaryFile(dir=downloaded_path) as archive:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                archive.write(chunk)
+            archive.seek(0)
+            with zipfile.ZipFile(archive) as zip_file:
+                zip_file.extractall(downloaded_path)
+        print(f"Папка '{os.path.basename(save_path)}' успешно скачана.")
+        return True
+
     def download_file(self, downloaded_path, save_path):
         url = f"{DROPBOX_CONTENT_URL}/files/download"
         headers = {
@@ -357,7 +1053,7 @@ class DropBox(CloudInterface):
             "Dropbox-API-Arg": json.dumps({"path": f"{save_path}"}),
         }
 
-        response = requests.post(url, headers=headers, stream=True)
+        response = self.transport.post(url, headers=headers, stream=True)
         if response.status_code == 200:
             file_name = os.path.basename(save_path)
             file_path = os.path.join(downloaded_path, file_name)
@@ -109,5 +109,20 @@ class TestYandexTokenManager(unittest.TestCase):
         self.assertEqual(token, "fake_access_token")
 
 
+class TestYandexHeadersManager(unittest.TestCase):
+    @patch("src.Yandex.OAuth_yandex.YandexTokenManager")
+    def test_refresh_token_skipped_when_already_refreshed(self, mock_token_manager):
+        """Token refreshed by another thread is not refreshed again."""
+        token_manager = mock_token_manager.return_value
+        token_manager.get_access_token.return_value = "new_token"
+        manager = YandexHeadersManager()
+
+        manager.refresh_token("expired_token")
+        token_manager.refresh_token.assert_not_called()
+
+        manager.refresh_token("new_token")
+        token_manager.refresh_token.assert_called_once()
+
+
 if __name__ == "__main__":
     unittest.main()
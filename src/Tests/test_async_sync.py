@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from src.async_cloud_interface import AsyncCloudInterface, RemoteEntry
+from src.async_sync import (
+    sync_folder_to_cloud,
+    sync_folder_to_pc,
+    get_top_level,
+    group_by_depth,
+    sync_folders_async,
+    sync_locals_folders_async,
+)
+from src.Yandex.async_yandex_disk import AsyncYandexDisk, LIST_LIMIT
+from src.Dropbox.async_dropbox import AsyncDropBox
+
+
+class MemoryCloud(AsyncCloudInterface):
+    """Облако в памяти: путь -> None для папки или содержимое файла"""
+
+    def __init__(self):
+        super().__init__(MagicMock())
+        self.items = {"": None}
+        self.calls = []
+
+    async def list_folder(self, path):
+        if path not in self.items:
+            return []
+        prefix = f"{path}/" if path else ""
+        return [
+            RemoteEntry(item[len(prefix) :], content is None, len(content or b""))
+            for item, content in self.items.items()
+            if item.startswith(prefix) and item and "/" not in item[len(prefix) :]
+        ]
+
+    async def create_folder(self, path):
+        self.calls.append(("mkdir", path))
+        self.items.setdefault(path, None)
+
+    async def upload_file(self, os_path, path):
+        self.calls.append(("upload", path))
+        with open(os_path, "rb") as file:
+            self.items[path] = file.read()
+
+    async def download_file(self, path, os_path):
+        self.calls.append(("download", path))
+        with open(os_path, "wb") as file:
+            file.write(self.items[path])
+
+    async def delete(self, path):
+        self.calls.append(("delete", path))
+        for item in list(self.items):
+            if item == path or item.startswith(path + "/"):
+                del self.items[item]
+
+    def same_file(self, os_path, entry):
+        with open(os_path, "rb") as file:
+            return entry.size == len(file.read())
+
+
+class TestAsyncSync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.temp_dir, "SYNC")
+        os.makedirs(os.path.join(self.folder, "a", "b"))
+        self.write("a/b/file.txt", b"data")
+        self.write("root.txt", b"root")
+        self.cloud = MemoryCloud()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        with open(os.path.join(self.folder, *path.split("/")), "wb") as file:
+            file.write(content)
+
+    async def test_sync_folder_to_cloud_creates_parents_first(self):
+        with patch("builtins.print"):
+            await sync_folder_to_cloud(self.cloud, self.folder)
+
+        mkdirs = [path for call, path in self.cloud.calls if call == "mkdir"]
+        self.assertLess(mkdirs.index("SYNC/a"), mkdirs.index("SYNC/a/b"))
+        self.assertEqual(self.cloud.items["SYNC/a/b/file.txt"], b"data")
+        self.assertEqual(self.cloud.items["SYNC/root.txt"], b"root")
+        self.assertEqual(self.cloud.errors, 0)
+
+    async def test_sync_folder_to_cloud_uploads_only_changes(self):
+        with patch("builtins.print"):
+            await sync_folder_to_cloud(self.cloud, self.folder)
+            self.cloud.items["SYNC/old"] = None
+            self.cloud.items["SYNC/old/file.txt"] = b"old"
+            self.write("root.txt", b"changed")
+            self.cloud.calls.clear()
+
+            await sync_folder_to_cloud(self.cloud, self.folder)
+
+        changes = [call for call in self.cloud.calls if call[0] != "mkdir"]
+        self.assertCountEqual(
+            changes, [("delete", "SYNC/old"), ("upload", "SYNC/root.txt")]
+        )
+
+    async def test_sync_folder_to_pc(self):
+        self.cloud.items.update(
+            {
+                "SYNC": None,
+                "SYNC/c": None,
+                "SYNC/c/new.txt": b"new",
+                "SYNC/root.txt": b"root",
+            }
+        )
+        with patch("builtins.print"):
+            await sync_folder_to_pc(self.cloud, self.folder)
+
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "a")))
+        with open(os.path.join(self.folder, "c", "new.txt"), "rb") as file:
+            self.assertEqual(file.read(), b"new")
+        self.assertEqual(self.cloud.calls, [("download", "SYNC/c/new.txt")])
+
+    async def test_sync_folder_to_pc_missing_on_cloud(self):
+        with patch("builtins.print"):
+            await sync_folder_to_pc(self.cloud, self.folder)
+
+        self.assertTrue(os.path.exists(os.path.join(self.folder, "root.txt")))
+        self.assertEqual(self.cloud.calls, [])
+
+    def test_get_top_level(self):
+        self.assertEqual(get_top_level(["a/b", "a", "c/d", "a/b/e"]), ["a", "c/d"])
+
+    def test_group_by_depth(self):
+        self.assertEqual(
+            group_by_depth(["a/b/c", "a", "d/e"]), [["a"], ["d/e"], ["a/b/c"]]
+        )
+
+    @patch("builtins.print")
+    @patch("src.async_sync.hash_cache")
+    @patch("src.async_sync.get_and_update_sync_folders", return_value=[])
+    @patch("src.async_sync.sync_clouds_async", new_callable=AsyncMock)
+    def test_unsupported_clouds_fail(self, mock_sync_clouds_async, _, __, ___):
+        mock_sync_clouds_async.return_value = {"yandex": True}
+
+        self.assertEqual(sync_folders_async(["google", "yandex"]), ["google"])
+        self.assertEqual(mock_sync_clouds_async.call_args.args[0], ["yandex"])
+
+        self.assertEqual(sync_locals_folders_async("google"), ["google"])
+        mock_sync_clouds_async.assert_called_once()
+
+
+class TestAsyncProviders(unittest.IsolatedAsyncioTestCase):
+    async def test_yandex_list_folder_pages(self):
+        item = {
+            "name": "f",
+            "type": "file",
+            "size": 1,
+            "md5": "x",
+            "modified": "2024-01-01T00:00:00+00:00",
+        }
+        cloud = AsyncYandexDisk(MagicMock())
+        cloud.call = AsyncMock(
+            side_effect=[
+                (200, {"_embedded": {"items": [item] * LIST_LIMIT}}),
+                (200, {"_embedded": {"items": [item]}}),
+            ]
+        )
+
+        entries = await cloud.list_folder("SYNC")
+
+        self.assertEqual(len(entries), LIST_LIMIT + 1)
+        self.assertEqual(cloud.call.call_args.kwargs["offset"], LIST_LIMIT)
+
+    async def test_yandex_delete_to_trash(self):
+        cloud = AsyncYandexDisk(MagicMock())
+        cloud.call = AsyncMock(return_value=(204, {}))
+
+        await cloud.delete("SYNC/f")
+
+        # как и в потоковом движке, файл уходит в корзину
+        self.assertNotIn("permanently", cloud.call.call_args.kwargs)
+
+    async def test_yandex_list_missing_folder(self):
+        cloud = AsyncYandexDisk(MagicMock())
+        cloud.call = AsyncMock(return_value=(404, {}))
+
+        self.assertEqual(await cloud.list_folder("SYNC"), [])
+
+    async def test_dropbox_list_folder_continue(self):
+        folder = {".tag": "folder", "name": "a"}
+        file = {
+            ".tag": "file",
+            "name": "f",
+            "size": 2,
+            "server_modified": "2024-01-01T00:00:00Z",
+        }
+        cloud = AsyncDropBox(MagicMock())
+        cloud.call = AsyncMock(
+            side_effect=[
+                {"entries": [folder], "has_more": True, "cursor": "c"},
+                {"entries": [file], "has_more": False, "cursor": "c"},
+            ]
+        )
+
+        entries = await cloud.list_folder("SYNC")
+
+        self.assertEqual(
+            [(e.name, e.is_dir) for e in entries], [("a", True), ("f", False)]
+        )
+        cloud.call.assert_called_with("files/list_folder/continue", {"cursor": "c"})
+
+
+if __name__ == "__main__":
+    unittest.main()
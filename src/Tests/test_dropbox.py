@@ -1,6 +1,10 @@
 import unittest
 import datetime
+import io
 import json
+import tempfile
+import threading
+import zipfile
 
 from src.Dropbox.dropbox import DropBox, DROPBOX_CONTENT_URL, DROPBOX_API_URL
 from unittest.mock import patch, MagicMock, mock_open
@@ -8,7 +12,7 @@ from unittest.mock import patch, MagicMock, mock_open
 import sys
 import os
 
-from src.clouds_manager import FileData
+from src.clouds_manager import FileData, sync_watched_folder
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
@@ -30,7 +34,7 @@ class TestDropboxMethods(unittest.TestCase):
 
         self.dropbox = DropBox("test_dir", "/fake/path")
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropboxHeadersManager")
     def test_handle_response_success(self, mock_headers_manager, mock_post):
         """Test handle_response for a successful response."""
@@ -41,8 +45,8 @@ class TestDropboxMethods(unittest.TestCase):
         result = self.dropbox.handle_response(mock_response)
         self.assertEqual(result, {"success": True})
 
-    @patch("src.Dropbox.dropbox.requests.request")
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.request")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropboxHeadersManager")
     def test_handle_response_401_refresh(
         self, mock_headers_manager, mock_post, requests_mock
@@ -68,7 +72,7 @@ class TestDropboxMethods(unittest.TestCase):
         self.assertEqual(result, {"success": True})
         requests_mock.assert_called_once()
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_handle_response_failure(self, mock_post):
         """Test handle_response raises exception on failure."""
         mock_response = MagicMock()
@@ -81,7 +85,7 @@ class TestDropboxMethods(unittest.TestCase):
         self.assertIn("Ошибка 500", str(context.exception))
 
     @patch("builtins.open", new_callable=unittest.mock.mock_open)
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropboxHeadersManager")
     def test_upload_file_success(self, mock_headers_manager, mock_post, mock_file):
         """Test upload_file for a successful file upload."""
@@ -107,7 +111,7 @@ class TestDropboxMethods(unittest.TestCase):
         self.assertTrue(mock_file.called)
 
     @patch("builtins.open", new_callable=unittest.mock.mock_open)
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropboxHeadersManager")
     def test_upload_file_failure(self, mock_headers_manager, mock_post, mock_file):
         """Test upload_file failure scenario."""
@@ -119,7 +123,114 @@ class TestDropboxMethods(unittest.TestCase):
         with self.assertRaises(Exception):
             self.dropbox.upload_file("testfile.txt", "/path_in_dropbox/testfile.txt")
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    def make_big_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b"0123456789")
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    @staticmethod
+    def session_response(url, headers, data):
+        response = MagicMock(status_code=200)
+        response.json.return_value = (
+            {"session_id": "session"} if url.endswith("/start") else {"name": "big"}
+        )
+        return response
+
+    @patch("src.Dropbox.dropbox.UPLOAD_SESSION_CHUNK_SIZE", 4)
+    @patch("src.transport.Transport.post")
+    def test_upload_file_in_session(self, mock_post):
+        loadfile = self.make_big_file()
+        mock_post.side_effect = self.session_response
+        self.dropbox.sync_state = MagicMock()
+        self.dropbox.sync_state.get_meta.return_value = None
+
+        self.dropbox.upload_file(loadfile, "/dir/big", replace=True)
+
+        calls = {}
+        for call in mock_post.call_args_list:
+            arg = json.loads(call.kwargs["headers"]["Dropbox-API-Arg"])
+            calls.setdefault(call.args[0].rsplit("/", 1)[1], []).append(
+                (arg, call.kwargs["data"])
+            )
+        self.assertEqual(calls["start"], [({"session_type": "concurrent"}, b"")])
+        appends = sorted(calls["append_v2"], key=lambda c: c[0]["cursor"]["offset"])
+        self.assertEqual([data for _, data in appends], [b"0123", b"4567", b"89"])
+        self.assertEqual([arg["close"] for arg, _ in appends], [False, False, True])
+        finish = calls["finish"][0][0]
+        self.assertEqual(finish["cursor"], {"session_id": "session", "offset": 10})
+        self.assertEqual(finish["commit"]["mode"], "overwrite")
+        self.assertEqual(self.dropbox.sync_state.set_meta.call_count, 3)
+        self.dropbox.sync_state.delete_meta.assert_called_once()
+
+    @patch("src.Dropbox.dropbox.UPLOAD_SESSION_CHUNK_SIZE", 4)
+    @patch("src.transport.Transport.post")
+    def test_upload_file_in_session_resumes(self, mock_post):
+        loadfile = self.make_big_file()
+        mock_post.side_effect = self.session_response
+        self.dropbox.sync_state = MagicMock()
+        self.dropbox.sync_state.get_meta.return_value = json.dumps(
+            {"session_id": "saved", "done": [0, 4]}
+        )
+
+        self.dropbox.upload_file_in_session(loadfile, "/dir/big")
+
+        urls = [call.args[0] for call in mock_post.call_args_list]
+        self.assertEqual(
+            urls,
+            [
+                f"{DROPBOX_CONTENT_URL}/files/upload_session/append_v2",
+                f"{DROPBOX_CONTENT_URL}/files/upload_session/finish",
+            ],
+        )
+        self.assertEqual(mock_post.call_args_list[0].kwargs["data"], b"89")
+
+    @patch("src.transport.Transport.post")
+    def test_upload_batch(self, mock_post):
+        loadfile = self.make_big_file()
+
+        def post(url, headers, data):
+            response = MagicMock(status_code=200)
+            if url.endswith("/start"):
+                response.json.return_value = {"session_id": f"s{mock_post.call_count}"}
+            else:
+                response.json.return_value = {
+                    "entries": [
+                        {".tag": "success"},
+                        {
+                            ".tag": "failure",
+                            "failure": {".tag": "too_many_write_operations"},
+                        },
+                    ]
+                }
+            return response
+
+        mock_post.side_effect = post
+
+        self.dropbox.upload_batch.upload(loadfile, "/dir/a")
+        self.dropbox.upload_batch.upload(loadfile, "/dir/b", replace=True)
+        self.dropbox.upload_batch.commit()
+        self.dropbox.upload_batch.commit()
+
+        self.assertEqual(mock_post.call_count, 3)
+        start = mock_post.call_args_list[0]
+        self.assertEqual(start.kwargs["data"], b"0123456789")
+        self.assertEqual(
+            json.loads(start.kwargs["headers"]["Dropbox-API-Arg"]), {"close": True}
+        )
+        finish = mock_post.call_args_list[2]
+        self.assertEqual(
+            finish.args[0], f"{DROPBOX_API_URL}/files/upload_session/finish_batch_v2"
+        )
+        entries = json.loads(finish.kwargs["data"])["entries"]
+        self.assertEqual(
+            [entry["cursor"] for entry in entries],
+            [{"session_id": "s1", "offset": 10}, {"session_id": "s2", "offset": 10}],
+        )
+        self.assertEqual(entries[1]["commit"]["mode"], "overwrite")
+        self.assertEqual(self.dropbox.errors, 1)
+
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropboxHeadersManager")
     def test_delete_success(self, mock_headers_manager, mock_post):
         """Test delete for successful resource deletion."""
@@ -140,7 +251,7 @@ class TestDropboxMethods(unittest.TestCase):
             data=json.dumps({"path": "/path_in_dropbox/testfile.txt"}),
         )
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_delete_failure(self, mock_post):
         """Test delete failure scenario."""
         mock_response = MagicMock()
@@ -150,7 +261,7 @@ class TestDropboxMethods(unittest.TestCase):
         with self.assertRaises(Exception):
             self.dropbox.delete("/path_in_dropbox/nonexistent.txt")
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropboxHeadersManager")
     def test_create_folder_success(self, mock_headers_manager, mock_post):
         """Test create_folder for a successful folder creation."""
@@ -173,7 +284,7 @@ class TestDropboxMethods(unittest.TestCase):
             ),
         )
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_create_folder_failure(self, mock_post):
         """Test create_folder failure scenario."""
         mock_response = MagicMock()
@@ -186,7 +297,7 @@ class TestDropboxMethods(unittest.TestCase):
     def tearDown(self):
         patch.stopall()
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_list_folder_success(self, mock_post):
         """Test list_folder for successful response."""
         mock_response = MagicMock()
@@ -212,7 +323,7 @@ class TestDropboxMethods(unittest.TestCase):
             data=json.dumps({"path": "/fake/path"}),
         )
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_check_root_folder_exists(self, mock_post):
         """Test check_root_folder when folder exists."""
         mock_response = MagicMock()
@@ -225,7 +336,7 @@ class TestDropboxMethods(unittest.TestCase):
         self.assertTrue(result)
 
     @patch("src.Dropbox.dropbox.DropBox.create_folder")
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_check_upload_success(self, mock_post, mock_create_folder):
         """Test check_upload for successful upload."""
         mock_response = MagicMock()
@@ -237,7 +348,7 @@ class TestDropboxMethods(unittest.TestCase):
         self.dropbox.check_upload()
         mock_create_folder.assert_called()
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_get_cloud_tree_success(self, mock_post):
         """Test get_cloud_tree for successfully retrieving folder structure."""
         mock_response = MagicMock()
@@ -245,39 +356,324 @@ class TestDropboxMethods(unittest.TestCase):
         mock_response.json.side_effect = [
             {
                 "entries": [
-                    {"name": "testfile.txt", ".tag": "file"},
-                    {"name": "testfolder", ".tag": "folder"},
-                ]
+                    self.entry("folder", "test_dir"),
+                    self.entry("file", "test_dir/testfile.txt"),
+                    self.entry("folder", "test_dir/testfolder"),
+                ],
+                "cursor": "c1",
+                "has_more": True,
+            },
+            {
+                "entries": [self.entry("folder", "test_dir/testfolder/inner")],
+                "cursor": "c2",
+                "has_more": False,
             },
-            {},
         ]
         mock_post.return_value = mock_response
 
         tree_list = []
-        self.dropbox.get_cloud_tree("/fake/path", tree_list, "")
-        self.assertEqual(len(tree_list), 1)
-        self.assertIn(f"/fake/path{os.path.sep}testfolder", tree_list)
+        self.dropbox.get_cloud_tree("test_dir", tree_list, "")
+        self.assertEqual(
+            tree_list,
+            [
+                os.path.join("test_dir", "testfolder"),
+                os.path.join("test_dir", "testfolder", "inner"),
+            ],
+        )
+        self.assertEqual(
+            json.loads(mock_post.call_args_list[0].kwargs["data"]),
+            {"path": "/SYNC_FOLDERS/test_dir", "recursive": True, "limit": 2000},
+        )
+        self.assertEqual(
+            mock_post.call_args_list[1].args[0],
+            f"{DROPBOX_API_URL}/files/list_folder/continue",
+        )
+
+    @patch("src.transport.Transport.post")
+    def test_load_tree_uses_saved_cursor(self, mock_post):
+        """Only the changes since the saved cursor are requested."""
+        saved_tree = {
+            "/sync_folders/test_dir": self.entry("folder", "test_dir"),
+            "/sync_folders/test_dir/old": self.entry("folder", "test_dir/old"),
+            "/sync_folders/test_dir/old/a.txt": self.entry(
+                "file", "test_dir/old/a.txt"
+            ),
+        }
+        self.dropbox.sync_state = MagicMock()
+        self.dropbox.sync_state.get_meta.return_value = json.dumps(
+            {"cursor": "c1", "entries": saved_tree}
+        )
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "entries": [
+                self.entry("deleted", "test_dir/old"),
+                self.entry("file", "test_dir/new.txt"),
+            ],
+            "cursor": "c2",
+            "has_more": False,
+        }
+        mock_post.return_value = mock_response
+
+        tree = self.dropbox.load_tree("/SYNC_FOLDERS/test_dir")
+
+        self.assertEqual(
+            list(tree), ["/sync_folders/test_dir", "/sync_folders/test_dir/new.txt"]
+        )
+        mock_post.assert_called_once()
+        self.assertEqual(
+            json.loads(mock_post.call_args.kwargs["data"]), {"cursor": "c1"}
+        )
+        key, value = self.dropbox.sync_state.set_meta.call_args.args
+        self.assertEqual(key, "list_folder:/sync_folders/test_dir")
+        self.assertEqual(json.loads(value)["cursor"], "c2")
+        self.assertEqual(self.dropbox.tree_changes, mock_response.json()["entries"])
+
+    @patch("src.transport.Transport.post")
+    def test_load_tree_reset_cursor(self, mock_post):
+        """An expired cursor falls back to the full listing."""
+        self.dropbox.sync_state = MagicMock()
+        self.dropbox.sync_state.get_meta.return_value = json.dumps(
+            {"cursor": "old", "entries": {}}
+        )
+        reset_response = MagicMock()
+        reset_response.status_code = 409
+        reset_response.json.return_value = {"error_summary": "reset/.."}
+        list_response = MagicMock()
+        list_response.status_code = 200
+        list_response.json.return_value = {
+            "entries": [self.entry("folder", "test_dir")],
+            "cursor": "new",
+            "has_more": False,
+        }
+        mock_post.side_effect = [reset_response, list_response]
+
+        tree = self.dropbox.load_tree("/SYNC_FOLDERS/test_dir")
+
+        self.assertEqual(list(tree), ["/sync_folders/test_dir"])
+        self.assertEqual(
+            mock_post.call_args.args[0], f"{DROPBOX_API_URL}/files/list_folder"
+        )
+
+    @patch("src.transport.Transport.post")
+    def test_load_tree_planning_keeps_cursor(self, mock_post):
+        """A dry run reads the tree but does not save the cursor."""
+        self.dropbox.planning = True
+        self.dropbox.sync_state = MagicMock()
+        self.dropbox.sync_state.get_meta.return_value = None
+        mock_post.return_value = MagicMock(
+            status_code=200,
+            **{
+                "json.return_value": {
+                    "entries": [self.entry("folder", "test_dir")],
+                    "cursor": "c1",
+                    "has_more": False,
+                }
+            },
+        )
+
+        self.dropbox.load_tree("/SYNC_FOLDERS/test_dir")
+
+        self.dropbox.sync_state.set_meta.assert_not_called()
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.print_plan")
+    @patch("src.transport.Transport.post")
+    def test_dry_run_new_folder(self, mock_post, mock_print_plan, _):
+        """A dry run plans a full upload of a folder missing on Dropbox."""
+        mock_post.return_value = MagicMock(
+            status_code=409,
+            **{
+                "json.return_value": {
+                    "error_summary": "path/not_found/..",
+                }
+            },
+        )
+        state = MagicMock()
+        state.get_entries.return_value = {}
+        state.get_meta.return_value = None
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            folder = os.path.join(temp_dir, "new_folder")
+            os.makedirs(os.path.join(folder, "sub"))
+            for path in ("a.txt", os.path.join("sub", "b.txt")):
+                with open(os.path.join(folder, path), "w") as file:
+                    file.write("content")
+
+            sync_watched_folder(
+                state,
+                lambda path, client, planning: DropBox(
+                    os.path.basename(path), path, client, planning=planning
+                ),
+                self.mock_headers_manager.return_value,
+                folder,
+                threading.Lock(),
+                dry_run=True,
+            )
+
+        operations = mock_print_plan.call_args.args[0]
+        self.assertEqual(
+            sorted((operation.kind, operation.path) for operation in operations),
+            [
+                ("mkdir", os.path.join("new_folder", "sub")),
+                ("upload", os.path.join("new_folder", "a.txt")),
+                ("upload", os.path.join("new_folder", "sub", "b.txt")),
+            ],
+        )
+        state.set_meta.assert_not_called()
+
+    @patch("src.transport.Transport.post")
+    def test_load_tree_not_found_fails_outside_planning(self, mock_post):
+        mock_post.return_value = MagicMock(
+            status_code=409,
+            **{"json.return_value": {"error_summary": "path/not_found/.."}},
+        )
+
+        with self.assertRaises(Exception):
+            self.dropbox.load_tree("/SYNC_FOLDERS/test_dir")
+
+    @patch("src.Dropbox.dropbox.time.sleep")
+    @patch("src.transport.Transport.post")
+    def test_wait_for_changes(self, mock_post, mock_sleep):
+        """The longpoll is held on the cursor of the loaded tree."""
+        self.dropbox.tree = {}
+        self.dropbox.tree_path = "/sync_folders"
+        self.dropbox.tree_cursor = "c1"
+        mock_post.return_value = MagicMock(
+            status_code=200, **{"json.return_value": {"changes": True, "backoff": 5}}
+        )
+
+        self.assertTrue(self.dropbox.wait_for_changes("/SYNC_FOLDERS", timeout=30))
+
+        self.assertEqual(
+            json.loads(mock_post.call_args.kwargs["data"]),
+            {"cursor": "c1", "timeout": 30},
+        )
+        self.assertNotIn("Authorization", mock_post.call_args.kwargs["headers"])
+        self.assertGreater(mock_post.call_args.kwargs["timeout"][1], 30)
+        mock_sleep.assert_called_once_with(5)
+
+    @patch("src.Dropbox.dropbox.hash_cache")
+    @patch("src.Dropbox.dropbox.DropBox.download_file")
+    def test_apply_changes_on_pc(self, mock_download, mock_hash_cache):
+        """Only the listed changes are applied to the watched folder."""
+        mock_hash_cache.get.return_value = "same"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            folder = os.path.join(temp_dir, "test_dir")
+            os.makedirs(os.path.join(folder, "old"))
+            for name in ("same.txt", "changed.txt"):
+                open(os.path.join(folder, name), "w").close()
+            same = dict(self.entry("file", "test_dir/same.txt"), content_hash="same")
+            changed = dict(
+                self.entry("file", "test_dir/changed.txt"), content_hash="new"
+            )
+
+            with patch(
+                "src.clouds_manager.get_and_update_sync_folders",
+                return_value=[folder],
+            ):
+                self.dropbox.apply_changes_on_pc(
+                    [
+                        self.entry("deleted", "test_dir/old"),
+                        self.entry("folder", "test_dir/new"),
+                        self.entry("file", "other_dir/a.txt"),
+                        same,
+                        changed,
+                    ]
+                )
+
+            self.assertEqual(
+                sorted(os.listdir(folder)), ["changed.txt", "new", "same.txt"]
+            )
+            mock_download.assert_called_once_with(
+                folder, "/SYNC_FOLDERS/test_dir/changed.txt"
+            )
+
+    @patch("builtins.print")
+    @patch("src.Dropbox.dropbox.DropBox.download_file")
+    def test_apply_changes_on_pc_counts_errors(self, mock_download, _):
+        """A failed change is counted and the next ones are still applied."""
+        mock_download.side_effect = Exception("Ошибка 409: path/not_found/..")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            folder = os.path.join(temp_dir, "test_dir")
+            os.makedirs(folder)
+
+            with patch(
+                "src.clouds_manager.get_and_update_sync_folders",
+                return_value=[folder],
+            ):
+                self.dropbox.apply_changes_on_pc(
+                    [
+                        self.entry("file", "test_dir/gone.txt"),
+                        self.entry("folder", "test_dir/new"),
+                    ]
+                )
+
+            self.assertEqual(self.dropbox.errors, 1)
+            self.assertEqual(os.listdir(folder), ["new"])
+
+    def test_get_os_and_clouds_files_from_tree(self):
+        """Files of a folder are taken from the recursive listing."""
+        self.dropbox.tree = {
+            "/sync_folders/test_dir": self.entry("folder", "test_dir"),
+            "/sync_folders/test_dir/a.txt": self.entry("file", "test_dir/a.txt"),
+            "/sync_folders/test_dir/sub/b.txt": self.entry(
+                "file", "test_dir/sub/b.txt"
+            ),
+        }
+        self.dropbox.tree_path = "/sync_folders/test_dir"
+
+        with patch("os.listdir", return_value=[]):
+            _, cloud_files = self.dropbox.get_os_and_clouds_files(
+                "test_dir", "/fake/path"
+            )
+            _, sub_files = self.dropbox.get_os_and_clouds_files(
+                os.path.join("test_dir", "sub"), "/fake/path"
+            )
+
+        self.assertEqual([f["name"] for f in cloud_files], ["a.txt"])
+        self.assertEqual([f["name"] for f in sub_files], ["b.txt"])
+        # папки берутся из индекса, построенного по дереву один раз
+        self.assertEqual(
+            set(self.dropbox.tree_children),
+            {"/sync_folders", "/sync_folders/test_dir", "/sync_folders/test_dir/sub"},
+        )
+
+    @staticmethod
+    def entry(tag, path):
+        path_display = f"/SYNC_FOLDERS/{path}"
+        return {
+            ".tag": tag,
+            "name": path.split("/")[-1],
+            "path_display": path_display,
+            "path_lower": path_display.lower(),
+        }
 
     @patch("os.listdir", return_value=["file1.txt", "file2.txt"])
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_upload_dir_on_cloud_success(self, mock_post, mock_walk):
         """Test upload_dir_on_cloud for successful directory upload."""
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"name": "file"}
+        mock_response.json.return_value = {
+            ".tag": "complete",
+            "entries": [{".tag": "success"}],
+        }
 
         mock_post.return_value = mock_response
 
         self.dropbox.upload_dir_on_cloud(["/fake/path"])
 
         self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(
+            mock_post.call_args.args[0], f"{DROPBOX_API_URL}/files/create_folder_batch"
+        )
 
     @patch("os.path.getmtime", return_value=1609459200)
-    @patch("builtins.open", new_callable=mock_open, read_data=b"test content")
-    @patch("hashlib.md5")
-    def test_get_data_for_comparison(self, mock_md5, mock_open, mock_getmtime):
+    @patch("src.Dropbox.dropbox.hash_cache")
+    def test_get_data_for_comparison(self, mock_hash_cache, mock_getmtime):
         """Test get_data_for_comparison for proper comparison of local and cloud files."""
-        mock_md5.return_value.hexdigest.return_value = "abc123"
+        mock_hash_cache.get.return_value = "abc123"
 
         os_path_file = "/local/test_folder/file1.txt"
         cloud_file = {
@@ -299,7 +695,7 @@ class TestDropboxMethods(unittest.TestCase):
 
         self.assertEqual(cloud_modified_time, expected_cloud_time)
 
-        mock_open.assert_called_once_with(os_path_file, "rb")
+        mock_hash_cache.get.assert_called_once_with(os_path_file, "content_hash")
         self.assertEqual(os_file_md5, "abc123")
         self.assertEqual(cloud_file_md5, "abc123")
 
@@ -325,7 +721,8 @@ class TestDropboxMethods(unittest.TestCase):
         self.assertEqual(os_files, ["file1.txt", "file2.txt", "file3.txt"])
         self.assertEqual([f["name"] for f in cloud_files], ["file2.txt", "file4.txt"])
 
-    @patch("src.Dropbox.dropbox.DropBox.upload_file")
+    @patch("src.Dropbox.dropbox.UploadBatch.commit")
+    @patch("src.Dropbox.dropbox.UploadBatch.upload")
     @patch("src.Dropbox.dropbox.DropBox.delete")
     @patch("src.Dropbox.dropbox.DropBox.get_os_and_clouds_files")
     @patch("src.Dropbox.dropbox.DropBox.get_data_for_comparison")
@@ -335,6 +732,7 @@ class TestDropboxMethods(unittest.TestCase):
         get_os_and_clouds_files_mock,
         delete_mock,
         upload_file_mock,
+        commit_mock,
     ):
         """Test updating directory on cloud."""
         get_os_and_clouds_files_mock.return_value = (
@@ -351,11 +749,12 @@ class TestDropboxMethods(unittest.TestCase):
 
         self.dropbox.update_dir_on_cloud(["test_folder"])
 
-        upload_file_mock.assert_called_with(
+        upload_file_mock.assert_any_call(
             f"{os.path.sep}test_folder{os.path.sep}file1.txt",
             "/SYNC_FOLDERS/test_folder/file1.txt",
         )
         delete_mock.assert_called_with("/dropbox/path/file3.txt")
+        commit_mock.assert_called_once()
 
     @patch("src.clouds_manager.get_os_path_by_cloud_path", return_value="test_folder")
     @patch("src.Dropbox.dropbox.DropBox.download")
@@ -385,25 +784,89 @@ class TestDropboxMethods(unittest.TestCase):
 
         self.dropbox.update_dir_on_pc(["test_folder"])
 
-        download_mock.assert_called_with(
+        download_mock.assert_any_call(
             "test_folder", "/dropbox/path/file3.txt", is_folder=False
         )
         remove_mock.assert_called_once_with(f"test_folder{os.path.sep}file1.txt")
 
-    @patch("src.Dropbox.dropbox.DropBox.delete")
-    def test_remove_old_dir_on_cloud(self, delete_mock):
-        """Test removing old directories from cloud."""
+    @patch("src.Dropbox.dropbox.DropBox.get_os_and_clouds_files")
+    @patch("src.Dropbox.dropbox.DropBox.get_data_for_comparison")
+    def test_plan_update_dir_on_cloud_compares_content_hash(
+        self, get_data_for_comparison_mock, get_os_and_clouds_files_mock
+    ):
+        get_os_and_clouds_files_mock.return_value = (
+            ["same.txt", "changed.txt"],
+            [
+                {"name": "same.txt", "path_display": "/d/same.txt"},
+                {"name": "changed.txt", "path_display": "/d/changed.txt"},
+            ],
+        )
+        # оба файла новее на пк, но содержимое изменилось только у одного
+        get_data_for_comparison_mock.side_effect = [
+            (10, 9, "hash", "hash"),
+            (10, 9, "new_hash", "old_hash"),
+        ]
+
+        operations = self.dropbox.plan_update_dir_on_cloud(["test_folder"])
+
+        self.assertEqual(
+            [op.path for op in operations], [os.path.join("test_folder", "changed.txt")]
+        )
+
+    @patch("src.Dropbox.dropbox.time.sleep")
+    @patch("src.transport.Transport.post")
+    def test_remove_old_dir_on_cloud(self, post_mock, sleep_mock):
+        """Test removing old directories from cloud with one batch job."""
+        responses = [
+            {".tag": "async_job_id", "async_job_id": "job"},
+            {".tag": "in_progress"},
+            {
+                ".tag": "complete",
+                "entries": [
+                    {".tag": "success"},
+                    {
+                        ".tag": "failure",
+                        "failure": {
+                            ".tag": "path_lookup",
+                            "path_lookup": {".tag": "not_found"},
+                        },
+                    },
+                ],
+            },
+        ]
+        post_mock.side_effect = [
+            MagicMock(status_code=200, **{"json.return_value": response})
+            for response in responses
+        ]
         remove_folders = ["folder1", "folder2"]
         self.dropbox.remove_old_dir_on_cloud(remove_folders)
 
         from src.clouds_manager import ROOT_FOLDER
 
-        delete_mock.assert_any_call(f"/{ROOT_FOLDER}/folder1")
-        delete_mock.assert_any_call(f"/{ROOT_FOLDER}/folder2")
-        self.assertEqual(delete_mock.call_count, 2)
+        urls = [call.args[0] for call in post_mock.call_args_list]
+        self.assertEqual(
+            urls,
+            [f"{DROPBOX_API_URL}/files/delete_batch"]
+            + [f"{DROPBOX_API_URL}/files/delete_batch/check"] * 2,
+        )
+        self.assertEqual(
+            json.loads(post_mock.call_args_list[0].kwargs["data"]),
+            {
+                "entries": [
+                    {"path": f"/{ROOT_FOLDER}/folder1"},
+                    {"path": f"/{ROOT_FOLDER}/folder2"},
+                ]
+            },
+        )
+        self.assertEqual(
+            json.loads(post_mock.call_args_list[1].kwargs["data"]),
+            {"async_job_id": "job"},
+        )
+        self.assertEqual(sleep_mock.call_count, 2)
+        self.assertEqual(self.dropbox.errors, 0)
 
     @patch("src.Dropbox.dropbox.DropBox.handle_response")
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     def test_list_files(self, post_mock, handle_response_mock):
         """Test listing files and directories."""
 
@@ -461,10 +924,109 @@ class TestDropboxMethods(unittest.TestCase):
             "", "/SYNC_FOLDERS/folder1", is_folder=True
         )
 
+    @patch("src.Dropbox.dropbox.os.path.exists", return_value=False)
+    @patch("src.clouds_manager.get_os_path_by_cloud_path")
+    def test_plan_downloading_nested_folders(self, get_os_path_mock, _):
+        get_os_path_mock.side_effect = lambda folder: os.path.join("local", folder)
+        nested = os.path.join("folder", "nested")
+
+        operations = self.dropbox.plan_downloading_folders(
+            [nested, os.path.join(nested, "deeper"), "folder"]
+        )
+
+        self.assertEqual([operation.path for operation in operations], ["folder"])
+        self.assertEqual(
+            operations[0].args, ("local", f"/{self.dropbox.ROOT_FOLDER}/folder")
+        )
+
+    @patch("src.transport.Transport.post")
+    def test_download_zip(self, post_mock):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("folder/file1.txt", b"one")
+            zip_file.writestr("folder/sub/file2.txt", b"two")
+        data = archive.getvalue()
+        post_mock.return_value = MagicMock(
+            status_code=200,
+            **{"iter_content.return_value": [data[:10], data[10:]]},
+        )
+
+        with tempfile.TemporaryDirectory() as local_path:
+            self.dropbox.download(local_path, "/SYNC_FOLDERS/folder", is_folder=True)
+
+            with open(os.path.join(local_path, "folder", "sub", "file2.txt")) as f:
+                self.assertEqual(f.read(), "two")
+            self.assertEqual(os.listdir(local_path), ["folder"])
+
+        self.assertEqual(
+            post_mock.call_args.args[0], f"{DROPBOX_CONTENT_URL}/files/download_zip"
+        )
+
+    @patch("builtins.print")
+    @patch("src.transport.Transport.post")
+    def test_download_zip_refreshes_token(self, post_mock, _):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("folder/file1.txt", b"one")
+        post_mock.side_effect = [
+            MagicMock(status_code=401, text=""),
+            MagicMock(
+                status_code=200,
+                **{"iter_content.return_value": [archive.getvalue()]},
+            ),
+        ]
+
+        with tempfile.TemporaryDirectory() as local_path:
+            self.assertTrue(
+                self.dropbox.download_zip(local_path, "/SYNC_FOLDERS/folder")
+            )
+            self.assertEqual(os.listdir(local_path), ["folder"])
+
+        self.mock_headers_manager.return_value.refresh_token.assert_called_once_with(
+            "FAKE_TOKEN"
+        )
+        # повтор идёт с теми же аргументами запроса
+        headers = post_mock.call_args.kwargs["headers"]
+        self.assertEqual(
+            json.loads(headers["Dropbox-API-Arg"]), {"path": "/SYNC_FOLDERS/folder"}
+        )
+
+    @patch("src.transport.Transport.post")
+    def test_download_zip_error(self, post_mock):
+        post_mock.return_value = MagicMock(
+            status_code=500, **{"json.return_value": {"error_summary": "internal"}}
+        )
+
+        with self.assertRaises(Exception) as context:
+            self.dropbox.download_zip("/local/path", "/SYNC_FOLDERS/folder")
+
+        self.assertIn("Ошибка 500", str(context.exception))
+
+    @patch("src.Dropbox.dropbox.DropBox.download_file")
+    @patch("src.Dropbox.dropbox.DropBox.list_folder")
+    @patch("src.transport.Transport.post")
+    def test_download_zip_too_large(self, post_mock, list_folder_mock, download_mock):
+        post_mock.return_value = MagicMock(
+            status_code=409, text='{"error_summary": "too_many_files/.."}'
+        )
+        list_folder_mock.return_value = {
+            "entries": [{".tag": "file", "path_display": "/SYNC_FOLDERS/big/a.txt"}]
+        }
+
+        with tempfile.TemporaryDirectory() as local_path:
+            self.dropbox.download(local_path, "/SYNC_FOLDERS/big", is_folder=True)
+
+            download_mock.assert_called_once_with(
+                os.path.join(local_path, "big"), "/SYNC_FOLDERS/big/a.txt"
+            )
+
+    @patch("src.Dropbox.dropbox.DropBox.download_zip", return_value=False)
     @patch("src.Dropbox.dropbox.DropBox.download_file")
     @patch("src.Dropbox.dropbox.DropBox.list_folder")
     @patch("os.makedirs")
-    def test_download_folder(self, makedirs_mock, list_folder_mock, download_file_mock):
+    def test_download_folder(
+        self, makedirs_mock, list_folder_mock, download_file_mock, _
+    ):
         """Test downloading a folder with multiple files from Dropbox."""
         list_folder_mock.return_value = {
             "entries": [
@@ -505,7 +1067,7 @@ class TestDropboxMethods(unittest.TestCase):
     @patch("src.Dropbox.dropbox.os.path.join")
     @patch("src.Dropbox.dropbox.os.path.basename")
     @patch("src.Dropbox.dropbox.open", new_callable=mock_open)
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropBox.handle_response")
     def test_download_file(
         self, handle_response_mock, post_mock, open_mock, basename_mock, join_mock
@@ -540,7 +1102,7 @@ class TestDropboxMethods(unittest.TestCase):
 
         basename_mock.assert_called_with(save_path)
 
-    @patch("src.Dropbox.dropbox.requests.post")
+    @patch("src.transport.Transport.post")
     @patch("src.Dropbox.dropbox.DropBox.handle_response")
     def test_download_file_failed(self, handle_response_mock, post_mock):
         """Test handling failed file download."""
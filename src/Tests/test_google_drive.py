@@ -1,5 +1,7 @@
 import unittest
 import datetime
+import json
+import httplib2
 from unittest.mock import patch, MagicMock, mock_open
 
 from src.Drive import google_drive
@@ -219,19 +221,274 @@ class TestGoogleDrive(unittest.TestCase):
         self.assertEqual(os_files, ["file1.txt", "file2.txt"])
         self.assertEqual(cloud_files[0]["name"], "file1.txt")
 
-    @patch("src.Drive.google_drive.os.path.getmtime")
-    @patch("src.Drive.google_drive.open", create=True)
-    @patch("src.Drive.google_drive.hashlib.md5")
-    def test_get_data_for_comparison(self, mock_md5, mock_open, mock_getmtime):
-        mock_getmtime.return_value = 1609459200
+    def test_load_tree_full_listing(self):
+        self.drive.sync_state = MagicMock()
+        self.drive.sync_state.get_meta.return_value = None
+        self.mock_service.changes().getStartPageToken().execute.return_value = {
+            "startPageToken": "10"
+        }
+        mock_files_list = self.mock_service.files().list
+        mock_files_list.return_value.execute.side_effect = [
+            {
+                "files": [
+                    self.item("b.txt", "sub"),
+                    self.item("other", "elsewhere"),
+                ],
+                "nextPageToken": "p",
+            },
+            {
+                "files": [
+                    self.item("sub", "root", folder=True),
+                    self.item("a.txt", "root"),
+                ]
+            },
+        ]
+
+        tree = self.drive.load_tree("root")
+
+        # весь диск за два запроса, дерево папки собирается в памяти
+        self.assertEqual(set(tree), {"sub", "a.txt", "b.txt"})
+        self.assertEqual(mock_files_list.return_value.execute.call_count, 2)
+        mock_files_list.assert_called_with(
+            pageSize=1000, q="trashed = false", fields=unittest.mock.ANY, pageToken="p"
+        )
+        key, value = self.drive.sync_state.set_meta.call_args.args
+        self.assertEqual(key, "changes:root")
+        self.assertEqual(json.loads(value)["token"], "10")
+
+    def test_drive_listing_shared_between_folders(self):
+        self.mock_service.changes().getStartPageToken().execute.return_value = {
+            "startPageToken": "10"
+        }
+        mock_files_list = self.mock_service.files().list
+        mock_files_list.return_value.execute.return_value = {
+            "files": [
+                self.item("first", "root", folder=True),
+                self.item("a.txt", "first"),
+                self.item("second", "root", folder=True),
+                self.item("b.txt", "second"),
+            ]
+        }
+        other_drive = GoogleDrive("", "", client=self.mock_service)
+
+        first = self.drive.load_tree("first")
+        second = other_drive.load_tree("second")
+
+        self.assertEqual(set(first), {"a.txt"})
+        self.assertEqual(set(second), {"b.txt"})
+        # диск листится один раз на клиента
+        self.assertEqual(mock_files_list.return_value.execute.call_count, 1)
+
+    def test_load_tree_applies_changes(self):
+        saved_tree = {
+            "sub": self.item("sub", "root", folder=True),
+            "b.txt": self.item("b.txt", "sub"),
+            "a.txt": self.item("a.txt", "root"),
+        }
+        self.drive.sync_state = MagicMock()
+        self.drive.sync_state.get_meta.return_value = json.dumps(
+            {"token": "10", "files": saved_tree}
+        )
+        mock_changes_list = self.mock_service.changes().list
+        mock_changes_list.return_value.execute.return_value = {
+            "changes": [
+                {"fileId": "sub", "removed": True},
+                {"fileId": "c.txt", "file": self.item("c.txt", "root")},
+                {"fileId": "other", "file": self.item("other", "elsewhere")},
+            ],
+            "newStartPageToken": "11",
+        }
+
+        tree = self.drive.load_tree("root")
+
+        self.assertEqual(set(tree), {"a.txt", "c.txt"})
+        mock_changes_list.assert_called_with(
+            pageToken="10", pageSize=1000, fields=unittest.mock.ANY
+        )
+        self.mock_service.files().list.assert_not_called()
+        self.assertEqual(
+            json.loads(self.drive.sync_state.set_meta.call_args.args[1])["token"], "11"
+        )
+
+    @patch("src.Drive.google_drive.GoogleDrive.root_folder_upload")
+    @patch("src.Drive.google_drive.get_service")
+    def test_planning_changes_nothing(self, mock_get_service, mock_folder_upload):
+        service = mock_get_service.return_value
+        service.files().list.return_value.execute.return_value = {"files": []}
+        service.changes().getStartPageToken().execute.return_value = {
+            "startPageToken": "10"
+        }
 
-        mock_file = MagicMock()
-        mock_file.read.return_value = b"test_file_content"
-        mock_open.return_value.__enter__.return_value = mock_file
+        drive = GoogleDrive("test_folder", "/test/path", planning=True)
+        self.assertIsNone(drive.folder_id)
+        tree_list = []
+        drive.get_cloud_tree("test_folder", tree_list, "")
+
+        self.assertEqual(tree_list, [])
+        service.files().create.assert_not_called()
+        mock_folder_upload.assert_not_called()
+
+        # дерево облака читается, но курсор в sync_state не пишется
+        drive.sync_state = MagicMock()
+        drive.sync_state.get_meta.return_value = None
+        drive.tree = None
+        drive.load_tree("root")
+        drive.sync_state.set_meta.assert_not_called()
+
+    def test_get_drive_tree_from_tree(self):
+        self.drive.parents_id = {"test_folder": "root"}
+        self.drive.tree = {
+            "sub": self.item("sub", "root", folder=True),
+            "inner": self.item("inner", "sub", folder=True),
+            "a.txt": self.item("a.txt", "sub"),
+        }
+        self.drive.tree_root = "root"
+
+        tree_list = []
+        self.drive.get_drive_tree("test_folder", tree_list, "")
+
+        self.assertEqual(
+            tree_list,
+            [
+                os.path.join("test_folder", "sub"),
+                os.path.join("test_folder", "sub", "inner"),
+            ],
+        )
+        self.assertEqual(self.drive.parents_id["inner"], "inner")
+
+    @patch("src.Drive.google_drive.os.listdir", return_value=[])
+    def test_get_os_and_cloud_files_from_tree(self, _):
+        self.drive.tree = {
+            "sub": self.item("sub", "root", folder=True),
+            "a.txt": self.item("a.txt", "root"),
+            "b.txt": self.item("b.txt", "sub"),
+        }
+        self.drive.tree_root = "root"
+
+        _, cloud_files = self.drive.get_os_and_cloud_files("root", "/test/path")
+        _, sub_files = self.drive.get_os_and_cloud_files("sub", "/test/path")
+
+        self.assertEqual([f["name"] for f in cloud_files], ["a.txt"])
+        self.assertEqual([f["name"] for f in sub_files], ["b.txt"])
+        self.mock_service.files().list.assert_not_called()
+        # содержимое папок берётся из индекса, построенного один раз
+        self.assertEqual(
+            self.drive.tree_children, {"root": ["sub", "a.txt"], "sub": ["b.txt"]}
+        )
+
+    @staticmethod
+    def item(name, parent, folder=False):
+        return {
+            "id": name,
+            "name": name,
+            "parents": [parent],
+            "mimeType": (
+                "application/vnd.google-apps.folder" if folder else "text/plain"
+            ),
+        }
+
+    @patch("src.Drive.google_drive.MediaFileUpload")
+    @patch("src.Drive.google_drive.file_size", return_value=10)
+    def test_execute_upload_small_file(self, _, mock_media_upload):
+        method = MagicMock()
+        method.return_value.execute.return_value = {"id": "file_id"}
+
+        response = self.drive.execute_upload(
+            method, "/test/a.txt", "text/plain", fileId="file_id"
+        )
+
+        self.assertEqual(response, {"id": "file_id"})
+        mock_media_upload.assert_called_once_with("/test/a.txt", mimetype="text/plain")
+        method.return_value.next_chunk.assert_not_called()
+
+    @patch("src.Drive.google_drive.get_upload_key", return_value="upload:key")
+    @patch("src.Drive.google_drive.MediaFileUpload")
+    @patch("src.Drive.google_drive.file_size", return_value=100)
+    def test_execute_upload_resumable(self, _, mock_media_upload, __):
+        self.drive.upload_chunk_size = 10
+        self.drive.sync_state = MagicMock()
+        self.drive.sync_state.get_meta.return_value = None
+        request = MagicMock(resumable_uri=None)
+
+        def next_chunk(num_retries):
+            if request.resumable_uri is None:
+                request.resumable_uri = "https://upload/session"
+                return MagicMock(), None
+            return None, {"id": "file_id"}
+
+        request.next_chunk.side_effect = next_chunk
+        method = MagicMock(return_value=request)
+
+        response = self.drive.execute_upload(
+            method, "/test/a.bin", None, body={"parents": ["p"]}
+        )
+
+        self.assertEqual(response, {"id": "file_id"})
+        self.assertTrue(mock_media_upload.call_args.kwargs["resumable"])
+        self.drive.sync_state.set_meta.assert_called_once_with(
+            "upload:key", "https://upload/session"
+        )
+        self.drive.sync_state.delete_meta.assert_called_once_with("upload:key")
+
+    @patch("src.Drive.google_drive.get_upload_key", return_value="upload:key")
+    @patch("src.Drive.google_drive.MediaFileUpload")
+    @patch("src.Drive.google_drive.file_size", return_value=100)
+    def test_execute_upload_resumes_saved_session(self, _, __, ___):
+        self.drive.upload_chunk_size = 10
+        self.drive.sync_state = MagicMock()
+        self.drive.sync_state.get_meta.return_value = "https://upload/session"
+        request = MagicMock(resumable_uri=None, resumable_progress=0)
+        request.resumable.size.return_value = 100
+        request.http.request.return_value = (
+            httplib2.Response({"status": 308, "range": "bytes=0-39"}),
+            b"",
+        )
+        request.next_chunk.return_value = (None, {"id": "file_id"})
+        method = MagicMock(return_value=request)
+
+        self.drive.execute_upload(method, "/test/a.bin", None, fileId="file_id")
 
-        mock_md5.return_value.hexdigest.return_value = (
-            "d41d8cd98f00b204e9800998ecf8427e"
+        # сервер сообщил, сколько байт принято, загрузка идёт с 40-го
+        request.http.request.assert_called_once_with(
+            "https://upload/session",
+            "PUT",
+            headers={"Content-Range": "bytes */100", "content-length": "0"},
         )
+        self.assertEqual(request.resumable_uri, "https://upload/session")
+        self.assertEqual(request.resumable_progress, 40)
+        request.next_chunk.assert_called_once()
+        method.assert_called_once()
+        self.drive.sync_state.set_meta.assert_not_called()
+        self.drive.sync_state.delete_meta.assert_called_once_with("upload:key")
+
+    @patch("src.Drive.google_drive.get_upload_key", return_value="upload:key")
+    @patch("src.Drive.google_drive.MediaFileUpload")
+    @patch("src.Drive.google_drive.file_size", return_value=100)
+    def test_execute_upload_saved_session_expired(self, _, __, ___):
+        self.drive.upload_chunk_size = 10
+        self.drive.sync_state = MagicMock()
+        self.drive.sync_state.get_meta.return_value = "https://upload/session"
+        expired = MagicMock(resumable_uri=None)
+        expired.http.request.return_value = (httplib2.Response({"status": 404}), b"")
+        fresh = MagicMock(resumable_uri=None)
+        fresh.next_chunk.return_value = (None, {"id": "file_id"})
+        method = MagicMock(side_effect=[expired, fresh])
+
+        with patch("builtins.print"):
+            response = self.drive.execute_upload(
+                method, "/test/a.bin", None, fileId="file_id"
+            )
+
+        self.assertEqual(response, {"id": "file_id"})
+        expired.next_chunk.assert_not_called()
+        self.assertEqual(method.call_count, 2)
+
+    @patch("src.Drive.google_drive.os.path.getmtime")
+    @patch("src.Drive.google_drive.hash_cache")
+    def test_get_data_for_comparison(self, mock_hash_cache, mock_getmtime):
+        mock_getmtime.return_value = 1609459200
+
+        mock_hash_cache.md5.return_value = "d41d8cd98f00b204e9800998ecf8427e"
 
         path_to_file = "/test/path"
         drive_file = {
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.hash_cache import HashCache, md5_digest, dropbox_content_hash
+
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = HashCache(os.path.join(self.temp_dir.name, "cache.sqlite3"))
+        self.file_path = os.path.join(self.temp_dir.name, "file.txt")
+        with open(self.file_path, "wb") as file:
+            file.write(b"test content")
+
+    def tearDown(self):
+        if self.cache._connection is not None:
+            self.cache._connection.close()
+        self.temp_dir.cleanup()
+
+    def test_md5_digest(self):
+        self.assertEqual(md5_digest(self.file_path), "9473fdd0d880a43c21b7778d34872157")
+
+    @patch("src.hash_cache.DROPBOX_BLOCK_SIZE", 4)
+    def test_dropbox_content_hash(self):
+        blocks = [b"test", b" con", b"tent"]
+        expected = hashlib.sha256(
+            b"".join(hashlib.sha256(block).digest() for block in blocks)
+        ).hexdigest()
+
+        self.assertEqual(dropbox_content_hash(self.file_path), expected)
+
+    def test_second_lookup_is_cached(self):
+        first = self.cache.md5(self.file_path)
+
+        with patch.dict(
+            "src.hash_cache.HASH_FUNCTIONS", {"md5": self.fail}, clear=True
+        ):
+            second = self.cache.md5(self.file_path)
+
+        self.assertEqual(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.hit_rate(), 0.5)
+
+    def test_changed_file_is_rehashed(self):
+        first = self.cache.md5(self.file_path)
+
+        with open(self.file_path, "wb") as file:
+            file.write(b"another content")
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        second = self.cache.md5(self.file_path)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_cache_is_persistent(self):
+        self.cache.md5(self.file_path)
+        self.cache.report()
+
+        other_cache = HashCache(self.cache.db_path)
+        other_cache.md5(self.file_path)
+
+        self.assertEqual(other_cache.hits, 1)
+        other_cache._connection.close()
+
+    def test_file_changed_while_hashing_is_not_cached(self):
+        def rewrite_while_hashing(path):
+            digest = md5_digest(path)
+            with open(path, "ab") as file:
+                file.write(b" appended")
+            return digest
+
+        with patch.dict(
+            "src.hash_cache.HASH_FUNCTIONS", {"md5": rewrite_while_hashing}
+        ):
+            self.cache.md5(self.file_path)
+        self.cache.close()
+
+        self.assertEqual(self.count_saved_rows(), 0)
+
+    def count_saved_rows(self):
+        connection = sqlite3.connect(self.cache.db_path)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        finally:
+            connection.close()
+
+    @patch("src.hash_cache.COMMIT_EVERY", 2)
+    def test_hashes_are_committed_in_batches(self):
+        other_path = os.path.join(self.temp_dir.name, "other.txt")
+        with open(other_path, "wb") as file:
+            file.write(b"other content")
+
+        self.cache.md5(self.file_path)
+        self.assertEqual(self.count_saved_rows(), 0)
+
+        self.cache.md5(other_path)
+        self.assertEqual(self.count_saved_rows(), 2)
+
+    def test_close_commits(self):
+        self.cache.md5(self.file_path)
+
+        self.cache.close()
+
+        self.assertIsNone(self.cache._connection)
+        self.assertEqual(self.count_saved_rows(), 1)
+
+    def test_prune_deleted_files(self):
+        deleted_path = os.path.join(self.temp_dir.name, "deleted.txt")
+        with open(deleted_path, "wb") as file:
+            file.write(b"deleted content")
+        self.cache.md5(self.file_path)
+        self.cache.md5(deleted_path)
+        os.remove(deleted_path)
+
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertEqual(self.count_saved_rows(), 1)
+
+    def test_renamed_file_is_not_pruned(self):
+        self.cache.md5(self.file_path)
+        new_path = os.path.join(self.temp_dir.name, "renamed.txt")
+        os.rename(self.file_path, new_path)
+
+        self.cache.md5(new_path)
+
+        self.assertEqual(self.cache.prune(), 0)
+        self.assertEqual(self.cache.hits, 1)
+
+    @patch("builtins.print")
+    def test_report_prunes_once_per_interval(self, mock_print):
+        self.cache.clock = iter([0, 10, 60 * 60, 60 * 60]).__next__
+        self.cache.md5(self.file_path)
+
+        with patch.object(self.cache, "prune", wraps=self.cache.prune) as prune:
+            self.cache.report()
+            self.cache.report()
+            self.cache.report()
+
+        self.assertEqual(prune.call_count, 2)
+
+    def test_old_cache_is_recreated(self):
+        connection = sqlite3.connect(self.cache.db_path)
+        connection.execute(
+            "CREATE TABLE hashes (device INTEGER, inode INTEGER, algorithm TEXT, "
+            "size INTEGER, mtime_ns INTEGER, digest TEXT, "
+            "PRIMARY KEY (device, inode, algorithm))"
+        )
+        connection.commit()
+        connection.close()
+
+        self.cache.md5(self.file_path)
+        self.cache.close()
+
+        self.assertEqual(self.count_saved_rows(), 1)
+
+    @patch("builtins.print")
+    def test_report(self, mock_print):
+        self.cache.md5(self.file_path)
+        self.cache.md5(self.file_path)
+
+        self.cache.report()
+
+        mock_print.assert_called_once_with(
+            "Кэш хэшей: 1 из 2 файлов без повторного чтения (50%)"
+        )
+        self.assertEqual(self.cache.hits, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+from src.sync_plan import (
+    Operation,
+    execute_plan,
+    find_moves,
+    print_plan,
+    MKDIR,
+    UPLOAD,
+    REPLACE,
+    DELETE,
+    DOWNLOAD,
+    MOVE,
+)
+
+
+class FakeTransfers:
+    """Пул передач, выполняющий операции сразу и запоминающий этапы"""
+
+    def __init__(self):
+        self.batches = []
+
+    @contextmanager
+    def batch(self):
+        submitted = []
+        self.batches.append(submitted)
+        batch = MagicMock()
+        batch.submit.side_effect = lambda function, size=0: submitted.append(
+            (function(), size)
+        )
+        yield batch
+
+
+class TestExecutePlan(unittest.TestCase):
+    def test_phases_order(self):
+        calls = []
+
+        def operation(kind, path, size=0):
+            return Operation(kind, path, lambda: calls.append(path) or path, size=size)
+
+        operations = [
+            operation(DELETE, "old", 3),
+            operation(UPLOAD, os.path.join("a", "b", "file"), 5),
+            operation(MKDIR, os.path.join("a", "b")),
+            operation(MOVE, "moved", 7),
+            operation(MKDIR, "a"),
+        ]
+        transfers = FakeTransfers()
+
+        execute_plan(transfers, operations)
+
+        self.assertEqual(
+            calls,
+            [
+                "a",
+                os.path.join("a", "b"),
+                "moved",
+                os.path.join("a", "b", "file"),
+                "old",
+            ],
+        )
+        # байты считаются только у передач файлов
+        self.assertEqual(
+            transfers.batches,
+            [[("moved", 0)], [(os.path.join("a", "b", "file"), 5)], [("old", 0)]],
+        )
+
+    def test_flush_after_phase(self):
+        calls = []
+        flush = MagicMock(side_effect=lambda: calls.append("flush"))
+        operations = [
+            Operation(UPLOAD, name, lambda name=name: calls.append(name), flush=flush)
+            for name in ("a", "b")
+        ] + [Operation(DELETE, "c", lambda: calls.append("c"))]
+
+        execute_plan(FakeTransfers(), operations)
+
+        self.assertEqual(calls, ["a", "b", "flush", "c"])
+
+    def test_empty_plan(self):
+        transfers = FakeTransfers()
+
+        execute_plan(transfers, None)
+
+        self.assertEqual(transfers.batches, [[], [], []])
+
+
+class TestFindMoves(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.os_path = os.path.join(self.temp_dir.name, "file.txt")
+        with open(self.os_path, "wb") as file:
+            file.write(b"content")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def plan(self, digest):
+        delete = Operation(DELETE, "old.txt", MagicMock(), size=7, digest=digest)
+        upload = Operation(UPLOAD, "new.txt", MagicMock(), size=7, os_path=self.os_path)
+        return [delete, upload]
+
+    def plan_move(self, delete, upload):
+        return Operation(MOVE, upload.path, MagicMock(), source=delete.path)
+
+    def test_same_content_becomes_move(self):
+        with patch("src.sync_plan.hash_cache") as mock_hash_cache:
+            mock_hash_cache.get.return_value = "md5"
+            operations = find_moves(self.plan("md5"), "md5", self.plan_move)
+
+        self.assertEqual(
+            [(op.kind, op.path, op.source) for op in operations],
+            [(MOVE, "new.txt", "old.txt")],
+        )
+        mock_hash_cache.get.assert_called_once_with(self.os_path, "md5")
+
+    def test_different_content_is_kept(self):
+        with patch("src.sync_plan.hash_cache") as mock_hash_cache:
+            mock_hash_cache.get.return_value = "other"
+            operations = find_moves(self.plan("md5"), "md5", self.plan_move)
+
+        self.assertEqual([op.kind for op in operations], [DELETE, UPLOAD])
+
+    def test_without_algorithm(self):
+        operations = self.plan("md5")
+
+        self.assertIs(find_moves(operations, None, self.plan_move), operations)
+
+
+class TestPrintPlan(unittest.TestCase):
+    def test_print_plan(self):
+        operations = [
+            Operation(DELETE, "old", None),
+            Operation(DOWNLOAD, "got", None, size=1024 * 1024, on_pc=True),
+            Operation(REPLACE, "file", None, size=2 * 1024 * 1024),
+            Operation(MKDIR, "dir", None),
+        ]
+
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            print_plan(operations)
+
+        self.assertEqual(
+            mock_stdout.getvalue().splitlines(),
+            [
+                "создать папку: dir",
+                "заменить: file, 2.0 МБ",
+                "скачать: got (на пк), 1.0 МБ",
+                "удалить: old",
+                "Итого: создать папку 1, заменить 1, скачать 1, удалить 1; "
+                "передать 3.0 МБ",
+            ],
+        )
+
+    def test_print_empty_plan(self):
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            print_plan([])
+
+        self.assertEqual(mock_stdout.getvalue(), "Изменений нет\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
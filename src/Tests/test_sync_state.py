@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from src.sync_state import SyncState, SyncEntry
+
+
+class TestSyncState(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "state.sqlite3")
+        self.state = SyncState("yandex", self.db_path)
+
+    def tearDown(self):
+        self.state.close()
+        self.temp_dir.cleanup()
+
+    def test_replace_and_get_entries(self):
+        entries = {
+            "folder": SyncEntry(is_dir=True),
+            os.path.join("folder", "file.txt"): SyncEntry(False, 10, 100, "id", "rev"),
+        }
+
+        self.state.replace_entries("folder", entries)
+
+        self.assertEqual(self.state.get_entries("folder"), entries)
+
+    def test_entries_of_other_folders_are_kept(self):
+        self.state.replace_entries("folder", {"folder": SyncEntry(is_dir=True)})
+        self.state.replace_entries("folder2", {"folder2": SyncEntry(is_dir=True)})
+
+        self.state.replace_entries(
+            "folder", {os.path.join("folder", "a.txt"): SyncEntry(False, 1, 1)}
+        )
+
+        self.assertEqual(
+            list(self.state.get_entries("folder")), [os.path.join("folder", "a.txt")]
+        )
+        self.assertEqual(list(self.state.get_entries("folder2")), ["folder2"])
+
+    def test_providers_are_separated(self):
+        self.state.replace_entries("folder", {"folder": SyncEntry(is_dir=True)})
+
+        other_state = SyncState("dropbox", self.db_path)
+        self.assertEqual(other_state.get_entries("folder"), {})
+        other_state.close()
+
+    def test_meta(self):
+        self.assertIsNone(self.state.get_meta("cursor"))
+
+        self.state.set_meta("cursor", "a")
+        self.state.set_meta("cursor", "b")
+
+        self.assertEqual(self.state.get_meta("cursor"), "b")
+        other_state = SyncState("dropbox", self.db_path)
+        self.assertIsNone(other_state.get_meta("cursor"))
+        other_state.close()
+
+        self.state.delete_meta("cursor")
+        self.assertIsNone(self.state.get_meta("cursor"))
+
+    def test_same_local_state_ignores_remote_data(self):
+        self.assertTrue(
+            SyncEntry(False, 1, 1, "id", "rev").same_local_state(SyncEntry(False, 1, 1))
+        )
+        self.assertFalse(
+            SyncEntry(False, 1, 1).same_local_state(SyncEntry(False, 1, 2))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
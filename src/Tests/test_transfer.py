@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.transfer import (
+    TransferExecutor,
+    get_transfer_executor,
+    remove_nested_folders,
+    file_size,
+)
+
+
+class TestTransferExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = TransferExecutor(workers=4, max_in_flight_bytes=100)
+
+    def test_batch_runs_operations_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        with self.executor.batch() as batch:
+            for _ in range(3):
+                batch.submit(barrier.wait, size=10)
+
+        self.assertEqual(self.executor._operations, 3)
+        self.assertEqual(self.executor._bytes, 30)
+
+    def test_in_flight_bytes_are_limited(self):
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def transfer(size):
+            with lock:
+                in_flight.append(size)
+                max_in_flight.append(sum(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(size)
+
+        with self.executor.batch() as batch:
+            for _ in range(6):
+                batch.submit(transfer, 40, size=40)
+            batch.submit(transfer, 500, size=500)
+
+        self.assertLessEqual(max(max_in_flight[:-1]), 80)
+        self.assertEqual(self.executor._in_flight_bytes, 0)
+
+    def test_batch_raises_first_error_after_all_finished(self):
+        done = []
+
+        def fail():
+            raise ValueError("upload failed")
+
+        with self.assertRaises(ValueError):
+            with self.executor.batch() as batch:
+                batch.submit(fail)
+                batch.submit(lambda: done.append(True))
+
+        self.assertEqual(done, [True])
+
+    @patch("builtins.print")
+    def test_report(self, mock_print):
+        with self.executor.batch() as batch:
+            batch.submit(lambda: None, size=1024 * 1024)
+
+        self.assertGreater(self.executor.throughput(), 0)
+        self.executor.report()
+
+        self.assertIn("Передано 1 операций, 1.0 МБ", mock_print.call_args[0][0])
+        self.assertEqual(self.executor.throughput(), 0.0)
+
+    def test_get_transfer_executor_is_shared(self):
+        self.assertIs(
+            get_transfer_executor("DropBox"), get_transfer_executor("DropBox")
+        )
+        self.assertEqual(get_transfer_executor("GoogleDrive").workers, 4)
+
+    def test_remove_nested_folders(self):
+        folders = [
+            os.path.join("a", "b"),
+            "a",
+            os.path.join("ab", "c"),
+            os.path.join("a", "b", "c"),
+        ]
+
+        self.assertEqual(remove_nested_folders(folders), ["a", os.path.join("ab", "c")])
+
+    def test_file_size_of_missing_file(self):
+        self.assertEqual(file_size("/not/existing/file"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
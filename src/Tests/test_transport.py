@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.transport import Transport, FileBody, get_transport, DEFAULT_TIMEOUT
+
+
+class TestTransport(unittest.TestCase):
+    def test_get_transport_is_shared(self):
+        self.assertIs(get_transport("DropBox"), get_transport("DropBox"))
+        self.assertIsNot(get_transport("DropBox"), get_transport("YandexDisk"))
+
+    def test_default_timeout(self):
+        transport = Transport(4)
+        with patch.object(transport.session, "request") as mock_request:
+            transport.post("https://example.com", data=b"data")
+            transport.get("https://example.com", timeout=1)
+
+        mock_request.assert_any_call(
+            "POST", "https://example.com", data=b"data", timeout=DEFAULT_TIMEOUT
+        )
+        mock_request.assert_called_with("GET", "https://example.com", timeout=1)
+        transport.close()
+
+    def test_pool_size(self):
+        transport = Transport(12)
+
+        adapter = transport.session.get_adapter("https://example.com")
+
+        self.assertEqual(adapter._pool_maxsize, 12)
+        self.assertEqual(adapter.max_retries.connect, 3)
+        transport.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+    def test_file_body(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b"0123456789")
+        self.addCleanup(os.remove, f.name)
+
+        body = FileBody(f.name, buffer_size=4)
+
+        self.assertEqual(len(body), 10)
+        self.assertEqual(list(body), [b"0123", b"4567", b"89"])
+        # повтор запроса отправляет файл целиком ещё раз
+        self.assertEqual(b"".join(body), b"0123456789")
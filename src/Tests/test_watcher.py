@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from src.watcher import FolderWatcher, watch_folders
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWatcher:
+    """Выдаёт заранее заданные изменения, каждое через delay секунд"""
+
+    def __init__(self, clock, changes):
+        self.clock = clock
+        self.changes = list(changes)
+        self.timeouts = []
+
+    def read_changes(self, timeout=None):
+        self.timeouts.append(timeout)
+        if not self.changes:
+            if timeout is None:
+                raise KeyboardInterrupt
+            self.clock.now += timeout
+            return set()
+        delay, changed = self.changes.pop(0)
+        if timeout is not None and delay > timeout:
+            # событие не пришло до истечения таймаута
+            self.changes.insert(0, (delay - timeout, changed))
+            self.clock.now += timeout
+            return set()
+        self.clock.now += delay
+        return changed
+
+
+class TestWatchFolders(unittest.TestCase):
+    def test_burst_is_synced_once(self):
+        clock = FakeClock()
+        watcher = FakeWatcher(
+            clock, [(0, {"a"}), (0.5, {"b"}), (0.5, {"a"}), (10, {"c"})]
+        )
+        sync = MagicMock()
+
+        with self.assertRaises(KeyboardInterrupt):
+            watch_folders(watcher, sync, debounce=2, max_delay=30, clock=clock)
+
+        self.assertEqual(
+            [call.args[0] for call in sync.call_args_list], [["a", "b"], ["c"]]
+        )
+        # без изменений ждём событий без таймаута
+        self.assertIsNone(watcher.timeouts[0])
+
+    def test_max_delay(self):
+        clock = FakeClock()
+        watcher = FakeWatcher(clock, [(0, {"a"})] + [(1, {"a"})] * 5)
+        sync = MagicMock()
+
+        with self.assertRaises(KeyboardInterrupt):
+            watch_folders(watcher, sync, debounce=2, max_delay=3, clock=clock)
+
+        # непрерывные изменения синхронизируются не реже раза в max_delay
+        self.assertEqual(sync.call_count, 2)
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify есть только в Linux")
+class TestFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.temp_dir.name, "SYNC")
+        os.makedirs(os.path.join(self.folder, "sub"))
+        self.other = os.path.join(self.temp_dir.name, "OTHER")
+        os.makedirs(self.other)
+        self.watcher = FolderWatcher([self.folder, self.other])
+
+    def tearDown(self):
+        self.watcher.close()
+        self.temp_dir.cleanup()
+
+    def test_no_changes(self):
+        self.assertEqual(self.watcher.read_changes(timeout=0), set())
+
+    def test_file_in_subfolder(self):
+        with open(os.path.join(self.folder, "sub", "file.txt"), "w") as file:
+            file.write("data")
+
+        self.assertEqual(self.watcher.read_changes(timeout=1), {self.folder})
+
+    def test_new_folder_is_watched(self):
+        new_folder = os.path.join(self.other, "new")
+        os.makedirs(new_folder)
+        self.assertEqual(self.watcher.read_changes(timeout=1), {self.other})
+
+        os.remove(self.create_file(new_folder))
+
+        self.assertEqual(self.watcher.read_changes(timeout=1), {self.other})
+
+    def create_file(self, folder):
+        path = os.path.join(folder, "file.txt")
+        with open(path, "w") as file:
+            file.write("data")
+        return path
+
+
+if __name__ == "__main__":
+    unittest.main()
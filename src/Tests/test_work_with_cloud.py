@@ -1,4 +1,8 @@
+import io
 import os
+import sys
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch, MagicMock, mock_open
 
@@ -7,10 +11,16 @@ from src.clouds_manager import (
     SAVE_SYNC_FILE,
     get_os_tree,
     sync_folders,
+    sync_cloud,
     sync_locals_folders,
+    watch_locals_folders,
     list_files,
     get_os_path_by_cloud_path,
+    scan_local_tree,
+    get_changed_folders,
+    ProviderOutput,
 )
+from src.sync_state import SyncEntry
 
 
 class TestWorkThisCloud(unittest.TestCase):
@@ -40,6 +50,7 @@ class TestWorkThisCloud(unittest.TestCase):
         self.assertEqual(result, expected)
 
     @patch("builtins.print")
+    @patch("src.clouds_manager.SyncState")
     @patch("src.clouds_manager.get_and_update_sync_folders")
     @patch("src.clouds_manager.get_os_tree")
     @patch("src.clouds_manager.CLOUDS")
@@ -48,6 +59,7 @@ class TestWorkThisCloud(unittest.TestCase):
         mock_clouds,
         mock_get_os_tree,
         mock_get_and_update_sync_folders,
+        mock_sync_state,
         mock_print,
     ):
         mock_get_and_update_sync_folders.return_value = ["D:/folder1", "D:/folder2"]
@@ -55,10 +67,17 @@ class TestWorkThisCloud(unittest.TestCase):
             ["subfolder1", "subfolder2"],
             ["subfolderA", "subfolderB"],
         ]
+        mock_sync_state.return_value.get_entries.return_value = {}
 
         mock_cloud_instance = MagicMock()
+        mock_cloud_instance.errors = 0
 
-        mock_clouds.values.return_value = [lambda folder_full_path: mock_cloud_instance]
+        mock_clouds.items.return_value = [
+            (
+                "yandex",
+                lambda folder_full_path, client=None, planning=False: mock_cloud_instance,
+            )
+        ]
         mock_cloud_instance.get_cloud_tree.side_effect = [
             ["subfolder1", "subfolder3"],
             ["subfolderA"],
@@ -71,12 +90,280 @@ class TestWorkThisCloud(unittest.TestCase):
 
             mock_cloud_instance.check_upload.assert_called()
             mock_cloud_instance.get_cloud_tree.assert_called()
-            mock_cloud_instance.update_dir_on_cloud.assert_called()
-            mock_cloud_instance.remove_old_dir_on_cloud.assert_called()
+            mock_cloud_instance.plan_sync_to_cloud.assert_called()
+
+            plans = mock_cloud_instance.plan_sync_to_cloud.call_args_list
+            self.assertIn((["folder1"], []), [(args[1], args[2]) for args, _ in plans])
 
-            mock_cloud_instance.update_dir_on_cloud.assert_any_call(["folder1"])
-            mock_cloud_instance.remove_old_dir_on_cloud.assert_any_call([])
+        mock_sync_state.assert_called_once_with("yandex")
+        self.assertEqual(mock_sync_state.return_value.replace_entries.call_count, 2)
 
+    @patch("builtins.print")
+    @patch("src.clouds_manager.SyncState")
+    @patch("src.clouds_manager.scan_local_tree")
+    @patch("src.clouds_manager.get_and_update_sync_folders")
+    @patch("src.clouds_manager.CLOUDS")
+    def test_sync_folders_skips_unchanged_folder(
+        self,
+        mock_clouds,
+        mock_get_and_update_sync_folders,
+        mock_scan_local_tree,
+        mock_sync_state,
+        mock_print,
+    ):
+        entries = {
+            "folder1": SyncEntry(is_dir=True),
+            os.path.join("folder1", "file.txt"): SyncEntry(False, 10, 100),
+        }
+        mock_get_and_update_sync_folders.return_value = ["D:/folder1"]
+        mock_scan_local_tree.return_value = entries
+        mock_sync_state.return_value.get_entries.return_value = dict(entries)
+
+        get_cloud = MagicMock()
+        mock_clouds.items.return_value = [("yandex", get_cloud)]
+
+        sync_folders()
+
+        get_cloud.assert_called_once_with("")
+        mock_sync_state.return_value.replace_entries.assert_not_called()
+
+    @patch("src.clouds_manager.SyncState")
+    @patch("src.clouds_manager.get_os_tree", return_value=[])
+    @patch("src.clouds_manager.scan_local_tree", return_value={})
+    @patch("src.clouds_manager.get_and_update_sync_folders")
+    @patch("src.clouds_manager.CLOUDS")
+    def test_sync_folders_concurrent_isolates_errors(
+        self,
+        mock_clouds,
+        mock_get_and_update_sync_folders,
+        mock_scan_local_tree,
+        mock_get_os_tree,
+        mock_sync_state,
+    ):
+        mock_get_and_update_sync_folders.return_value = ["D:/folder1"]
+        mock_sync_state.return_value.get_entries.return_value = {}
+
+        good_cloud = MagicMock()
+        good_cloud.errors = 0
+        bad_cloud = MagicMock()
+        bad_cloud.check_upload.side_effect = Exception("Ошибка 500")
+        mock_clouds.items.return_value = [
+            ("yandex", lambda folder_full_path, client=None, planning=False: bad_cloud),
+            (
+                "dropbox",
+                lambda folder_full_path, client=None, planning=False: good_cloud,
+            ),
+        ]
+
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            failed_clouds = sync_folders(concurrent=True)
+            self.assertIs(sys.stdout, mock_stdout)
+
+        self.assertEqual(failed_clouds, ["yandex"])
+        good_cloud.plan_sync_to_cloud.assert_called_once()
+        self.assertIn(
+            "[yandex] Синхронизация папки folder1 с yandex прервана: Ошибка 500",
+            mock_stdout.getvalue(),
+        )
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.SyncState")
+    @patch("src.clouds_manager.get_os_tree", return_value=[])
+    @patch("src.clouds_manager.scan_local_tree", return_value={})
+    def test_sync_cloud_folders_share_client(
+        self, mock_scan_local_tree, mock_get_os_tree, mock_sync_state, mock_print
+    ):
+        mock_sync_state.return_value.get_entries.return_value = {}
+        base_cloud = MagicMock()
+        clouds = {}
+
+        def get_cloud(folder_full_path, client=None, planning=False):
+            if folder_full_path == "":
+                return base_cloud
+            cloud = MagicMock()
+            cloud.errors = 0
+            if os.path.basename(folder_full_path) == "bad":
+                cloud.plan_sync_to_cloud.side_effect = Exception("Ошибка 500")
+            clouds[folder_full_path] = (cloud, client)
+            return cloud
+
+        folders = [os.path.join("D:", name) for name in ("bad", "a", "b")]
+        success = sync_cloud("yandex", get_cloud, folders, folder_jobs=3)
+
+        self.assertFalse(success)
+        self.assertEqual(set(clouds), set(folders))
+        for cloud, client in clouds.values():
+            self.assertIs(client, base_cloud.client)
+        # ошибка одной папки не мешает сохранить состояние остальных
+        self.assertEqual(mock_sync_state.return_value.replace_entries.call_count, 2)
+        base_cloud.transfers.report.assert_called_once()
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.print_plan")
+    @patch("src.clouds_manager.execute_plan")
+    @patch("src.clouds_manager.SyncState")
+    @patch("src.clouds_manager.get_os_tree", return_value=[])
+    @patch("src.clouds_manager.scan_local_tree", return_value={})
+    def test_sync_cloud_dry_run(
+        self,
+        mock_scan_local_tree,
+        mock_get_os_tree,
+        mock_sync_state,
+        mock_execute_plan,
+        mock_print_plan,
+        mock_print,
+    ):
+        mock_sync_state.return_value.get_entries.return_value = {}
+        cloud = MagicMock()
+        cloud.errors = 0
+        get_cloud = MagicMock(return_value=cloud)
+
+        success = sync_cloud(
+            "yandex",
+            get_cloud,
+            [os.path.join("D:", "folder")],
+            dry_run=True,
+        )
+
+        self.assertTrue(success)
+        get_cloud.assert_called_with(
+            os.path.join("D:", "folder"), get_cloud.return_value.client, planning=True
+        )
+        cloud.check_upload.assert_not_called()
+        mock_print_plan.assert_called_once_with(cloud.plan_sync_to_cloud.return_value)
+        mock_execute_plan.assert_not_called()
+        mock_sync_state.return_value.replace_entries.assert_not_called()
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.hash_cache")
+    @patch("src.clouds_manager.sync_locals_folders")
+    @patch("src.clouds_manager.SyncState")
+    def test_watch_locals_folders(
+        self, mock_sync_state, mock_sync_locals_folders, _, __
+    ):
+        cloud = MagicMock()
+        cloud.wait_for_changes.side_effect = [False, True, True, KeyboardInterrupt]
+        cloud.list_changes.side_effect = [["entry"], None]
+
+        with patch.dict("src.clouds_manager.CLOUDS", {"dropbox": lambda path: cloud}):
+            with self.assertRaises(KeyboardInterrupt):
+                watch_locals_folders("dropbox")
+
+        self.assertIs(cloud.sync_state, mock_sync_state.return_value)
+        cloud.apply_changes_on_pc.assert_called_once_with(["entry"])
+        # при запуске и после сброса листинга на облаке
+        self.assertEqual(mock_sync_locals_folders.call_count, 2)
+        mock_sync_state.return_value.close.assert_called_once()
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.time.sleep")
+    @patch("src.clouds_manager.hash_cache")
+    @patch("src.clouds_manager.sync_locals_folders")
+    @patch("src.clouds_manager.SyncState")
+    def test_watch_locals_folders_survives_api_errors(
+        self, mock_sync_state, mock_sync_locals_folders, _, mock_sleep, __
+    ):
+        cloud = MagicMock()
+        cloud.wait_for_changes.side_effect = [
+            Exception("Ошибка 429: too_many_requests"),
+            Exception("Ошибка 500"),
+            True,
+            KeyboardInterrupt,
+        ]
+        cloud.list_changes.return_value = ["entry"]
+
+        with patch.dict("src.clouds_manager.CLOUDS", {"dropbox": lambda path: cloud}):
+            with self.assertRaises(KeyboardInterrupt):
+                watch_locals_folders("dropbox")
+
+        # пауза растёт, после каждой ошибки дерево сверяется заново
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [30, 60])
+        self.assertEqual(mock_sync_locals_folders.call_count, 3)
+        cloud.apply_changes_on_pc.assert_called_once_with(["entry"])
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.hash_cache")
+    @patch("src.clouds_manager.sync_locals_folders")
+    @patch("src.clouds_manager.SyncState")
+    def test_watch_locals_folders_change_during_resync(
+        self, _, mock_sync_locals_folders, __, ___
+    ):
+        # изменения на облаке после курсора
+        pending = []
+        cloud = MagicMock()
+        cloud.load_tree.side_effect = lambda root: pending.clear()
+        mock_sync_locals_folders.side_effect = lambda name: pending.append("edit")
+        cloud.list_changes.side_effect = lambda root: pending.copy()
+
+        def wait_for_changes(root):
+            if cloud.wait_for_changes.call_count > 1:
+                raise KeyboardInterrupt
+            return bool(pending)
+
+        cloud.wait_for_changes.side_effect = wait_for_changes
+
+        with patch.dict("src.clouds_manager.CLOUDS", {"dropbox": lambda path: cloud}):
+            with self.assertRaises(KeyboardInterrupt):
+                watch_locals_folders("dropbox")
+
+        cloud.apply_changes_on_pc.assert_called_once_with(["edit"])
+
+    def test_provider_output_prefixes_lines(self):
+        stream = io.StringIO()
+        channel = ProviderOutput(stream, "google", threading.Lock())
+
+        channel.write("first line\nsecond")
+        channel.write(" line\n")
+        channel.write("tail")
+        channel.flush()
+
+        self.assertEqual(
+            stream.getvalue(),
+            "[google] first line\n[google] second line\n[google] tail\n",
+        )
+
+    def test_scan_local_tree(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            folder = os.path.join(temp_dir, "folder")
+            os.makedirs(os.path.join(folder, "sub"))
+            with open(os.path.join(folder, "sub", "file.txt"), "wb") as file:
+                file.write(b"content")
+
+            result = scan_local_tree(folder)
+
+        self.assertEqual(
+            set(result),
+            {
+                "folder",
+                os.path.join("folder", "sub"),
+                os.path.join("folder", "sub", "file.txt"),
+            },
+        )
+        self.assertTrue(result[os.path.join("folder", "sub")].is_dir)
+        self.assertEqual(result[os.path.join("folder", "sub", "file.txt")].size, 7)
+
+    def test_get_changed_folders(self):
+        synced_entries = {
+            "folder": SyncEntry(is_dir=True),
+            os.path.join("folder", "same.txt"): SyncEntry(False, 1, 1, "id1", "rev1"),
+            os.path.join("folder", "old"): SyncEntry(is_dir=True),
+            os.path.join("folder", "sub"): SyncEntry(is_dir=True),
+            os.path.join("folder", "sub", "edited.txt"): SyncEntry(False, 1, 1),
+        }
+        local_entries = {
+            "folder": SyncEntry(is_dir=True),
+            os.path.join("folder", "same.txt"): SyncEntry(False, 1, 1),
+            os.path.join("folder", "sub"): SyncEntry(is_dir=True),
+            os.path.join("folder", "sub", "edited.txt"): SyncEntry(False, 2, 2),
+        }
+
+        result = get_changed_folders(local_entries, synced_entries)
+
+        self.assertEqual(
+            result, {os.path.join("folder", "old"), os.path.join("folder", "sub")}
+        )
+
+    @patch("src.clouds_manager.SyncState")
     @patch("src.clouds_manager.CLOUDS")
     @patch("src.clouds_manager.get_and_update_sync_folders")
     @patch("src.clouds_manager.get_os_tree")
@@ -89,8 +376,12 @@ class TestWorkThisCloud(unittest.TestCase):
         mock_get_os_tree,
         mock_get_and_update_sync_folders,
         mock_clouds,
+        mock_sync_state,
     ):
         mock_cloud_instance = MagicMock()
+        mock_cloud_instance.errors = 0
+        mock_cloud_instance.get_revision.return_value = 7
+        mock_sync_state.return_value.get_meta.return_value = "6"
 
         mock_clouds.__getitem__.return_value = (
             lambda folder_full_path: mock_cloud_instance
@@ -114,6 +405,7 @@ class TestWorkThisCloud(unittest.TestCase):
 
         sync_locals_folders("yandex")
 
+        self.assertIs(mock_cloud_instance.sync_state, mock_sync_state.return_value)
         mock_cloud_instance.check_root_folder.assert_called_once()
         mock_cloud_instance.get_cloud_tree.assert_called_once()
         mock_cloud_instance.downloading_folders.assert_called_once_with(["subfolder3"])
@@ -122,6 +414,43 @@ class TestWorkThisCloud(unittest.TestCase):
         mock_rmtree.assert_any_call("D:/folder1/subfolder2")
         mock_get_os_path_by_cloud_path.assert_any_call("subfolder2")
         mock_get_os_path_by_cloud_path.assert_any_call("folder1")
+        mock_sync_state.return_value.set_meta.assert_any_call("pc_revision", "7")
+        mock_sync_state.return_value.set_meta.assert_any_call(
+            "pc_local_tree", unittest.mock.ANY
+        )
+
+    @patch("builtins.print")
+    @patch("src.clouds_manager.sync_cloud_to_pc")
+    @patch("src.clouds_manager.get_and_update_sync_folders")
+    @patch("src.clouds_manager.SyncState")
+    @patch("src.clouds_manager.CLOUDS")
+    def test_sync_locals_folders_same_revision(
+        self, mock_clouds, mock_sync_state, mock_sync_folders, mock_sync_cloud_to_pc, _
+    ):
+        cloud = MagicMock()
+        cloud.errors = 0
+        cloud.get_revision.return_value = 7
+        mock_clouds.__getitem__.return_value = lambda folder_full_path: cloud
+        with tempfile.TemporaryDirectory() as temp_dir:
+            folder = os.path.join(temp_dir, "folder")
+            os.makedirs(folder)
+            mock_sync_folders.return_value = [folder]
+            meta = {}
+            mock_sync_state.return_value.get_meta.side_effect = meta.get
+            mock_sync_state.return_value.set_meta.side_effect = meta.__setitem__
+
+            sync_locals_folders("yandex")
+            # ни облако, ни пк не менялись - дерево облака не обходится
+            sync_locals_folders("yandex")
+            self.assertEqual(mock_sync_cloud_to_pc.call_count, 1)
+
+            # локальную правку синхронизация откатывает, даже если облако прежнее
+            with open(os.path.join(folder, "edited.txt"), "w") as f:
+                f.write("edit")
+            sync_locals_folders("yandex")
+            self.assertEqual(mock_sync_cloud_to_pc.call_count, 2)
+
+        self.assertEqual(meta["pc_revision"], "7")
 
     @patch("src.clouds_manager.CLOUDS")
     def test_list_files(self, mock_clouds):
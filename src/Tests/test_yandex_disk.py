@@ -1,6 +1,10 @@
+import io
 import os
+import tempfile
+import threading
 import unittest
 import datetime
+import zipfile
 from unittest import mock
 from unittest.mock import patch, MagicMock, mock_open
 import requests
@@ -17,7 +21,7 @@ class TestYandexDisk(unittest.TestCase):
         mock_headers.token = "token"
         self.headers = self.disk.headers
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.transport.Transport.get")
     def test_handle_response_success(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -26,7 +30,7 @@ class TestYandexDisk(unittest.TestCase):
         result = self.disk.handle_response(mock_response)
         self.assertEqual(result, {"result": "success"})
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.transport.Transport.get")
     def test_handle_response_error(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 400
@@ -36,7 +40,7 @@ class TestYandexDisk(unittest.TestCase):
             self.disk.handle_response(mock_response)
             mocked_print.assert_called_with("Ошибка 400: Bad request")
 
-    @patch("src.Yandex.yandex_disk.requests.put")
+    @patch("src.transport.Transport.put")
     def test_create_folder_success(self, mock_put):
         mock_response = MagicMock()
         mock_response.status_code = 201
@@ -45,7 +49,7 @@ class TestYandexDisk(unittest.TestCase):
             self.disk.create_folder("test_folder")
             mock_handle_response.assert_called_once_with(mock_response)
 
-    @patch("src.Yandex.yandex_disk.requests.put")
+    @patch("src.transport.Transport.put")
     def test_create_folder_request_exception(self, mock_put):
         mock_put.side_effect = requests.exceptions.RequestException(
             "Error creating folder"
@@ -56,8 +60,8 @@ class TestYandexDisk(unittest.TestCase):
                 "Ошибка при создании папки: Error creating folder"
             )
 
-    @patch("src.Yandex.yandex_disk.requests.get")
-    @patch("src.Yandex.yandex_disk.requests.put")
+    @patch("src.transport.Transport.get")
+    @patch("src.transport.Transport.put")
     def test_upload_file_success(self, mock_put, mock_get):
         mock_response_get = MagicMock()
         mock_response_get.status_code = 200
@@ -68,11 +72,12 @@ class TestYandexDisk(unittest.TestCase):
         mock_response_put.status_code = 201
         mock_put.return_value = mock_response_put
 
-        with patch(
-            "builtins.open", unittest.mock.mock_open(read_data="file_content")
-        ) as mock_file:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            local_file = os.path.join(temp_dir, "local_file.txt")
+            with open(local_file, "wb") as f:
+                f.write(b"file_content")
             with patch.object(self.disk, "handle_response") as mock_handle_response:
-                self.disk.upload_file("local_file.txt", "remote_file.txt")
+                self.disk.upload_file(local_file, "remote_file.txt")
                 mock_get.assert_called_once_with(
                     f"https://cloud-api.yandex.net/v1/disk/resources/upload?path=remote_file.txt&overwrite=False",
                     headers=self.headers,
@@ -80,7 +85,12 @@ class TestYandexDisk(unittest.TestCase):
                 mock_put.assert_called_once()
                 mock_handle_response.assert_called_with(mock_response_put)
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+            # файл уходит телом запроса, а не multipart-формой
+            body = mock_put.call_args.kwargs["data"]
+            self.assertEqual(len(body), 12)
+            self.assertEqual(b"".join(body), b"file_content")
+
+    @patch("src.transport.Transport.get")
     def test_upload_file_request_exception(self, mock_get):
         mock_get.side_effect = requests.exceptions.RequestException(
             "Error getting upload link"
@@ -91,20 +101,123 @@ class TestYandexDisk(unittest.TestCase):
                 "Ошибка при загрузке файла 'local_file.txt': Error getting upload link"
             )
 
-    @patch("src.Yandex.yandex_disk.requests.delete")
+    def test_upload_links_prefetch(self):
+        clock = MagicMock(return_value=0)
+        links = yandex_disk.UploadLinks(self.disk, ahead=2, clock=clock)
+        with patch.object(
+            self.disk, "get_upload_link", side_effect=lambda path, replace: path
+        ) as mock_get_link:
+            for path in ("a", "b", "c", "d"):
+                links.expect(path)
+
+            self.assertEqual(links.get("a"), "a")
+            # ссылки b и c запрошены заранее, пока загружается a
+            self.assertEqual(set(links.links), {("b", False), ("c", False)})
+            self.assertEqual(links.get("b"), "b")
+            self.assertEqual(set(links.links), {("c", False), ("d", False)})
+
+            clock.return_value = yandex_disk.UPLOAD_LINK_TTL + 1
+            self.assertEqual(links.get("c"), "c")
+
+        self.assertEqual(
+            [call.args[0] for call in mock_get_link.call_args_list].count("c"), 2
+        )
+
+    def test_plan_move_discards_upload_link(self):
+        self.disk.upload_links.expect("SYNC/new/a.txt")
+        self.disk.upload_links.expect("SYNC/b.txt")
+        delete = MagicMock(remote="disk:/SYNC/old/a.txt", path="old")
+        upload = MagicMock(args=("/local/a.txt", "SYNC/new/a.txt"), size=1)
+
+        move = self.disk.plan_move(delete, upload)
+
+        self.assertEqual(move.args, ("disk:/SYNC/old/a.txt", "SYNC/new/a.txt"))
+        # ссылка для перемещённого файла заранее не запрашивается
+        self.assertEqual(list(self.disk.upload_links.expected), [("SYNC/b.txt", False)])
+
+    @patch("src.transport.Transport.get")
+    @patch("src.transport.Transport.put")
+    def test_upload_file_expired_link(self, mock_put, mock_get):
+        mock_get.return_value = MagicMock(
+            status_code=200, **{"json.return_value": {"href": "https://new_link"}}
+        )
+        mock_put.side_effect = [MagicMock(status_code=410), MagicMock(status_code=201)]
+
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b"data")
+        self.addCleanup(os.remove, f.name)
+
+        self.disk.upload_file(f.name, "remote_file.txt")
+
+        self.assertEqual(mock_put.call_count, 2)
+        self.assertEqual(mock_put.call_args.args[0], "https://new_link")
+        self.assertEqual(self.disk.errors, 0)
+
+    @patch("src.transport.Transport.get")
+    def test_get_revision(self, mock_get):
+        mock_get.return_value = MagicMock(
+            status_code=200, **{"json.return_value": {"revision": 1712}}
+        )
+
+        self.assertEqual(self.disk.get_revision(), 1712)
+        mock_get.assert_called_once_with(
+            f"{yandex_disk.DISK_URL}?fields=revision", headers=self.headers
+        )
+
+    @patch("src.transport.Transport.delete")
     def test_delete(self, mock_delete):
         with patch("builtins.print") as mocked_print:
             self.disk.delete("/test")
             mocked_print.assert_called_with(f"Ресурс '/test' успешно удален.")
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.Yandex.yandex_disk.time.sleep")
+    @patch("src.transport.Transport.get")
+    @patch("src.transport.Transport.delete")
+    def test_delete_async_operation(self, mock_delete, mock_get, mock_sleep):
+        operation = f"{yandex_disk.DISK_URL}/operations/1"
+        mock_delete.return_value = MagicMock(
+            status_code=202, **{"json.return_value": {"href": operation}}
+        )
+        mock_get.side_effect = [
+            MagicMock(status_code=200, **{"json.return_value": {"status": status}})
+            for status in ("in-progress", "success")
+        ]
+
+        with patch("builtins.print") as mocked_print:
+            self.disk.delete("/big")
+            # папка ещё удаляется на сервере
+            mocked_print.assert_not_called()
+            self.assertEqual(len(self.disk.pending_operations), 1)
+
+            self.disk.wait_operations()
+
+            mocked_print.assert_called_once_with("Ресурс '/big' успешно удален.")
+        self.assertEqual(mock_get.call_count, 2)
+        mock_get.assert_called_with(operation, headers=self.headers)
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertEqual(self.disk.pending_operations, [])
+
+    @patch("src.Yandex.yandex_disk.time.sleep")
+    @patch("src.transport.Transport.get")
+    def test_wait_operations_failed(self, mock_get, _):
+        self.disk.pending_operations = [("https://operation", "done")]
+        mock_get.return_value = MagicMock(
+            status_code=200, **{"json.return_value": {"status": "failed"}}
+        )
+
+        with patch("builtins.print"):
+            self.disk.wait_operations()
+
+        self.assertEqual(self.disk.errors, 1)
+
+    @patch("src.transport.Transport.get")
     def test_download_file_success(self, mock_get):
         mock_response_get = MagicMock()
         mock_response_get.status_code = 200
         mock_response_get.json.return_value = {"href": "https://download_link"}
         mock_get.return_value = mock_response_get
 
-        mock_download_response = MagicMock()
+        mock_download_response = MagicMock(status_code=200)
         mock_download_response.iter_content = lambda chunk_size: [b"file_content"]
         mock_get.return_value = mock_download_response
 
@@ -114,28 +227,47 @@ class TestYandexDisk(unittest.TestCase):
                 mock_handle_response.assert_called_once()
                 mock_file.assert_called_once()
 
-    @patch("os.remove")
-    @patch("src.Yandex.yandex_disk.requests.get")
-    def test_download_folder_success(self, mock_get, remove_mock):
+    @patch("src.transport.Transport.get")
+    def test_download_folder_success(self, mock_get):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("folder/file.txt", b"content")
+        data = archive.getvalue()
         mock_response_get = MagicMock()
         mock_response_get.status_code = 200
         mock_response_get.json.return_value = {"href": "https://download_link"}
-        mock_get.return_value = mock_response_get
-
-        mock_download_response = MagicMock()
-        mock_download_response.content = b"archive_content"
-        mock_get.return_value = mock_download_response
-
-        with patch("builtins.open", mock_open()) as mock_file:
-            with patch("src.Yandex.yandex_disk.zipfile.ZipFile") as mock_zipfile:
-                with patch.object(self.disk, "handle_response") as mock_handle_response:
-                    self.disk.download("folder", "/save_path", is_folder=True)
+        mock_download_response = MagicMock(status_code=200)
+        mock_download_response.iter_content.return_value = [data[:7], data[7:]]
+        mock_get.side_effect = [mock_response_get, mock_download_response]
+
+        with tempfile.TemporaryDirectory() as save_path:
+            self.disk.download("folder", save_path, is_folder=True)
+
+            # архив не остаётся рядом с папкой
+            self.assertEqual(os.listdir(save_path), ["folder"])
+            with open(os.path.join(save_path, "folder", "file.txt"), "rb") as f:
+                self.assertEqual(f.read(), b"content")
+
+        # ссылка на скачивание запрашивается один раз
+        self.assertEqual(mock_get.call_count, 2)
+        mock_get.assert_called_with("https://download_link", stream=True)
+
+    @patch("src.transport.Transport.get")
+    def test_download_file_error(self, mock_get):
+        mock_get.side_effect = [
+            MagicMock(
+                status_code=200,
+                **{"json.return_value": {"href": "https://download_link"}},
+            ),
+            MagicMock(status_code=503, **{"iter_content.return_value": [b"error"]}),
+        ]
 
-                    mock_handle_response.assert_called()
-                    mock_file.assert_called_once_with("/save_path\\archive.zip", "wb")
-                    mock_zipfile.assert_called_once_with("/save_path\\archive.zip", "r")
+        with tempfile.TemporaryDirectory() as save_path:
+            with patch("builtins.print"):
+                self.disk.download("file.txt", save_path, is_folder=False)
 
-                    remove_mock.assert_called_once_with("/save_path\\archive.zip")
+            self.assertEqual(os.listdir(save_path), [])
+        self.assertEqual(self.disk.errors, 1)
 
     @patch.object(YandexDisk, "download")
     @patch("os.path.exists", return_value=False)
@@ -150,7 +282,7 @@ class TestYandexDisk(unittest.TestCase):
 
             self.assertEqual(mock_download.call_count, 2)
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.transport.Transport.get")
     def test_list_files_success(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -193,7 +325,7 @@ class TestYandexDisk(unittest.TestCase):
                     item_modified=mock.ANY,
                 )
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.transport.Transport.get")
     def test_check_root_folder(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -215,7 +347,7 @@ class TestYandexDisk(unittest.TestCase):
 
     @patch.object(YandexDisk, "create_folder")
     @patch.object(YandexDisk, "check_root_folder", return_value=False)
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.transport.Transport.get")
     def test_check_upload(self, mock_get, mock_check_root_folder, mock_create_folder):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -234,37 +366,153 @@ class TestYandexDisk(unittest.TestCase):
             f"{self.disk.ROOT_FOLDER}/{self.disk.dir_name}"
         )
 
-    @patch("src.Yandex.yandex_disk.requests.get")
+    def folders_response(self, folders):
+        """Ответы GET /resources для дерева: путь папки -> записи в ней"""
+
+        def get(url, headers, params):
+            path = params["path"].removeprefix(f"/{self.disk.ROOT_FOLDER}")
+            if path.strip("/") not in folders:
+                return MagicMock(status_code=404)
+            items = folders[path.strip("/")]
+            offset = params["offset"]
+            page = items[offset : offset + params["limit"]]
+            response = MagicMock(status_code=200)
+            response.json.return_value = {"_embedded": {"items": page}}
+            return response
+
+        return get
+
+    @patch("src.transport.Transport.get")
     def test_get_cloud_tree(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "_embedded": {
-                "items": [
-                    {"name": "subfolder1", "type": "dir"},
-                    {"name": "subfolder2", "type": "dir"},
-                ]
+        mock_get.side_effect = self.folders_response(
+            {
+                "root_folder": [
+                    self.dir_item("root_folder/subfolder1"),
+                    self.dir_item("root_folder/subfolder2"),
+                    self.dir_item("root_folder/empty"),
+                    self.file_item("root_folder/c.txt"),
+                ],
+                "root_folder/subfolder1": [
+                    self.file_item("root_folder/subfolder1/a.txt")
+                ],
+                "root_folder/subfolder2": [
+                    self.dir_item("root_folder/subfolder2/inner")
+                ],
+                "root_folder/subfolder2/inner": [],
+                "root_folder/empty": [],
+                "other_folder": [self.dir_item("other_folder/sub")],
             }
-        }
-        mock_get.return_value = mock_response
+        )
 
         tree_list = []
-        folder_name = "root_folder"
+        self.disk.get_cloud_tree("root_folder", tree_list, "")
 
-        with patch.object(
-            self.disk,
-            "handle_response",
-            side_effect=[
-                mock_response.json(),
-                {"_embedded": {"items": []}},
-                {"_embedded": {"items": []}},
+        # пустые папки тоже в дереве, другие папки облака не запрашиваются
+        self.assertEqual(
+            tree_list,
+            [
+                os.path.join("root_folder", "empty"),
+                os.path.join("root_folder", "subfolder1"),
+                os.path.join("root_folder", "subfolder2"),
+                os.path.join("root_folder", "subfolder2", "inner"),
             ],
-        ):
-            self.disk.get_cloud_tree(folder_name, tree_list, "")
+        )
+        paths = {call.kwargs["params"]["path"] for call in mock_get.call_args_list}
+        self.assertNotIn(f"/{self.disk.ROOT_FOLDER}/other_folder", paths)
+
+    @patch("src.transport.Transport.get")
+    def test_list_folder_items_pages(self, mock_get):
+        mock_get.side_effect = self.folders_response(
+            {"folder": [self.file_item("folder/a.txt")] * (yandex_disk.FILES_LIMIT + 1)}
+        )
+
+        items = self.disk.list_folder_items("folder")
+
+        self.assertEqual(len(items), yandex_disk.FILES_LIMIT + 1)
+        self.assertEqual(mock_get.call_count, 2)
+        params = mock_get.call_args.kwargs["params"]
+        self.assertEqual(params["offset"], yandex_disk.FILES_LIMIT)
+        self.assertEqual(params["fields"], yandex_disk.FILES_FIELDS)
+
+    @patch("src.transport.Transport.get")
+    def test_list_tree_request_count(self, mock_get):
+        folders = {
+            "folder": [self.dir_item("folder/a"), self.dir_item("folder/b")]
+            + [self.file_item("folder/f.txt")] * yandex_disk.FILES_LIMIT,
+            "folder/a": [self.dir_item("folder/a/c")],
+            "folder/b": [self.file_item("folder/b/f.txt")] * 5,
+            "folder/a/c": [],
+        }
+        mock_get.side_effect = self.folders_response(folders)
+
+        index = self.disk.list_tree("folder")
+
+        self.assertEqual(set(index), {os.path.join(*f.split("/")) for f in folders})
+        # запрос на каждую страницу каждой папки, число файлов в папке
+        # меньше страницы запросов не добавляет
+        pages = sum(
+            len(items) // yandex_disk.FILES_LIMIT + 1 for items in folders.values()
+        )
+        self.assertEqual(mock_get.call_count, pages)
+        self.assertEqual(pages, 5)
+        # уровни дерева запрашиваются по очереди
+        depths = [
+            call.kwargs["params"]["path"].count("/") for call in mock_get.call_args_list
+        ]
+        self.assertEqual(depths, sorted(depths))
+
+    def test_load_files_index_lists_outside_lock(self):
+        first_started = threading.Event()
+        second_listed = threading.Event()
+        waited = []
+
+        def list_tree(top_folder):
+            if top_folder == "first":
+                first_started.set()
+                # листинг другой папки идёт, пока этот не закончен
+                waited.append(second_listed.wait(2))
+            else:
+                second_listed.set()
+            return {top_folder: []}
+
+        with patch.object(self.disk, "list_tree", side_effect=list_tree) as mock_list:
+            first = threading.Thread(target=self.disk.load_files_index, args=("first",))
+            first.start()
+            first_started.wait(2)
+            second = self.disk.load_files_index("second")
+            first.join()
+            again = self.disk.load_files_index("second")
+
+        self.assertEqual(waited, [True])
+        self.assertEqual(second, {"second": []})
+        self.assertIs(again, second)
+        self.assertEqual(mock_list.call_count, 2)
+
+    @patch("src.transport.Transport.get")
+    def test_list_folder_items_missing(self, mock_get):
+        mock_get.side_effect = self.folders_response({})
+
+        self.assertEqual(self.disk.list_folder_items("folder"), [])
+        self.assertEqual(self.disk.errors, 0)
+
+    @patch("src.transport.Transport.put")
+    def test_create_existing_folder(self, mock_put):
+        mock_put.return_value = MagicMock(status_code=409)
+
+        with patch("builtins.print"):
+            self.disk.create_folder("test_folder")
+
+        self.assertEqual(self.disk.errors, 0)
 
-        self.assertIn(f"root_folder{os.path.sep}subfolder1", tree_list)
-        self.assertIn(f"root_folder{os.path.sep}subfolder2", tree_list)
-        self.assertEqual(len(tree_list), 2)
+    def file_item(self, path):
+        return {
+            "name": path.split("/")[-1],
+            "path": f"disk:/{self.disk.ROOT_FOLDER}/{path}",
+            "type": "file",
+        }
+
+    def dir_item(self, path):
+        return dict(self.file_item(path), type="dir")
 
     @patch.object(YandexDisk, "create_folder")
     @patch.object(YandexDisk, "upload_file")
@@ -283,14 +531,17 @@ class TestYandexDisk(unittest.TestCase):
         mock_create_folder.assert_any_call(f"{self.disk.ROOT_FOLDER}/folder1")
         mock_create_folder.assert_any_call(f"{self.disk.ROOT_FOLDER}/folder2/subfolder")
 
+        # загружается файл по абсолютному пути, а не относительно cwd
         mock_upload_file.assert_any_call(
-            "folder1\\file1.txt", f"{self.disk.ROOT_FOLDER}/folder1/file1.txt"
+            os.path.join("/path/to", "folder1", "file1.txt"),
+            f"{self.disk.ROOT_FOLDER}/folder1/file1.txt",
         )
         mock_upload_file.assert_any_call(
-            "folder1\\file2.txt", f"{self.disk.ROOT_FOLDER}/folder1/file2.txt"
+            os.path.join("/path/to", "folder1", "file2.txt"),
+            f"{self.disk.ROOT_FOLDER}/folder1/file2.txt",
         )
         mock_upload_file.assert_any_call(
-            "folder2/subfolder\\file3.txt",
+            os.path.join("/path/to", "folder2/subfolder", "file3.txt"),
             f"{self.disk.ROOT_FOLDER}/folder2/subfolder/file3.txt",
         )
 
@@ -298,48 +549,50 @@ class TestYandexDisk(unittest.TestCase):
 
     @patch("os.listdir")
     @patch("os.path.isfile", return_value=True)
-    @patch("src.Yandex.yandex_disk.requests.get")
+    @patch("src.transport.Transport.get")
     def test_get_os_and_clouds_files(self, mock_get, mock_isfile, mock_listdir):
         mock_listdir.return_value = ["file1.txt", "file2.txt"]
-
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "_embedded": {
-                "items": [
-                    {"name": "file1.txt", "type": "file", "md5": "abc123"},
-                    {"name": "file3.txt", "type": "file", "md5": "def456"},
-                ]
+        mock_get.side_effect = self.folders_response(
+            {
+                "test_folder": [
+                    self.file_item("test_folder/file1.txt"),
+                    self.file_item("test_folder/file3.txt"),
+                    self.dir_item("test_folder/sub"),
+                ],
+                "test_folder/sub": [self.file_item("test_folder/sub/file4.txt")],
             }
-        }
-        mock_get.return_value = mock_response
+        )
 
         folder_dir = "test_folder"
         full_path = "/local/test_folder"
 
-        with patch.object(
-            self.disk, "handle_response", return_value=mock_response.json()
-        ):
-            os_files, cloud_files = self.disk.get_os_and_clouds_files(
-                folder_dir, full_path
-            )
+        os_files, cloud_files = self.disk.get_os_and_clouds_files(folder_dir, full_path)
+        # дерево папки запрашивается один раз
+        self.disk.get_os_and_clouds_files(os.path.join(folder_dir, "sub"), full_path)
 
-        mock_listdir.assert_called_once_with(full_path)
+        mock_listdir.assert_called_with(full_path)
         self.assertEqual(os_files, ["file1.txt", "file2.txt"])
 
-        mock_get.assert_called_once_with(
-            f"{URL}?path=/{self.disk.ROOT_FOLDER}/test_folder", headers=self.headers
+        self.assertEqual(mock_get.call_count, 2)
+        mock_get.assert_any_call(
+            URL,
+            headers=self.headers,
+            params={
+                "path": f"/{self.disk.ROOT_FOLDER}/test_folder",
+                "limit": yandex_disk.FILES_LIMIT,
+                "offset": 0,
+                "fields": yandex_disk.FILES_FIELDS,
+            },
         )
         self.assertEqual(len(cloud_files), 2)
         self.assertEqual(cloud_files[0]["name"], "file1.txt")
         self.assertEqual(cloud_files[1]["name"], "file3.txt")
 
     @patch("os.path.getmtime", return_value=1609459200)
-    @patch("builtins.open", new_callable=mock_open, read_data=b"test content")
-    @patch("hashlib.md5")
-    def test_get_data_for_comparison(self, mock_md5, mock_open, mock_getmtime):
+    @patch("src.Yandex.yandex_disk.hash_cache")
+    def test_get_data_for_comparison(self, mock_hash_cache, mock_getmtime):
 
-        mock_md5.return_value.hexdigest.return_value = "abc123"
+        mock_hash_cache.md5.return_value = "abc123"
 
         os_path_file = "/local/test_folder/file1.txt"
         cloud_file = {
@@ -361,7 +614,7 @@ class TestYandexDisk(unittest.TestCase):
 
         self.assertEqual(cloud_modified_time, expected_cloud_time)
 
-        mock_open.assert_called_once_with(os_path_file, "rb")
+        mock_hash_cache.md5.assert_called_once_with(os_path_file)
         self.assertEqual(os_file_md5, "abc123")
         self.assertEqual(cloud_file_md5, "abc123")
 
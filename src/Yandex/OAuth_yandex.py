@@ -11,13 +11,19 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 class YandexHeadersManager:
     def __init__(self):
         self.token_manager = YandexTokenManager()
+        self._refresh_lock = threading.Lock()
 
     @property
     def token(self):
         return self.token_manager.get_access_token()
 
-    def refresh_token(self):
-        self.token_manager.refresh_token()
+    def refresh_token(self, expired_token=None):
+        """Обновляет токен один раз, даже если он истёк сразу в нескольких потоках"""
+        with self._refresh_lock:
+            # пока ждали блокировку, токен мог обновить другой поток
+            if expired_token is not None and self.token != expired_token:
+                return
+            self.token_manager.refresh_token()
 
 
 class YandexTokenManager:
@@ -0,0 +1,99 @@
+import datetime
+import json
+import os
+
+from src.async_cloud_interface import AsyncCloudInterface, RemoteEntry, MAX_REQUESTS
+from src.hash_cache import hash_cache
+from src.Yandex.OAuth_yandex import YandexHeadersManager
+from src.Yandex.yandex_disk import URL
+
+LIST_LIMIT = 1000
+LIST_FIELDS = ",".join(
+    f"_embedded.items.{field}" for field in ("name", "type", "size", "md5", "modified")
+)
+
+
+class AsyncYandexDisk(AsyncCloudInterface):
+    AUTH_SCHEME = "OAuth"
+
+    def __init__(self, client=None, max_requests=MAX_REQUESTS):
+        super().__init__(
+            client if client is not None else YandexHeadersManager(), max_requests
+        )
+        from src.clouds_manager import ROOT_FOLDER
+
+        self.ROOT_FOLDER = ROOT_FOLDER
+
+    def cloud_path(self, path):
+        return f"{self.ROOT_FOLDER}/{path}" if path else self.ROOT_FOLDER
+
+    async def call(self, method, url, allowed=(), **params):
+        """Запрос к API, статусы из allowed ошибкой не считаются"""
+        status, body = await self.send(
+            method, url, headers={"Accept": "application/json"}, params=params
+        )
+        data = json.loads(body) if body else {}
+        if 200 <= status < 300 or status in allowed:
+            return status, data
+        raise Exception(
+            f"Ошибка {status}: {data.get('message', 'Нет описания ошибки')}"
+        )
+
+    async def list_folder(self, path):
+        entries = []
+        while True:
+            status, data = await self.call(
+                "GET",
+                URL,
+                allowed=(404,),
+                path=self.cloud_path(path),
+                limit=LIST_LIMIT,
+                offset=len(entries),
+                fields=LIST_FIELDS,
+            )
+            if status == 404:
+                return []
+
+            items = data["_embedded"]["items"]
+            entries += [
+                RemoteEntry(
+                    item["name"],
+                    item["type"] == "dir",
+                    item.get("size"),
+                    datetime.datetime.fromisoformat(item["modified"]),
+                    item.get("md5"),
+                )
+                for item in items
+            ]
+            if len(items) < LIST_LIMIT:
+                return entries
+
+    async def create_folder(self, path):
+        await self.call("PUT", URL, allowed=(409,), path=self.cloud_path(path))
+
+    async def upload_file(self, os_path, path):
+        _, link = await self.call(
+            "GET", f"{URL}/upload", path=self.cloud_path(path), overwrite="true"
+        )
+        status, _ = await self.send("PUT", link["href"], upload=os_path)
+        if status not in (201, 202):
+            raise Exception(f"Ошибка {status}: файл {path} не загружен")
+
+    async def download_file(self, path, os_path):
+        _, link = await self.call("GET", f"{URL}/download", path=self.cloud_path(path))
+        status, _ = await self.send("GET", link["href"], save_to=os_path)
+        if status != 200:
+            raise Exception(f"Ошибка {status}: файл {path} не скачан")
+
+    async def delete(self, path):
+        await self.call(
+            "DELETE",
+            URL,
+            allowed=(404,),
+            path=self.cloud_path(path),
+        )
+
+    def same_file(self, os_path, entry):
+        if entry.size != os.path.getsize(os_path):
+            return False
+        return entry.digest == hash_cache.md5(os_path)
@@ -1,24 +1,125 @@
-import hashlib
+import concurrent.futures
 import os
 import datetime
+import tempfile
+import threading
+import time
 import urllib
+import weakref
 
 import requests
 import zipfile
 from src.cloud_interface import CloudInterface
+from src.hash_cache import hash_cache
+from src.sync_plan import Operation, MKDIR, UPLOAD, REPLACE, DELETE, DOWNLOAD, MOVE
+from src.transfer import get_transfer_executor, file_size, remove_nested_folders
+from src.transport import get_transport, FileBody
 from src.Yandex.OAuth_yandex import YandexHeadersManager
 
-URL = "https://cloud-api.yandex.net/v1/disk/resources"
+DISK_URL = "https://cloud-api.yandex.net/v1/disk"
+URL = f"{DISK_URL}/resources"
+FILES_LIMIT = 1000
+FILES_FIELDS = ",".join(
+    f"_embedded.items.{field}"
+    for field in ("name", "path", "type", "size", "md5", "modified", "resource_id")
+)
+# папки одного уровня дерева запрашиваются параллельно в этом пуле
+LIST_POOL = "YandexDiskListing"
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# сколько ссылок на загрузку запрашивается заранее, пока идут загрузки
+UPLOAD_LINKS_AHEAD = 16
+UPLOAD_LINKS_POOL = "YandexDiskUploadLinks"
+# ссылка на загрузку действует 30 минут, берём с запасом
+UPLOAD_LINK_TTL = 25 * 60
+
+# пауза между проверками асинхронных операций растёт до OPERATION_POLL_MAX_DELAY
+OPERATION_POLL_DELAY = 0.5
+OPERATION_POLL_MAX_DELAY = 10
+
+# содержимое папок облака общее для всех его папок за одну синхронизацию:
+# клиент -> {папка: Future с её содержимым}
+_files_indexes = weakref.WeakKeyDictionary()
+_files_indexes_lock = threading.Lock()
+
+
+class UploadLinks:
+    """Ссылки на загрузку, полученные заранее.
+
+    Пока идут PUT одних файлов, для следующих по плану файлов
+    уже запрашиваются href, и загрузка не ждёт лишний запрос"""
+
+    def __init__(self, cloud, ahead=UPLOAD_LINKS_AHEAD, clock=time.monotonic):
+        self.cloud = cloud
+        self.ahead = ahead
+        self.clock = clock
+        self.lock = threading.Lock()
+        # ключи (savefile, replace), упорядоченные как в плане
+        self.expected = {}
+        self.links = {}
+
+    def expect(self, savefile, replace=False):
+        with self.lock:
+            self.expected[(savefile, replace)] = None
+
+    def discard(self, savefile, replace=False):
+        """Ссылка для savefile больше не нужна, например загрузку
+        заменило перемещение"""
+        key = (savefile, replace)
+        with self.lock:
+            self.expected.pop(key, None)
+            future = self.links.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def get(self, savefile, replace=False):
+        """Ссылка для загрузки, заранее полученная или новая, если её нет
+        или она устарела"""
+        key = (savefile, replace)
+        with self.lock:
+            future = self.links.pop(key, None)
+            self.expected.pop(key, None)
+            self.prefetch()
+
+        if future is not None:
+            try:
+                href, received = future.result()
+            except requests.exceptions.RequestException:
+                href = None
+            if href and self.clock() - received < UPLOAD_LINK_TTL:
+                return href
+        return self.cloud.get_upload_link(savefile, replace)
+
+    def prefetch(self):
+        transfers = get_transfer_executor(UPLOAD_LINKS_POOL)
+        while self.expected and len(self.links) < self.ahead:
+            key = next(iter(self.expected))
+            del self.expected[key]
+            self.links[key] = transfers.submit(0, self.fetch, key)
+
+    def fetch(self, key):
+        return self.cloud.get_upload_link(*key), self.clock()
 
 
 class YandexDisk(CloudInterface):
-    def __init__(self, dir_name, full_path):
+    HASH_ALGORITHM = "md5"
+
+    def __init__(self, dir_name, full_path, client=None, planning=False):
         self.dir_name = dir_name
         self.full_path = full_path
         from src.clouds_manager import ROOT_FOLDER
 
         self.ROOT_FOLDER = ROOT_FOLDER
-        self.TOKEN = YandexHeadersManager().token
+        self.remote_files = {}
+        self.transfers = get_transfer_executor(self.__class__.__name__)
+        self.transport = get_transport(self.__class__.__name__)
+        self.upload_links = UploadLinks(self)
+        self.pending_operations = []
+        self.operations_lock = threading.Lock()
+        self.planning = planning
+        # менеджер токена общий для всех папок облака
+        self.client = client if client is not None else YandexHeadersManager()
+        self.TOKEN = self.client.token
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "application/json",
@@ -34,12 +135,11 @@ class YandexDisk(CloudInterface):
 
             if response.status_code == 401 and retry_on_401:
                 print("Ошибка 401: токен истёк. Обновление токена...")
-                manager = YandexHeadersManager()
-                manager.refresh_token()
-                global TOKEN
-                TOKEN = manager.token
+                self.client.refresh_token(self.TOKEN)
+                self.TOKEN = self.client.token
+                self.headers["Authorization"] = f"OAuth {self.TOKEN}"
 
-                retry_response = requests.request(
+                retry_response = self.transport.request(
                     method=response.request.method,
                     url=response.request.url,
                     headers=self.headers,
@@ -47,6 +147,7 @@ class YandexDisk(CloudInterface):
 
                 return self.handle_response(retry_response, retry_on_401=False)
 
+            self.errors += 1
             print(
                 f"Ошибка {response.status_code}: {error_info.get('message', 'Нет описания ошибки')}"
             )
@@ -54,10 +155,15 @@ class YandexDisk(CloudInterface):
     def create_folder(self, path):
         """Создание папки. \n path: Путь к создаваемой папке."""
         try:
-            response = requests.put(f"{URL}?path={path}", headers=self.headers)
+            response = self.transport.put(f"{URL}?path={path}", headers=self.headers)
+            if response.status_code == 409:
+                # папку могли создать на облаке уже после листинга
+                print(f"Папка '{path}' уже существует.")
+                return
             self.handle_response(response)
             print(f"Папка '{path}' успешно создана.")
         except requests.exceptions.RequestException as e:
+            self.errors += 1
             print(f"Ошибка при создании папки: {e}")
 
     def upload_file(self, loadfile, savefile, replace=False):
@@ -66,98 +172,150 @@ class YandexDisk(CloudInterface):
         loadfile: Путь к файлу на Диске
         replace: true or false Замена файла на Диске"""
         try:
-            # Получаем ссылку на загрузку
-            response = requests.get(
-                f"{URL}/upload?path={savefile}&overwrite={replace}",
-                headers=self.headers,
-            )
-            res = self.handle_response(response)
-            href = res.get("href")
+            href = self.upload_links.get(savefile, replace)
             if href:
-                with open(loadfile, "rb") as f:
-                    upload_response = requests.put(href, files={"file": f})
-                    self.handle_response(upload_response)
-                    print(
-                        f"Файл '{os.path.basename(loadfile)}' успешно загружен как '{savefile}'."
-                    )
+                body = FileBody(loadfile)
+                started = time.monotonic()
+                upload_response = self.transport.put(href, data=body)
+                if upload_response.status_code in (404, 410):
+                    # ссылка истекла раньше срока, получаем новую
+                    href = self.get_upload_link(savefile, replace)
+                    started = time.monotonic()
+                    upload_response = self.transport.put(href, data=body)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.handle_response(upload_response)
+                print(
+                    f"Файл '{os.path.basename(loadfile)}' успешно загружен как '{savefile}' "
+                    f"({len(body) / 1024 / 1024 / elapsed:.2f} МБ/с)."
+                )
         except requests.exceptions.RequestException as e:
+            self.errors += 1
             print(f"Ошибка при загрузке файла '{loadfile}': {e}")
 
+    def get_upload_link(self, savefile, replace=False):
+        response = self.transport.get(
+            f"{URL}/upload?path={savefile}&overwrite={replace}",
+            headers=self.headers,
+        )
+        return (self.handle_response(response) or {}).get("href")
+
     def delete(self, path):
         """Удаление папки/файла"""
         try:
-            response = requests.delete(f"{URL}?path={path}", headers=self.headers)
-            self.handle_response(response)
-            print(f"Ресурс '{path}' успешно удален.")
+            response = self.transport.delete(f"{URL}?path={path}", headers=self.headers)
+            result = self.handle_response(response)
+            self.finish_or_track(result, f"Ресурс '{path}' успешно удален.")
         except requests.exceptions.RequestException as e:
+            self.errors += 1
             print(f"Ошибка при удалении ресурса '{path}': {e}")
 
-    def download(self, downloaded_path, save_path, is_folder):
-        response = requests.get(
-            f"{URL}/download?path={self.ROOT_FOLDER}/{downloaded_path}",
-            headers=self.headers,
-        )
-        res = self.handle_response(response)
-        href = res.get("href")
-
-        if not href:
-            print(f"Не удалось получить ссылку на скачивание {downloaded_path}")
-
-        if is_folder:
-            try:
-                # Получаем ссылку на скачивание
-                response = requests.get(
-                    f"{URL}/download?path={self.ROOT_FOLDER}/{downloaded_path}",
-                    headers=self.headers,
-                )
-                res = self.handle_response(response)
-                href = res.get("href")
-
-                if href:
-                    download_response = requests.get(href)
-                    archive_path = os.path.join(save_path, "archive.zip")
-
-                    # Сохраняем файл на диск
-                    with open(archive_path, "wb") as file:
-                        file.write(download_response.content)
-                    # print(f"Файл '{archive_path}' успешно скачан.")
-
-                    # Распаковываем ZIP-архив
-                    with zipfile.ZipFile(archive_path, "r") as zip_ref:
-                        zip_ref.extractall(save_path)
-                    # print(f"Архив распакован в '{save_path}'.")
-
-                    # Удаляем скачанный ZIP-файл после распаковки
-                    os.remove(archive_path)
-                    # print(f"Архив '{archive_path}' удален после распаковки.")
-                    print(f"Папка {os.path.split(downloaded_path)[1]} успешно скачана")
+    def move(self, from_path, path):
+        """Перемещение папки/файла на диске без повторной загрузки"""
+        try:
+            response = self.transport.post(
+                f"{URL}/move?from={from_path}&path={path}&overwrite=true",
+                headers=self.headers,
+            )
+            result = self.handle_response(response)
+            self.finish_or_track(result, f"Ресурс '{from_path}' перемещён в '{path}'.")
+        except requests.exceptions.RequestException as e:
+            self.errors += 1
+            print(f"Ошибка при перемещении ресурса '{from_path}': {e}")
+
+    def finish_or_track(self, result, message):
+        """Большие папки диск удаляет и перемещает асинхронно (202):
+        такая операция запоминается и проверяется в wait_operations"""
+        href = (result or {}).get("href", "")
+        if f"{DISK_URL}/operations/" not in href:
+            print(message)
+            return
+        with self.operations_lock:
+            self.pending_operations.append((href, message))
+
+    def wait_operations(self):
+        """Ждёт асинхронные операции диска: все опрашиваются вместе,
+        пауза между опросами растёт до OPERATION_POLL_MAX_DELAY"""
+        with self.operations_lock:
+            pending, self.pending_operations = self.pending_operations, []
+        delay = OPERATION_POLL_DELAY
+        while pending:
+            time.sleep(delay)
+            delay = min(delay * 2, OPERATION_POLL_MAX_DELAY)
+            in_progress = []
+            for href, message in pending:
+                try:
+                    response = self.transport.get(href, headers=self.headers)
+                    status = (self.handle_response(response) or {}).get("status")
+                except requests.exceptions.RequestException as e:
+                    self.errors += 1
+                    print(f"Ошибка при проверке операции диска: {e}")
+                    continue
+                if status == "success":
+                    print(message)
+                elif status == "failed":
+                    self.errors += 1
+                    print(f"Операция диска не выполнена: {message}")
+                elif status is None:
+                    # handle_response уже вывел и посчитал ошибку
+                    continue
                 else:
-                    print("Не удалось получить ссылку на скачивание.")
-            except requests.exceptions.RequestException as e:
-                print(f"Ошибка при скачивании файла: {e}")
-            except zipfile.BadZipFile:
+                    in_progress.append((href, message))
+            pending = in_progress
+
+    def download(self, downloaded_path, save_path, is_folder):
+        try:
+            response = self.transport.get(
+                f"{URL}/download?path={self.ROOT_FOLDER}/{downloaded_path}",
+                headers=self.headers,
+            )
+            res = self.handle_response(response)
+            href = res.get("href") if res else None
+            if not href:
+                print(f"Не удалось получить ссылку на скачивание {downloaded_path}")
+                return
+
+            download_response = self.transport.get(href, stream=True)
+            if download_response.status_code != 200:
+                # страницу ошибки не сохраняем вместо файла
+                self.errors += 1
                 print(
-                    f"Файл по пути '{archive_path}' не является корректным ZIP-архивом."
+                    f"Ошибка {download_response.status_code}: "
+                    f"{downloaded_path} не скачан"
                 )
+                return
+            if is_folder:
+                # архив пишется во временный файл по мере получения,
+                # оглавление zip в конце, поэтому распаковка после загрузки
+                with tempfile.TemporaryFile(dir=save_path) as archive:
+                    for chunk in download_response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        archive.write(chunk)
+                    archive.seek(0)
+                    with zipfile.ZipFile(archive) as zip_ref:
+                        zip_ref.extractall(save_path)
+                print(f"Папка {os.path.split(downloaded_path)[1]} успешно скачана")
+                return
 
-        else:
             file_name = urllib.parse.unquote(href.split("filename=")[1].split("&")[0])
             file_save_path = os.path.join(save_path, file_name)
 
             with open(file_save_path, "wb") as file:
-                download_response = requests.get(href, stream=True)
-                for chunk in download_response.iter_content(chunk_size=1024):
-                    if chunk:
-                        file.write(chunk)
-                        file.flush()
+                for chunk in download_response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
 
             print(f"Файл {file_name} успешно скачан в {file_save_path}")
+        except requests.exceptions.RequestException as e:
+            self.errors += 1
+            print(f"Ошибка при скачивании файла: {e}")
+        except zipfile.BadZipFile:
+            self.errors += 1
+            print(
+                f"Архив папки '{downloaded_path}' не является корректным ZIP-архивом."
+            )
 
-    def downloading_folders(self, download_folders):
-        download_folders = sorted(
-            download_folders, key=lambda input_str: input_str.count(os.path.sep)
-        )
-        for clouds_folder in download_folders:
+    def plan_downloading_folders(self, download_folders):
+        # архив папки содержит и вложенные папки, поэтому скачиваем только верхние
+        operations = []
+        for clouds_folder in remove_nested_folders(download_folders):
             from src.clouds_manager import get_os_path_by_cloud_path
 
             root_path = get_os_path_by_cloud_path(
@@ -165,11 +323,20 @@ class YandexDisk(CloudInterface):
             )  # D:\...\SyncFolder\clouds_folder[1:]
             if os.path.exists(root_path):
                 continue
-            self.download(
-                clouds_folder.replace("\\", "/"),
-                os.path.sep.join(root_path.split(os.path.sep)[:-1]),
-                is_folder=True,
+            operations.append(
+                Operation(
+                    DOWNLOAD,
+                    clouds_folder,
+                    self.download,
+                    (
+                        clouds_folder.replace("\\", "/"),
+                        os.path.sep.join(root_path.split(os.path.sep)[:-1]),
+                    ),
+                    {"is_folder": True},
+                    on_pc=True,
+                )
             )
+        return operations
 
     def list_files(self, path):
         """Выводит информацию о файлах и папках по заданному пути."""
@@ -177,7 +344,7 @@ class YandexDisk(CloudInterface):
         path = path.replace(os.path.sep, "/")
 
         try:
-            response = requests.get(
+            response = self.transport.get(
                 f"{URL}?path={path}&limit=1000", headers=self.headers
             )
             folder_info = self.handle_response(response)
@@ -205,17 +372,25 @@ class YandexDisk(CloudInterface):
             print(f"Ошибка при получении информации о папке: {e}")
 
     def check_root_folder(self):
-        response = requests.get(f"{URL}?path=/", headers=self.headers)
+        response = self.transport.get(f"{URL}?path=/", headers=self.headers)
         items = self.handle_response(response)
         return self.ROOT_FOLDER in [
             item["name"] for item in items["_embedded"]["items"]
         ]
 
+    def get_revision(self):
+        response = self.transport.get(
+            f"{DISK_URL}?fields=revision", headers=self.headers
+        )
+        return (self.handle_response(response) or {}).get("revision")
+
     def check_upload(self):
         if not self.check_root_folder():
             self.create_folder(f"{self.ROOT_FOLDER}")
 
-        response = requests.get(f"{URL}?path=/{self.ROOT_FOLDER}", headers=self.headers)
+        response = self.transport.get(
+            f"{URL}?path=/{self.ROOT_FOLDER}", headers=self.headers
+        )
         items = self.handle_response(response)
         if self.dir_name not in [item["name"] for item in items["_embedded"]["items"]]:
             self.create_folder(f"{self.ROOT_FOLDER}/{self.dir_name}")
@@ -226,27 +401,86 @@ class YandexDisk(CloudInterface):
         root += folder_name + os.path.sep
         if folder_name == "":
             root = ""
-        # получаем список папок
-        request = requests.get(
-            f'{URL}?path=/{self.ROOT_FOLDER}/{root.replace(os.path.sep, "/")}',
-            headers=self.headers,
-        )
-        response = self.handle_response(request)
-
-        items = response["_embedded"]["items"]
-
-        for item in items:
-            if item["type"] != "dir":
-                continue
-            tree_list.append(root + item["name"])
-            folder_name = item["name"]
-            self.get_cloud_tree(folder_name, tree_list, root)
-
-    def upload_dir_on_cloud(self, upload_folders):
-        upload_folders = sorted(
-            upload_folders, key=lambda input_str: input_str.count(os.path.sep)
+        index = self.load_files_index(root.split(os.path.sep)[0])
+        tree_list += sorted(
+            folder
+            for folder in index
+            if folder.startswith(root) and folder != root.rstrip(os.path.sep)
         )
 
+    def load_files_index(self, top_folder):
+        """Содержимое папок отслеживаемой папки top_folder ("" - всего ROOT_FOLDER):
+        путь папки как в sync_folders -> записи файлов и папок в ней"""
+        # под блокировкой только выбираем листинг, сам обход идёт без неё,
+        # чтобы не задерживать листинги других папок
+        with _files_indexes_lock:
+            indexes = _files_indexes.setdefault(self.client, {})
+            if "" in indexes:
+                top_folder = ""
+            index = indexes.get(top_folder)
+            owner = index is None
+            if owner:
+                index = indexes[top_folder] = concurrent.futures.Future()
+
+        if owner:
+            try:
+                index.set_result(self.list_tree(top_folder))
+            except Exception as e:
+                # следующая папка попробует листинг заново
+                with _files_indexes_lock:
+                    indexes.pop(top_folder, None)
+                index.set_exception(e)
+                raise
+        return index.result()
+
+    def list_tree(self, folder):
+        """Обходит дерево folder по уровням, папки одного уровня
+        запрашиваются параллельно. Пустые папки тоже попадают в дерево"""
+        transfers = get_transfer_executor(LIST_POOL)
+        index = {}
+        level = [folder]
+        while level:
+            futures = {f: transfers.submit(0, self.list_folder_items, f) for f in level}
+            level = []
+            for folder_dir, future in futures.items():
+                items = future.result()
+                index[folder_dir] = items
+                level += [
+                    os.path.join(folder_dir, item["name"])
+                    for item in items
+                    if item["type"] == "dir"
+                ]
+        return index
+
+    def list_folder_items(self, folder_dir):
+        """Содержимое одной папки постранично, только нужные поля записей"""
+        path = f"/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, '/')}"
+        items = []
+        while True:
+            response = self.transport.get(
+                URL,
+                headers=self.headers,
+                params={
+                    "path": path.rstrip("/"),
+                    "limit": FILES_LIMIT,
+                    "offset": len(items),
+                    "fields": FILES_FIELDS,
+                },
+            )
+            if response.status_code == 404:
+                # папки ещё нет на облаке
+                return items
+            result = self.handle_response(response)
+            if result is None:
+                raise Exception(f"Не удалось получить содержимое папки {path}")
+
+            page = result.get("_embedded", {}).get("items", [])
+            items += page
+            if len(page) < FILES_LIMIT:
+                return items
+
+    def plan_upload_dir_on_cloud(self, upload_folders):
+        operations = []
         for folder_dir in upload_folders:
             path = f"{os.path.sep.join(self.full_path.split(os.path.sep)[:-1])}{os.path.sep}{folder_dir}"
 
@@ -254,16 +488,33 @@ class YandexDisk(CloudInterface):
                 f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))
             ]
 
-            self.create_folder(
-                f'{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}'
+            operations.append(
+                Operation(
+                    MKDIR,
+                    folder_dir,
+                    self.create_folder,
+                    (f'{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}',),
+                )
             )
 
             for file_name in files:
                 path_to_file_os = f"{folder_dir}\\{file_name}"
-                self.upload_file(
-                    path_to_file_os,
-                    self.ROOT_FOLDER + "/" + path_to_file_os.replace(os.path.sep, "/"),
+                os_path = os.path.join(path, file_name)
+                savefile = (
+                    self.ROOT_FOLDER + "/" + path_to_file_os.replace(os.path.sep, "/")
                 )
+                self.upload_links.expect(savefile)
+                operations.append(
+                    Operation(
+                        UPLOAD,
+                        os.path.join(folder_dir, file_name),
+                        self.upload_file,
+                        (os_path, savefile),
+                        size=file_size(os_path),
+                        os_path=os_path,
+                    )
+                )
+        return operations
 
     def get_os_and_clouds_files(self, folder_dir, full_path):
         os_files = [
@@ -272,13 +523,8 @@ class YandexDisk(CloudInterface):
             if os.path.isfile(os.path.join(full_path, f))
         ]
 
-        request = requests.get(
-            f'{URL}?path=/{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}',
-            headers=self.headers,
-        )
-        response = self.handle_response(request)
-
-        cloud_files = [f for f in response["_embedded"]["items"] if f["type"] == "file"]
+        index = self.load_files_index(folder_dir.split(os.path.sep)[0])
+        cloud_files = [f for f in index.get(folder_dir, []) if f["type"] == "file"]
 
         return os_files, cloud_files
 
@@ -291,12 +537,13 @@ class YandexDisk(CloudInterface):
         )
         cloud_modified_time = datetime.datetime.fromisoformat(cloud_file["modified"])
 
-        os_file_md5 = hashlib.md5(open(os_path_file, "rb").read()).hexdigest()
+        os_file_md5 = hash_cache.md5(os_path_file)
         cloud_file_md5 = cloud_file["md5"]
 
         return os_modified_time, cloud_modified_time, os_file_md5, cloud_file_md5
 
-    def update_dir_on_cloud(self, exact_folders):
+    def plan_update_dir_on_cloud(self, exact_folders):
+        operations = []
         for folder_dir in exact_folders:
             full_path = (
                 os.path.sep.join(self.full_path.split(os.path.sep)[:-1])
@@ -313,26 +560,66 @@ class YandexDisk(CloudInterface):
 
             for cloud_file in refresh_files:
                 os_path_file = os.path.join(full_path, cloud_file["name"])
-                os_modified_time, cloud_modified_time, os_file_md5, cloud_file_md5 = (
-                    self.get_data_for_comparison(os_path_file, cloud_file)
-                )
+                (
+                    os_modified_time,
+                    cloud_modified_time,
+                    os_file_md5,
+                    cloud_file_md5,
+                ) = self.get_data_for_comparison(os_path_file, cloud_file)
 
                 if (os_modified_time > cloud_modified_time) or (
                     cloud_file_md5 != os_file_md5
                 ):
                     #  на диске нет обновления файла, можно только загрузить и заменить:(
-                    self.upload_file(os_path_file, cloud_file["path"], replace=True)
+                    self.upload_links.expect(cloud_file["path"], True)
+                    operations.append(
+                        Operation(
+                            REPLACE,
+                            os.path.join(folder_dir, cloud_file["name"]),
+                            self.upload_file,
+                            (os_path_file, cloud_file["path"]),
+                            {"replace": True},
+                            size=file_size(os_path_file),
+                        )
+                    )
+                else:
+                    self.remote_files[os.path.join(folder_dir, cloud_file["name"])] = (
+                        cloud_file.get("resource_id"),
+                        cloud_file_md5,
+                    )
 
             for remove_file in remove_files:
-                self.delete(remove_file["path"])
+                operations.append(
+                    Operation(
+                        DELETE,
+                        os.path.join(folder_dir, remove_file["name"]),
+                        self.delete,
+                        (remove_file["path"],),
+                        flush=self.wait_operations,
+                        size=remove_file.get("size", 0),
+                        digest=remove_file.get("md5"),
+                        remote=remove_file["path"],
+                    )
+                )
 
             for file_name in upload_files:
-                self.upload_file(
-                    os.path.join(full_path, file_name),
-                    f'{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}/{file_name}',
+                os_path = os.path.join(full_path, file_name)
+                savefile = f'{self.ROOT_FOLDER}/{folder_dir.replace(os.path.sep, "/")}/{file_name}'
+                self.upload_links.expect(savefile)
+                operations.append(
+                    Operation(
+                        UPLOAD,
+                        os.path.join(folder_dir, file_name),
+                        self.upload_file,
+                        (os_path, savefile),
+                        size=file_size(os_path),
+                        os_path=os_path,
+                    )
                 )
+        return operations
 
-    def update_dir_on_pc(self, exact_folders):
+    def plan_update_dir_on_pc(self, exact_folders):
+        operations = []
         for folder_dir in exact_folders:
             from src.clouds_manager import get_os_path_by_cloud_path
 
@@ -347,35 +634,88 @@ class YandexDisk(CloudInterface):
 
             for cloud_file in refresh_files:
                 os_path_file = os.path.join(full_path, cloud_file["name"])
-                os_modified_time, cloud_modified_time, os_file_md5, cloud_file_md5 = (
-                    self.get_data_for_comparison(os_path_file, cloud_file)
-                )
+                (
+                    os_modified_time,
+                    cloud_modified_time,
+                    os_file_md5,
+                    cloud_file_md5,
+                ) = self.get_data_for_comparison(os_path_file, cloud_file)
 
                 if (os_modified_time < cloud_modified_time) or (
                     cloud_file_md5 != os_file_md5
                 ):
-                    self.download(
-                        cloud_file["path"].split(self.ROOT_FOLDER)[-1][1:],
-                        full_path,
-                        is_folder=False,
+                    operations.append(
+                        Operation(
+                            DOWNLOAD,
+                            os.path.join(folder_dir, cloud_file["name"]),
+                            self.download,
+                            (
+                                cloud_file["path"].split(self.ROOT_FOLDER)[-1][1:],
+                                full_path,
+                            ),
+                            {"is_folder": False},
+                            size=cloud_file.get("size", 0),
+                            on_pc=True,
+                        )
                     )
 
             for remove_file in remove_files:
-                os.remove(f"{full_path}{os.path.sep}{remove_file}")
+                operations.append(
+                    Operation(
+                        DELETE,
+                        os.path.join(folder_dir, remove_file),
+                        os.remove,
+                        (f"{full_path}{os.path.sep}{remove_file}",),
+                        on_pc=True,
+                    )
+                )
 
             for clouds_download_file in download_files:
                 os_path = get_os_path_by_cloud_path(
                     clouds_download_file["path"].replace("/", os.path.sep)
                 )
-                self.download(
-                    "/".join(clouds_download_file["path"].split("/")[2:]),
-                    os.path.sep.join(os_path.split(os.path.sep)[:-1]),
-                    is_folder=False,
+                operations.append(
+                    Operation(
+                        DOWNLOAD,
+                        os.path.join(folder_dir, clouds_download_file["name"]),
+                        self.download,
+                        (
+                            "/".join(clouds_download_file["path"].split("/")[2:]),
+                            os.path.sep.join(os_path.split(os.path.sep)[:-1]),
+                        ),
+                        {"is_folder": False},
+                        size=clouds_download_file.get("size", 0),
+                        on_pc=True,
+                    )
                 )
+        return operations
+
+    def plan_remove_old_dir_on_cloud(self, remove_folders):
+        # удаление папки удаляет и вложенные в неё
+        return [
+            Operation(
+                DELETE,
+                remove_folder,
+                self.delete,
+                (f'{self.ROOT_FOLDER}/{remove_folder.replace(os.path.sep, "/")}',),
+                flush=self.wait_operations,
+            )
+            for remove_folder in remove_nested_folders(remove_folders)
+        ]
 
-    def remove_old_dir_on_cloud(self, remove_folders):
-        for remove_folder in remove_folders:
-            self.delete(f'{self.ROOT_FOLDER}/{remove_folder.replace(os.path.sep, "/")}')
+    def plan_move(self, delete, upload):
+        # файл не загружается, ссылка для него не нужна
+        self.upload_links.discard(upload.args[1])
+        return Operation(
+            MOVE,
+            upload.path,
+            self.move,
+            (delete.remote, upload.args[1]),
+            size=upload.size,
+            source=delete.path,
+            # удаления идут после перемещений, поэтому перемещения дожидаемся
+            flush=self.wait_operations,
+        )
 
 
 def format_datetime(iso_date):
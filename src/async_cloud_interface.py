@@ -0,0 +1,129 @@
+import asyncio
+import contextlib
+import datetime
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import aiohttp
+
+# сколько запросов к одному облаку выполняется одновременно
+MAX_REQUESTS = 64
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class RemoteEntry:
+    name: str
+    is_dir: bool
+    size: int = None
+    modified: datetime.datetime = None
+    digest: str = None
+
+
+class AsyncCloudInterface(ABC):
+    """Async variant of CloudInterface: every request of the cloud runs
+    on one event loop, at most max_requests at a time.
+
+    Paths are relative to ROOT_FOLDER and separated by "/": SYNC_FOLDER/child/file,
+    an empty path is ROOT_FOLDER itself."""
+
+    AUTH_SCHEME = "Bearer"
+
+    def __init__(self, client, max_requests=MAX_REQUESTS):
+        self.client = client
+        self.token = client.token
+        self.max_requests = max_requests
+        self.requests = asyncio.Semaphore(max_requests)
+        self.session = None
+        self.errors = 0
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_requests)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.session.close()
+        self.session = None
+        return False
+
+    async def refresh_token(self):
+        # обновление токена блокирующее (может открыть браузер), поэтому в потоке
+        await asyncio.to_thread(self.client.refresh_token, self.token)
+        self.token = self.client.token
+
+    async def send(
+        self, method, url, headers=None, upload=None, save_to=None, **kwargs
+    ):
+        """Sends a request, on 401 refreshes the token and retries once.
+
+        Args:
+            upload — path of a file sent as the request body
+            save_to — path of a file the successful response is streamed into
+
+        Returns:
+            (status, body), body is empty when the response was saved to a file
+
+        """
+        for retry_on_401 in (True, False):
+            request_headers = {"Authorization": f"{self.AUTH_SCHEME} {self.token}"}
+            request_headers.update(headers or {})
+            async with self.requests:
+                with contextlib.ExitStack() as stack:
+                    if upload is not None:
+                        kwargs["data"] = stack.enter_context(open(upload, "rb"))
+                    async with self.session.request(
+                        method, url, headers=request_headers, **kwargs
+                    ) as response:
+                        status = response.status
+                        if save_to is not None and status == 200:
+                            with open(save_to, "wb") as file:
+                                async for chunk in response.content.iter_chunked(
+                                    DOWNLOAD_CHUNK_SIZE
+                                ):
+                                    file.write(chunk)
+                            body = b""
+                        else:
+                            body = await response.read()
+
+            if status == 401 and retry_on_401:
+                print("Ошибка 401: токен истёк. Обновление токена...")
+                await self.refresh_token()
+                continue
+            return status, body
+
+    @abstractmethod
+    async def list_folder(self, path) -> list:
+        """Lists one folder.
+
+        Returns:
+            List of RemoteEntry, empty if the folder does not exist
+
+        """
+        pass
+
+    @abstractmethod
+    async def create_folder(self, path) -> None:
+        """Creates a folder, an existing folder is not an error"""
+        pass
+
+    @abstractmethod
+    async def upload_file(self, os_path, path) -> None:
+        """Uploads a file, replacing the one on the cloud"""
+        pass
+
+    @abstractmethod
+    async def download_file(self, path, os_path) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, path) -> None:
+        """Removes a file or a folder, a missing one is not an error"""
+        pass
+
+    @abstractmethod
+    def same_file(self, os_path, entry) -> bool:
+        """Compares a local file with RemoteEntry, called in a worker thread
+        because it may read the whole file"""
+        pass
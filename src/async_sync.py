@@ -0,0 +1,280 @@
+import asyncio
+import os
+import shutil
+import sys
+import threading
+
+from src.clouds_manager import (
+    scan_local_tree,
+    get_and_update_sync_folders,
+    ChannelStdout,
+    ProviderOutput,
+    OUTPUT_CHANNEL,
+)
+from src.hash_cache import hash_cache
+from src.Yandex.async_yandex_disk import AsyncYandexDisk
+from src.Dropbox.async_dropbox import AsyncDropBox
+
+# облака, у которых есть асинхронный вариант
+ASYNC_CLOUDS = {
+    "yandex": AsyncYandexDisk,
+    "dropbox": AsyncDropBox,
+}
+
+
+def scan_local(folder_full_path):
+    """scan_local_tree с путями через "/", как их передаёт AsyncCloudInterface"""
+    return {
+        path.replace(os.path.sep, "/"): entry
+        for path, entry in scan_local_tree(folder_full_path).items()
+    }
+
+
+def get_os_path(folder_full_path, path):
+    return os.path.join(os.path.dirname(folder_full_path), *path.split("/"))
+
+
+def get_top_level(paths):
+    """Оставляет только пути, родительских папок которых нет в paths"""
+    paths = set(paths)
+    result = []
+    for path in paths:
+        parent = path.rpartition("/")[0]
+        while parent and parent not in paths:
+            parent = parent.rpartition("/")[0]
+        if not parent:
+            result.append(path)
+    return sorted(result)
+
+
+def group_by_depth(paths):
+    """Папки по уровням вложенности, чтобы родитель создавался раньше детей"""
+    levels = {}
+    for path in paths:
+        levels.setdefault(path.count("/"), []).append(path)
+    return [levels[depth] for depth in sorted(levels)]
+
+
+async def get_remote_tree(cloud, root):
+    """Дерево папки root на облаке: путь -> RemoteEntry.
+    Все папки одного уровня запрашиваются одновременно"""
+    tree = {}
+    level = [root]
+    while level:
+        listings = await asyncio.gather(*(cloud.list_folder(path) for path in level))
+        next_level = []
+        for folder, entries in zip(level, listings):
+            for entry in entries:
+                path = f"{folder}/{entry.name}"
+                tree[path] = entry
+                if entry.is_dir:
+                    next_level.append(path)
+        level = next_level
+    return tree
+
+
+async def run_all(cloud, coroutines):
+    """Выполняет операции одновременно, ошибки печатаются и считаются в cloud.errors"""
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            cloud.errors += 1
+            print(result)
+
+
+async def sync_folder_to_cloud(cloud, folder_full_path):
+    """Синхронизация пк -> облако для одной отслеживаемой папки"""
+    name_folder = os.path.basename(folder_full_path)
+    local = await asyncio.to_thread(scan_local, folder_full_path)
+
+    await cloud.create_folder("")
+    await cloud.create_folder(name_folder)
+    remote = await get_remote_tree(cloud, name_folder)
+
+    async def delete(path):
+        await cloud.delete(path)
+        print(f"Ресурс {path} удалён с облака")
+
+    async def create_folder(path):
+        await cloud.create_folder(path)
+        print(f"Папка {path} создана")
+
+    async def upload(path):
+        os_path = get_os_path(folder_full_path, path)
+        entry = remote.get(path)
+        if entry is not None and not entry.is_dir:
+            if await asyncio.to_thread(cloud.same_file, os_path, entry):
+                return
+        await cloud.upload_file(os_path, path)
+        print(f"Файл {path} загружен")
+
+    # на облаке нет того, чего нет на пк, или это другой тип ресурса
+    remove_paths = get_top_level(
+        path
+        for path, entry in remote.items()
+        if path not in local or local[path].is_dir != entry.is_dir
+    )
+    await run_all(cloud, [delete(path) for path in remove_paths])
+    for path in remove_paths:
+        remote.pop(path)
+
+    new_folders = [
+        path
+        for path, entry in local.items()
+        if entry.is_dir and path != name_folder and path not in remote
+    ]
+    for level in group_by_depth(new_folders):
+        await run_all(cloud, [create_folder(path) for path in level])
+
+    await run_all(
+        cloud, [upload(path) for path, entry in local.items() if not entry.is_dir]
+    )
+
+
+async def sync_folder_to_pc(cloud, folder_full_path):
+    """Синхронизация облако -> пк для одной отслеживаемой папки"""
+    name_folder = os.path.basename(folder_full_path)
+
+    root_entries = await cloud.list_folder("")
+    if name_folder not in [entry.name for entry in root_entries if entry.is_dir]:
+        print(f"Папки {name_folder} нет на облаке")
+        return
+
+    remote = await get_remote_tree(cloud, name_folder)
+    local = await asyncio.to_thread(scan_local, folder_full_path)
+
+    async def download(path):
+        os_path = get_os_path(folder_full_path, path)
+        if path in local and await asyncio.to_thread(
+            cloud.same_file, os_path, remote[path]
+        ):
+            return
+        await cloud.download_file(path, os_path)
+        print(f"Файл {path} скачан")
+
+    for path in get_top_level(
+        path
+        for path, entry in local.items()
+        if path != name_folder
+        and (path not in remote or remote[path].is_dir != entry.is_dir)
+    ):
+        os_path = get_os_path(folder_full_path, path)
+        if local.pop(path).is_dir:
+            await asyncio.to_thread(shutil.rmtree, os_path)
+        else:
+            await asyncio.to_thread(os.remove, os_path)
+        print(f"Ресурс {path} удалён с пк")
+
+    for path, entry in remote.items():
+        if entry.is_dir:
+            os.makedirs(get_os_path(folder_full_path, path), exist_ok=True)
+
+    await run_all(
+        cloud, [download(path) for path, entry in remote.items() if not entry.is_dir]
+    )
+
+
+async def sync_cloud_async(cloud_name, sync_folder, sync_folders, channel=None):
+    """Синхронизирует отслеживаемые папки с одним облаком,
+    все папки одновременно на одном event loop.
+    Возвращает False, если синхронизация прервалась или были ошибки"""
+    if channel is not None:
+        # у каждой задачи свой контекст, вывод облака идёт в его канал
+        OUTPUT_CHANNEL.set(channel)
+
+    success = True
+    try:
+        async with ASYNC_CLOUDS[cloud_name]() as cloud:
+            print(f"Синхронизация {cloud.__class__.__name__}")
+            results = await asyncio.gather(
+                *(sync_folder(cloud, folder) for folder in sync_folders),
+                return_exceptions=True,
+            )
+            for folder_full_path, result in zip(sync_folders, results):
+                if isinstance(result, Exception):
+                    name_folder = os.path.basename(folder_full_path)
+                    print(
+                        f"Синхронизация папки {name_folder} с {cloud_name} "
+                        f"прервана: {result}"
+                    )
+                    success = False
+
+            if cloud.errors:
+                print(f"При синхронизации с {cloud_name} были ошибки: {cloud.errors}")
+                success = False
+    except Exception as e:
+        print(f"Синхронизация с {cloud_name} прервана: {e}")
+        return False
+    finally:
+        if channel is not None:
+            channel.flush()
+
+    return success
+
+
+async def sync_clouds_async(cloud_names, sync_folder, sync_folders):
+    if len(cloud_names) == 1:
+        results = [await sync_cloud_async(cloud_names[0], sync_folder, sync_folders)]
+    else:
+        stdout = sys.stdout
+        lock = threading.Lock()
+        sys.stdout = ChannelStdout(stdout)
+        try:
+            results = await asyncio.gather(
+                *(
+                    sync_cloud_async(
+                        cloud_name,
+                        sync_folder,
+                        sync_folders,
+                        ProviderOutput(stdout, cloud_name, lock),
+                    )
+                    for cloud_name in cloud_names
+                )
+            )
+        finally:
+            sys.stdout = stdout
+
+    return dict(zip(cloud_names, results))
+
+
+def get_async_clouds(list_clouds):
+    """Облака из list_clouds, которые умеет async-движок,
+    и облака, которые он не поддерживает"""
+    if isinstance(list_clouds, str):
+        list_clouds = [list_clouds]
+    unsupported = [k for k in list_clouds if k not in ASYNC_CLOUDS]
+    if unsupported:
+        print(f"Асинхронная синхронизация не поддерживает: {', '.join(unsupported)}")
+    cloud_names = [k for k in ASYNC_CLOUDS if not list_clouds or k in list_clouds]
+    return cloud_names, unsupported
+
+
+def sync_folders_async(list_clouds=[]):
+    """Синхронизация пк -> облака на asyncio, возвращает список облаков,
+    синхронизация с которыми завершилась ошибкой или не поддерживается"""
+    sync_folders = get_and_update_sync_folders()
+    cloud_names, unsupported = get_async_clouds(list_clouds)
+
+    results = asyncio.run(
+        sync_clouds_async(cloud_names, sync_folder_to_cloud, sync_folders)
+    )
+    hash_cache.report()
+
+    return unsupported + [
+        cloud_name for cloud_name, success in results.items() if not success
+    ]
+
+
+def sync_locals_folders_async(cloud_name):
+    """Синхронизация облако -> пк на asyncio для отслеживаемых папок"""
+    sync_folders = get_and_update_sync_folders()
+    cloud_names, unsupported = get_async_clouds(cloud_name or "yandex")
+    if unsupported:
+        return unsupported
+
+    results = asyncio.run(
+        sync_clouds_async(cloud_names[:1], sync_folder_to_pc, sync_folders)
+    )
+    hash_cache.report()
+
+    return [cloud_name for cloud_name, success in results.items() if not success]
@@ -1,7 +1,20 @@
 from abc import ABC, abstractmethod
 
+from src.sync_plan import execute_plan, find_moves
+
 
 class CloudInterface(ABC):
+    # число ошибок, которые облако вывело и пропустило, если они были,
+    # состояние синхронизации не сохраняется
+    errors = 0
+    # алгоритм хэша облака из HASH_FUNCTIONS, None - хэш локально не посчитать
+    HASH_ALGORITHM = None
+    # SyncState облака, в нём облако может хранить свои данные между запусками
+    sync_state = None
+    # облако только составляет план (dry run): ничего не создаёт на облаке
+    # и не пишет в sync_state
+    planning = False
+
     @abstractmethod
     def check_upload(self):
         """Checks if folder is already uploaded,
@@ -23,19 +36,47 @@ class CloudInterface(ABC):
         """
         pass
 
-    @abstractmethod
     def upload_dir_on_cloud(self, upload_folders) -> None:
         """Downloads new folders that are on the computer, but not on the cloud"""
-        pass
+        execute_plan(self.transfers, self.plan_upload_dir_on_cloud(upload_folders))
 
-    @abstractmethod
     def update_dir_on_cloud(self, exact_folders) -> None:
         """Look folder and make a list of files: to delete, update and download"""
-        pass
+        execute_plan(self.transfers, self.plan_update_dir_on_cloud(exact_folders))
 
-    @abstractmethod
     def remove_old_dir_on_cloud(self, remove_folders) -> None:
         """Remove cloud's folder that are on the cloud, but not on computer"""
+        execute_plan(self.transfers, self.plan_remove_old_dir_on_cloud(remove_folders))
+
+    def plan_sync_to_cloud(self, upload_folders, exact_folders, remove_folders):
+        """Plan of the pc -> cloud synchronization of one watched folder,
+        deleted and uploaded copies of the same file become moves"""
+        # планировщик, прерванный ошибкой облака, возвращает None
+        operations = (
+            (self.plan_upload_dir_on_cloud(upload_folders) or [])
+            + (self.plan_update_dir_on_cloud(exact_folders) or [])
+            + (self.plan_remove_old_dir_on_cloud(remove_folders) or [])
+        )
+        return find_moves(operations, self.HASH_ALGORITHM, self.plan_move)
+
+    @abstractmethod
+    def plan_upload_dir_on_cloud(self, upload_folders) -> list:
+        """Operations that create new folders on the cloud and upload their files"""
+        pass
+
+    @abstractmethod
+    def plan_update_dir_on_cloud(self, exact_folders) -> list:
+        """Operations that upload, replace and delete files of existing folders"""
+        pass
+
+    @abstractmethod
+    def plan_remove_old_dir_on_cloud(self, remove_folders) -> list:
+        pass
+
+    @abstractmethod
+    def plan_move(self, delete, upload):
+        """Operation that moves the file of the delete operation
+        to the place of the upload operation"""
         pass
 
     @abstractmethod
@@ -48,16 +89,31 @@ class CloudInterface(ABC):
         """
         pass
 
+    def get_revision(self):
+        """Revision of the whole cloud, changes with every change on it.
+
+        Returns:
+            None if the cloud has no such value
+
+        """
+        return None
+
     @abstractmethod
     def check_root_folder(self) -> bool:
         """Checks if the root folder exists on the cloud"""
         pass
 
-    @abstractmethod
     def downloading_folders(self, download_folders) -> None:
-        pass
+        execute_plan(self.transfers, self.plan_downloading_folders(download_folders))
 
-    @abstractmethod
     def update_dir_on_pc(self, exact_folders) -> None:
         """Look folder and make a list of files: to delete, update and download"""
+        execute_plan(self.transfers, self.plan_update_dir_on_pc(exact_folders))
+
+    @abstractmethod
+    def plan_downloading_folders(self, download_folders) -> list:
+        pass
+
+    @abstractmethod
+    def plan_update_dir_on_pc(self, exact_folders) -> list:
         pass
@@ -1,23 +1,34 @@
 import os.path
+import sys
 import datetime
 import shutil
 import re
+import threading
+import time
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
+import requests
+
 from src.Yandex.yandex_disk import YandexDisk
 from src.Drive.google_drive import GoogleDrive
 from src.Dropbox.dropbox import DropBox
+from src.hash_cache import hash_cache
+from src.sync_plan import execute_plan, print_plan
+from src.sync_state import SyncState, SyncEntry
 
-
+# planning - облако только составляет план синхронизации, ничего не меняя
 CLOUDS = {
-    "yandex": lambda folder_full_path: YandexDisk(
-        os.path.basename(folder_full_path), folder_full_path
+    "yandex": lambda folder_full_path, client=None, planning=False: YandexDisk(
+        os.path.basename(folder_full_path), folder_full_path, client, planning
     ),
-    "google": lambda folder_full_path: GoogleDrive(
-        os.path.basename(folder_full_path), folder_full_path
+    "google": lambda folder_full_path, client=None, planning=False: GoogleDrive(
+        os.path.basename(folder_full_path), folder_full_path, client, planning
     ),
-    "dropbox": lambda folder_full_path: DropBox(
-        os.path.basename(folder_full_path), folder_full_path
+    "dropbox": lambda folder_full_path, client=None, planning=False: DropBox(
+        os.path.basename(folder_full_path), folder_full_path, client, planning
     ),
 }
 SAVE_SYNC_FILE = (
@@ -26,6 +37,17 @@ SAVE_SYNC_FILE = (
     else os.path.join("src", "save_sync_folder.txt")
 )
 ROOT_FOLDER = "SYNC_FOLDERS"
+# сколько отслеживаемых папок одного облака синхронизируется одновременно
+FOLDER_JOBS = 4
+# ревизия облака, с которой последний раз синхронизировался пк
+PC_REVISION_KEY = "pc_revision"
+# отпечаток отслеживаемых папок на пк после той же синхронизации
+PC_LOCAL_TREE_KEY = "pc_local_tree"
+# пауза перед повторным ожиданием изменений облака после обрыва связи
+WATCH_RETRY_SECONDS = 30
+WATCH_MAX_RETRY_SECONDS = 600
+# канал вывода облака, которое синхронизируется в текущем потоке
+OUTPUT_CHANNEL = contextvars.ContextVar("output_channel", default=None)
 
 
 def remove_sync_folder(folder_path):
@@ -91,41 +113,284 @@ def get_os_tree(full_path):
     return os_tree_list
 
 
-def sync_folders(list_clouds=[]):
-    sync_folders = get_and_update_sync_folders()
+def scan_local_tree(full_path):
+    """Снимок отслеживаемой папки: путь от её родителя (как в get_os_tree) -> SyncEntry"""
+    parent_path = os.path.dirname(full_path)
+    local_entries = {os.path.basename(full_path): SyncEntry(is_dir=True)}
+    for root, dirs, files in os.walk(full_path, topdown=True):
+        relative_root = os.path.relpath(root, parent_path)
+        for name in dirs:
+            local_entries[os.path.join(relative_root, name)] = SyncEntry(is_dir=True)
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:  # файл удалили во время обхода
+                continue
+            local_entries[os.path.join(relative_root, name)] = SyncEntry(
+                is_dir=False, size=stat.st_size, local_mtime_ns=stat.st_mtime_ns
+            )
 
-    if list_clouds:
-        get_clouds = [v for k, v in CLOUDS.items() if k in list_clouds]
-    else:
-        get_clouds = CLOUDS.values()
+    return local_entries
 
-    for get_cloud in get_clouds:
-        print(f'Синхронизация {get_cloud("").__class__.__name__}')
-        for folder_full_path in sync_folders:
-            cloud = get_cloud(folder_full_path)
-            name_folder = os.path.basename(folder_full_path)
 
+def get_local_fingerprint(sync_folders):
+    """Отпечаток отслеживаемых папок: меняется, если на пк что-то
+    добавили, удалили или изменили"""
+    digest = hashlib.sha256()
+    for folder in sorted(sync_folders):
+        for path, entry in sorted(scan_local_tree(folder).items()):
+            digest.update(
+                f"{path}|{entry.is_dir}|{entry.size}|{entry.local_mtime_ns}\n".encode()
+            )
+    return digest.hexdigest()
+
+
+def get_changed_folders(local_entries, synced_entries):
+    """Папки, в которых появились, пропали или изменились файлы и подпапки
+    со времени прошлой синхронизации"""
+    changed_folders = set()
+    for path in local_entries.keys() | synced_entries.keys():
+        local_entry = local_entries.get(path)
+        synced_entry = synced_entries.get(path)
+        if local_entry and synced_entry and local_entry.same_local_state(synced_entry):
+            continue
+
+        entry = local_entry or synced_entry
+        changed_folders.add(path if entry.is_dir else os.path.dirname(path))
+
+    return changed_folders
+
+
+def save_sync_state(state, name_folder, local_entries, synced_entries, remote_files):
+    for path, entry in local_entries.items():
+        synced_entry = synced_entries.get(path)
+        if path in remote_files:
+            entry.remote_id, entry.remote_rev = remote_files[path]
+        elif synced_entry and entry.same_local_state(synced_entry):
+            entry.remote_id = synced_entry.remote_id
+            entry.remote_rev = synced_entry.remote_rev
+
+    state.replace_entries(name_folder, local_entries)
+
+
+class ProviderOutput:
+    """Канал вывода одного облака: каждая строка помечается именем облака"""
+
+    def __init__(self, stream, name, lock):
+        self.stream = stream
+        self.name = name
+        self.lock = lock
+        self.buffer = ""
+
+    def write(self, text):
+        with self.lock:
+            self.buffer += text
+            *lines, self.buffer = self.buffer.split("\n")
+            for line in lines:
+                self.stream.write(f"[{self.name}] {line}\n")
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.stream.write(f"[{self.name}] {self.buffer}\n")
+                self.buffer = ""
+            self.stream.flush()
+
+
+class ChannelStdout:
+    """Подменяет sys.stdout и отправляет вывод в канал текущего контекста"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        return (OUTPUT_CHANNEL.get() or self.stream).write(text)
+
+    def flush(self):
+        (OUTPUT_CHANNEL.get() or self.stream).flush()
+
+
+def sync_watched_folder(
+    state, get_cloud, client, folder_full_path, setup_lock, dry_run=False
+):
+    """Синхронизирует одну отслеживаемую папку с облаком,
+    с dry_run только выводит план синхронизации"""
+    name_folder = os.path.basename(folder_full_path)
+
+    # сравниваем папку с состоянием после прошлой синхронизации,
+    # если ничего не изменилось - к облаку не обращаемся
+    local_entries = scan_local_tree(folder_full_path)
+    synced_entries = state.get_entries(name_folder)
+    changed_folders = get_changed_folders(local_entries, synced_entries)
+    if synced_entries and not changed_folders:
+        print(f"Папка {name_folder} не изменилась с прошлой синхронизации")
+        return
+
+    # корневую папку на облаке создаёт только одна папка, иначе будут дубликаты
+    with setup_lock:
+        cloud = get_cloud(folder_full_path, client, planning=dry_run)
+        cloud.sync_state = state
+        if not dry_run:
             cloud.check_upload()
 
-            tree_list = []
-            cloud.get_cloud_tree(name_folder, tree_list, "")
-            os_tree_list = get_os_tree(folder_full_path)
+    tree_list = []
+    cloud.get_cloud_tree(name_folder, tree_list, "")
+    os_tree_list = get_os_tree(folder_full_path)
+
+    # папки которые есть в drive но нет на пк - удаляем
+    remove_folders = list(set(tree_list).difference(set(os_tree_list)))
+    # папки, которые есть на пк, но нет на облаке - загружаем
+    upload_folders = list(set(os_tree_list).difference(set(tree_list)))
+    # папки, которые есть и там и там, обновляем в них файлы
+    exact_folders = list(
+        set(os_tree_list).intersection(set(tree_list))
+    )  # SYNC_FOLDER\1\2...
+    exact_folders.append(name_folder)  # добавим в обновляемые исходную папку
+    if synced_entries:
+        # в папках без изменений файлы с облаком не сравниваем
+        exact_folders = [f for f in exact_folders if f in changed_folders]
+
+    operations = cloud.plan_sync_to_cloud(upload_folders, exact_folders, remove_folders)
+    if dry_run:
+        print(f"План синхронизации папки {name_folder}:")
+        print_plan(operations)
+        return
 
-            # папки которые есть в drive но нет на пк - удаляем
-            remove_folders = list(set(tree_list).difference(set(os_tree_list)))
-            # папки, которые есть на пк, но нет на облаке - загружаем
-            upload_folders = list(set(os_tree_list).difference(set(tree_list)))
-            # папки, которые есть и там и там, обновляем в них файлы
-            exact_folders = list(
-                set(os_tree_list).intersection(set(tree_list))
-            )  # SYNC_FOLDER\1\2...
-            exact_folders.append(name_folder)  # добавим в обновляемые исходную папку
+    execute_plan(cloud.transfers, operations)
 
-            cloud.upload_dir_on_cloud(upload_folders)
+    if cloud.errors:
+        print(
+            f"При синхронизации папки {name_folder} были ошибки, "
+            f"в следующий раз она будет проверена полностью"
+        )
+        return
+    save_sync_state(
+        state, name_folder, local_entries, synced_entries, cloud.remote_files
+    )
 
-            cloud.update_dir_on_cloud(exact_folders)
 
-            cloud.remove_old_dir_on_cloud(remove_folders)
+def sync_cloud(
+    cloud_name, get_cloud, sync_folders, folder_jobs=FOLDER_JOBS, dry_run=False
+):
+    """Синхронизирует отслеживаемые папки с одним облаком,
+    до folder_jobs папок одновременно.
+    Возвращает False, если синхронизация хотя бы одной папки прервалась с ошибкой"""
+    state = SyncState(cloud_name)
+    success = True
+    try:
+        cloud = get_cloud("")
+        print(f"Синхронизация {cloud.__class__.__name__}")
+        setup_lock = threading.Lock()
+        with ThreadPoolExecutor(
+            max_workers=max(1, folder_jobs), thread_name_prefix="folder"
+        ) as executor:
+            futures = {
+                folder_full_path: executor.submit(
+                    contextvars.copy_context().run,
+                    sync_watched_folder,
+                    state,
+                    get_cloud,
+                    cloud.client,
+                    folder_full_path,
+                    setup_lock,
+                    dry_run,
+                )
+                for folder_full_path in sync_folders
+            }
+
+        # ошибка в одной папке не останавливает остальные
+        for folder_full_path, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                name_folder = os.path.basename(folder_full_path)
+                print(f"Синхронизация папки {name_folder} с {cloud_name} прервана: {e}")
+                success = False
+
+        cloud.transfers.report()
+    except Exception as e:
+        print(f"Синхронизация с {cloud_name} прервана: {e}")
+        return False
+    finally:
+        state.close()
+
+    return success
+
+
+def sync_clouds_concurrently(
+    get_clouds, sync_folders, folder_jobs=FOLDER_JOBS, dry_run=False
+):
+    """Запускает синхронизацию каждого облака в своём потоке,
+    вывод каждого облака идёт в свой канал"""
+    stdout = sys.stdout
+    lock = threading.Lock()
+    sys.stdout = ChannelStdout(stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=len(get_clouds)) as executor:
+            futures = {}
+            for cloud_name, get_cloud in get_clouds.items():
+                channel = ProviderOutput(stdout, cloud_name, lock)
+                context = contextvars.copy_context()
+                context.run(OUTPUT_CHANNEL.set, channel)
+                futures[cloud_name] = (
+                    executor.submit(
+                        context.run,
+                        sync_cloud,
+                        cloud_name,
+                        get_cloud,
+                        sync_folders,
+                        folder_jobs,
+                        dry_run,
+                    ),
+                    channel,
+                )
+
+            results = {}
+            for cloud_name, (future, channel) in futures.items():
+                results[cloud_name] = future.result()
+                channel.flush()
+    finally:
+        sys.stdout = stdout
+
+    return results
+
+
+def sync_folders(
+    list_clouds=[],
+    concurrent=True,
+    folder_jobs=FOLDER_JOBS,
+    dry_run=False,
+    folders=None,
+):
+    """Синхронизация пк -> облака, возвращает список облаков,
+    синхронизация с которыми завершилась ошибкой.
+    С dry_run облака не меняются, выводится только план,
+    folders - синхронизировать только эти из отслеживаемых папок"""
+    sync_folders = get_and_update_sync_folders()
+    if folders is not None:
+        sync_folders = [folder for folder in sync_folders if folder in folders]
+
+    if list_clouds:
+        get_clouds = {k: v for k, v in CLOUDS.items() if k in list_clouds}
+    else:
+        get_clouds = dict(CLOUDS.items())
+
+    if concurrent and len(get_clouds) > 1:
+        results = sync_clouds_concurrently(
+            get_clouds, sync_folders, folder_jobs, dry_run
+        )
+    else:
+        results = {
+            cloud_name: sync_cloud(
+                cloud_name, get_cloud, sync_folders, folder_jobs, dry_run
+            )
+            for cloud_name, get_cloud in get_clouds.items()
+        }
+
+    hash_cache.report()
+
+    return [cloud_name for cloud_name, success in results.items() if not success]
 
 
 def sync_locals_folders(cloud_name):
@@ -134,8 +399,36 @@ def sync_locals_folders(cloud_name):
     else:
         get_cloud = CLOUDS["yandex"]
 
-    cloud = get_cloud("")
+    state = SyncState(cloud_name or "yandex")
+    try:
+        cloud = get_cloud("")
+        # листинг облака продолжается с сохранённого курсора
+        cloud.sync_state = state
+        # ни облако, ни папки на пк не менялись с прошлой синхронизации -
+        # дерево облака не обходим
+        revision = cloud.get_revision()
+        if (
+            revision is not None
+            and state.get_meta(PC_REVISION_KEY) == str(revision)
+            and state.get_meta(PC_LOCAL_TREE_KEY)
+            == get_local_fingerprint(get_and_update_sync_folders())
+        ):
+            print("Нет изменений с прошлой синхронизации")
+            return
+
+        sync_cloud_to_pc(cloud)
 
+        if revision is not None and not cloud.errors:
+            state.set_meta(PC_REVISION_KEY, str(revision))
+            state.set_meta(
+                PC_LOCAL_TREE_KEY,
+                get_local_fingerprint(get_and_update_sync_folders()),
+            )
+    finally:
+        state.close()
+
+
+def sync_cloud_to_pc(cloud):
     if not cloud.check_root_folder():
         print("На облаке нет ранее синхронизированных папок")
         return
@@ -167,6 +460,56 @@ def sync_locals_folders(cloud_name):
 
     cloud.update_dir_on_pc(exact_folders)
 
+    cloud.transfers.report()
+    hash_cache.report()
+
+
+def watch_locals_folders(cloud_name):
+    """Облако -> пк по мере изменений на облаке, пока не прервут.
+
+    Облако ждёт изменений без опроса (wait_for_changes), на пк
+    переносятся только изменившиеся записи, а не всё дерево.
+    После ошибки облака наблюдение продолжается с полной сверки дерева"""
+    state = SyncState(cloud_name)
+    try:
+        cloud = CLOUDS[cloud_name]("")
+        cloud.sync_state = state
+        root = f"/{ROOT_FOLDER}"
+        resync = True
+        delay = WATCH_RETRY_SECONDS
+        while True:
+            try:
+                if resync:
+                    # курсор берётся до полной сверки: изменения, сделанные
+                    # пока она идёт, придут следующим wait_for_changes
+                    cloud.tree = None
+                    cloud.load_tree(root)
+                    # изменения, сделанные пока наблюдение не работало
+                    sync_locals_folders(cloud_name)
+                    resync = False
+                    print("Наблюдение за облаком запущено")
+                if cloud.wait_for_changes(root):
+                    changes = cloud.list_changes(root)
+                    if changes is None:
+                        # листинг на облаке сброшен, сверяем всё дерево
+                        sync_locals_folders(cloud_name)
+                    else:
+                        cloud.apply_changes_on_pc(changes)
+                    hash_cache.report()
+                delay = WATCH_RETRY_SECONDS
+            except requests.exceptions.RequestException as e:
+                print(f"Нет связи с облаком: {e}, повтор через {delay} с")
+                time.sleep(delay)
+                delay = min(delay * 2, WATCH_MAX_RETRY_SECONDS)
+            except Exception as e:
+                # 429, 5xx, сброс листинга посреди страниц
+                print(f"Ошибка облака: {e}, полная сверка через {delay} с")
+                time.sleep(delay)
+                delay = min(delay * 2, WATCH_MAX_RETRY_SECONDS)
+                resync = True
+    finally:
+        state.close()
+
 
 @dataclass
 class FileData:
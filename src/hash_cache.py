@@ -0,0 +1,192 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+HASH_CACHE_FILE = (
+    r"hash_cache.sqlite3"
+    if os.path.basename(os.getcwd()) == "src"
+    else os.path.join("src", "hash_cache.sqlite3")
+)
+READ_BLOCK_SIZE = 4 * 1024 * 1024
+# размер блока content_hash задан Dropbox и не зависит от READ_BLOCK_SIZE
+DROPBOX_BLOCK_SIZE = 4 * 1024 * 1024
+# новые хэши сохраняются на диск каждые COMMIT_EVERY записей, чтобы
+# после падения долгой синхронизации посчитанное не терялось
+COMMIT_EVERY = 100
+# записи удалённых файлов вычищаются не чаще раза в PRUNE_INTERVAL секунд
+PRUNE_INTERVAL = 60 * 60
+
+
+def md5_digest(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(READ_BLOCK_SIZE), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def dropbox_content_hash(path):
+    """content_hash Dropbox: sha256 от склеенных sha256 блоков файла по 4 МБ"""
+    block_hashes = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(DROPBOX_BLOCK_SIZE), b""):
+            block_hashes.update(hashlib.sha256(block).digest())
+    return block_hashes.hexdigest()
+
+
+HASH_FUNCTIONS = {"md5": md5_digest, "content_hash": dropbox_content_hash}
+
+
+def get_stat_key(stat):
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class HashCache:
+    """Постоянный кэш хэшей локальных файлов.
+
+    Ключ записи — (device, inode), а size и mtime_ns проверяются при чтении:
+    если файл изменился, хэш пересчитывается и запись перезаписывается.
+    Путь файла хранится, чтобы вычищать записи удалённых файлов."""
+
+    def __init__(self, db_path=HASH_CACHE_FILE, clock=time.monotonic):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connection = None
+        self._uncommitted = 0
+        self._pruned = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            columns = [
+                row[1] for row in self._connection.execute("PRAGMA table_info(hashes)")
+            ]
+            if columns and "path" not in columns:
+                # кэш старого формата без путей проще посчитать заново
+                self._connection.execute("DROP TABLE hashes")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "device INTEGER, inode INTEGER, algorithm TEXT, "
+                "size INTEGER, mtime_ns INTEGER, digest TEXT, path TEXT, "
+                "PRIMARY KEY (device, inode, algorithm))"
+            )
+        return self._connection
+
+    def get(self, path, algorithm="md5"):
+        """Возвращает хэш файла, пересчитывая его только если файл изменился"""
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino, algorithm)
+
+        path = os.path.abspath(path)
+
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT size, mtime_ns, digest, path FROM hashes "
+                    "WHERE device = ? AND inode = ? AND algorithm = ?",
+                    key,
+                )
+                .fetchone()
+            )
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                self.hits += 1
+                if row[3] != path:
+                    # файл переименовали или переместили
+                    self._write(
+                        "UPDATE hashes SET path = ? "
+                        "WHERE device = ? AND inode = ? AND algorithm = ?",
+                        (path, *key),
+                    )
+                return row[2]
+
+        digest = HASH_FUNCTIONS[algorithm](path)
+
+        with self._lock:
+            self.misses += 1
+            if get_stat_key(os.stat(path)) != get_stat_key(stat):
+                # файл меняли пока он читался, хэш может не совпадать
+                # ни с одной из версий - в кэш его не кладём
+                return digest
+            self._write(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, stat.st_size, stat.st_mtime_ns, digest, path),
+            )
+        return digest
+
+    def _write(self, query, parameters):
+        self._connect().execute(query, parameters)
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self._commit()
+
+    def _commit(self):
+        if self._connection is not None:
+            self._connection.commit()
+        self._uncommitted = 0
+
+    def prune(self):
+        """Удаляет записи файлов, которых больше нет по сохранённому пути"""
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(
+                "SELECT DISTINCT device, inode, path FROM hashes"
+            ).fetchall()
+            removed = []
+            for device, inode, path in rows:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    removed.append((device, inode))
+                    continue
+                if (stat.st_dev, stat.st_ino) != (device, inode):
+                    removed.append((device, inode))
+            connection.executemany(
+                "DELETE FROM hashes WHERE device = ? AND inode = ?", removed
+            )
+            self._commit()
+            self._pruned = self.clock()
+            return len(removed)
+
+    def close(self):
+        """Сохраняет несохранённые хэши и закрывает базу"""
+        with self._lock:
+            if self._connection is not None:
+                self._commit()
+                self._connection.close()
+                self._connection = None
+
+    def md5(self, path):
+        return self.get(path, "md5")
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        """Сохраняет кэш на диск и выводит статистику попаданий за запуск,
+        раз в PRUNE_INTERVAL вычищает записи удалённых файлов"""
+        if self._connection is not None and (
+            self._pruned is None or self.clock() - self._pruned >= PRUNE_INTERVAL
+        ):
+            self.prune()
+        with self._lock:
+            self._commit()
+            total = self.hits + self.misses
+            if total:
+                print(
+                    f"Кэш хэшей: {self.hits} из {total} файлов без повторного чтения "
+                    f"({self.hit_rate():.0%})"
+                )
+            self.hits = 0
+            self.misses = 0
+
+
+hash_cache = HashCache()
+atexit.register(hash_cache.close)
@@ -0,0 +1,149 @@
+import os
+from dataclasses import dataclass, field
+from typing import Callable
+
+from src.hash_cache import hash_cache
+
+MKDIR = "mkdir"
+UPLOAD = "upload"
+REPLACE = "replace"
+DELETE = "delete"
+DOWNLOAD = "download"
+MOVE = "move"
+
+# папки создаются первыми и по очереди от верхних к вложенным,
+# удаления идут последними, когда перемещения уже забрали свои файлы
+EXECUTION_PHASES = [[MKDIR], [MOVE], [UPLOAD, REPLACE, DOWNLOAD], [DELETE]]
+TRANSFERS = {UPLOAD, REPLACE, DOWNLOAD}
+OPERATION_NAMES = {
+    MKDIR: "создать папку",
+    MOVE: "переместить",
+    UPLOAD: "загрузить",
+    REPLACE: "заменить",
+    DOWNLOAD: "скачать",
+    DELETE: "удалить",
+}
+
+
+@dataclass
+class Operation:
+    """Одна операция плана синхронизации.
+
+    path — путь как в sync_folders: SYNC_FOLDER\\child\\file,
+    function(*args, **kwargs) — вызов облака или пк, который её выполняет"""
+
+    kind: str
+    path: str
+    function: Callable = field(repr=False, compare=False)
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    size: int = 0
+    on_pc: bool = False
+    # локальный файл загрузки и хэш удаляемого файла облака, по ним ищутся перемещения
+    os_path: str = None
+    digest: str = None
+    # данные облака об удаляемом файле, нужны чтобы переместить его
+    remote: object = None
+    # откуда перемещается файл
+    source: str = None
+    # вызывается один раз после всех операций этапа, например чтобы
+    # закоммитить накопленные загрузки
+    flush: Callable = field(default=None, repr=False, compare=False)
+
+    def run(self):
+        return self.function(*self.args, **self.kwargs)
+
+
+def get_depth(operation):
+    return operation.path.count(os.path.sep)
+
+
+def execute_plan(transfers, operations):
+    """Выполняет план: папки создаются по очереди,
+    остальные операции каждого этапа параллельно через пул передач"""
+    operations = operations or []
+    for phase in EXECUTION_PHASES:
+        phase_operations = [op for op in operations if op.kind in phase]
+        if phase == [MKDIR]:
+            for operation in sorted(phase_operations, key=get_depth):
+                operation.run()
+        else:
+            with transfers.batch() as batch:
+                for operation in phase_operations:
+                    size = operation.size if operation.kind in TRANSFERS else 0
+                    batch.submit(operation.run, size=size)
+
+        flushes = []
+        for operation in phase_operations:
+            if operation.flush is not None and operation.flush not in flushes:
+                flushes.append(operation.flush)
+        for flush in flushes:
+            flush()
+
+
+def find_moves(operations, algorithm, plan_move):
+    """Заменяет пару удаление + загрузка одного и того же содержимого
+    перемещением файла на облаке.
+
+    algorithm — алгоритм хэша облака из HASH_FUNCTIONS, None если хэш
+    локально не посчитать, plan_move(delete, upload) создаёт операцию"""
+    if algorithm is None:
+        return operations
+
+    uploads = {}
+    for operation in operations:
+        if operation.kind == UPLOAD and operation.os_path:
+            uploads.setdefault(operation.size, []).append(operation)
+
+    moved = set()
+    moves = []
+    for delete in operations:
+        if delete.kind != DELETE or delete.on_pc or not delete.digest:
+            continue
+        for upload in uploads.get(delete.size, []):
+            if id(upload) in moved:
+                continue
+            try:
+                digest = hash_cache.get(upload.os_path, algorithm)
+            except FileNotFoundError:
+                continue
+            if digest == delete.digest:
+                moves.append(plan_move(delete, upload))
+                moved.update((id(delete), id(upload)))
+                break
+
+    return [op for op in operations if id(op) not in moved] + moves
+
+
+def format_size(size):
+    return f"{size / 1024 / 1024:.1f} МБ"
+
+
+def print_plan(operations):
+    """Выводит план и сколько байт придётся передать"""
+    if not operations:
+        print("Изменений нет")
+        return
+
+    order = [kind for phase in EXECUTION_PHASES for kind in phase]
+    operations = sorted(
+        operations, key=lambda op: (order.index(op.kind), op.path.lower())
+    )
+    for operation in operations:
+        path = operation.path
+        if operation.source:
+            path = f"{operation.source} -> {path}"
+        line = f"{OPERATION_NAMES[operation.kind]}: {path}"
+        if operation.on_pc:
+            line += " (на пк)"
+        if operation.kind in TRANSFERS:
+            line += f", {format_size(operation.size)}"
+        print(line)
+
+    summary = []
+    for kind in order:
+        kind_operations = [op for op in operations if op.kind == kind]
+        if kind_operations:
+            summary.append(f"{OPERATION_NAMES[kind]} {len(kind_operations)}")
+    total = sum(op.size for op in operations if op.kind in TRANSFERS)
+    print(f"Итого: {', '.join(summary)}; передать {format_size(total)}")
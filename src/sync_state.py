@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+SYNC_STATE_FILE = (
+    r"sync_state.sqlite3"
+    if os.path.basename(os.getcwd()) == "src"
+    else os.path.join("src", "sync_state.sqlite3")
+)
+
+
+@dataclass
+class SyncEntry:
+    is_dir: bool
+    size: int = None
+    local_mtime_ns: int = None
+    remote_id: str = None
+    remote_rev: str = None
+
+    def same_local_state(self, other):
+        return (self.is_dir, self.size, self.local_mtime_ns) == (
+            other.is_dir,
+            other.size,
+            other.local_mtime_ns,
+        )
+
+
+class SyncState:
+    """Состояние последней успешной синхронизации пк -> облако для одного облака.
+
+    Пути хранятся в том же виде, что и в sync_folders: SYNC_FOLDER\\child\\file"""
+
+    def __init__(self, provider, db_path=SYNC_STATE_FILE):
+        self.provider = provider
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "provider TEXT, path TEXT, is_dir INTEGER, size INTEGER, "
+                "local_mtime_ns INTEGER, remote_id TEXT, remote_rev TEXT, "
+                "PRIMARY KEY (provider, path))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "provider TEXT, key TEXT, value TEXT, PRIMARY KEY (provider, key))"
+            )
+        return self._connection
+
+    def get_entries(self, root):
+        """Возвращает записи для папки root и всего её содержимого"""
+        prefix = root + os.path.sep
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT path, is_dir, size, local_mtime_ns, remote_id, remote_rev "
+                    "FROM entries WHERE provider = ? "
+                    "AND (path = ? OR substr(path, 1, ?) = ?)",
+                    (self.provider, root, len(prefix), prefix),
+                )
+                .fetchall()
+            )
+        return {row[0]: SyncEntry(bool(row[1]), *row[2:]) for row in rows}
+
+    def replace_entries(self, root, entries):
+        """Заменяет записи папки root на entries одной транзакцией"""
+        prefix = root + os.path.sep
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "DELETE FROM entries WHERE provider = ? "
+                    "AND (path = ? OR substr(path, 1, ?) = ?)",
+                    (self.provider, root, len(prefix), prefix),
+                )
+                connection.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            self.provider,
+                            path,
+                            int(entry.is_dir),
+                            entry.size,
+                            entry.local_mtime_ns,
+                            entry.remote_id,
+                            entry.remote_rev,
+                        )
+                        for path, entry in entries.items()
+                    ],
+                )
+
+    def get_meta(self, key):
+        """Служебное значение облака (например курсор листинга), None если его нет"""
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT value FROM meta WHERE provider = ? AND key = ?",
+                    (self.provider, key),
+                )
+                .fetchone()
+            )
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?, ?)",
+                    (self.provider, key, value),
+                )
+
+    def delete_meta(self, key):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "DELETE FROM meta WHERE provider = ? AND key = ?",
+                    (self.provider, key),
+                )
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,149 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# число одновременных передач для каждого облака
+# DropBoxUploadSession - части больших файлов Dropbox, YandexDiskUploadLinks -
+# ссылки на загрузку Яндекс Диска, YandexDiskListing - листинг его папок.
+# Отдельные пулы, чтобы передачи файлов не ждали сами себя
+TRANSFER_WORKERS = {
+    "YandexDisk": 8,
+    "DropBox": 8,
+    "GoogleDrive": 4,
+    "DropBoxUploadSession": 4,
+    "YandexDiskUploadLinks": 4,
+    "YandexDiskListing": 8,
+}
+DEFAULT_TRANSFER_WORKERS = 4
+# сколько байт может передаваться одновременно, файл больше лимита идёт один
+MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_transfer_executor(cloud_name):
+    """Общий пул передач облака, один на все отслеживаемые папки"""
+    with _executors_lock:
+        if cloud_name not in _executors:
+            _executors[cloud_name] = TransferExecutor(
+                TRANSFER_WORKERS.get(cloud_name, DEFAULT_TRANSFER_WORKERS)
+            )
+        return _executors[cloud_name]
+
+
+class TransferExecutor:
+    """Пул потоков для загрузок, скачиваний и удалений.
+
+    Одновременно выполняется не больше workers операций и не больше
+    max_in_flight_bytes данных. Операции отправляются через batch()"""
+
+    def __init__(self, workers, max_in_flight_bytes=MAX_IN_FLIGHT_BYTES):
+        self.workers = workers
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="transfer"
+        )
+        self._condition = threading.Condition()
+        self._in_flight_bytes = 0
+        self._operations = 0
+        self._bytes = 0
+        self._started = None
+        self._finished = None
+
+    def batch(self):
+        return TransferBatch(self)
+
+    def submit(self, size, function, *args, **kwargs):
+        # файл больше лимита занимает весь лимит и передаётся один
+        reserved = min(size, self.max_in_flight_bytes)
+        with self._condition:
+            while (
+                self._in_flight_bytes
+                and self._in_flight_bytes + reserved > self.max_in_flight_bytes
+            ):
+                self._condition.wait()
+            self._in_flight_bytes += reserved
+            if self._started is None:
+                self._started = time.monotonic()
+
+        # контекст копируется, чтобы вывод шёл в канал облака
+        context = contextvars.copy_context()
+        return self._executor.submit(
+            context.run, self._run, size, reserved, function, *args, **kwargs
+        )
+
+    def _run(self, size, reserved, function, *args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self._condition:
+                self._in_flight_bytes -= reserved
+                self._operations += 1
+                self._bytes += size
+                self._finished = time.monotonic()
+                self._condition.notify_all()
+
+    def throughput(self):
+        """Скорость в байтах в секунду с момента последнего отчёта"""
+        with self._condition:
+            if self._started is None or self._finished is None:
+                return 0.0
+            elapsed = max(self._finished - self._started, 1e-6)
+            return self._bytes / elapsed
+
+    def report(self):
+        throughput = self.throughput()
+        with self._condition:
+            if self._operations:
+                elapsed = self._finished - self._started
+                print(
+                    f"Передано {self._operations} операций, "
+                    f"{self._bytes / 1024 / 1024:.1f} МБ за {elapsed:.1f} с "
+                    f"({throughput / 1024 / 1024:.2f} МБ/с, потоков: {self.workers})"
+                )
+            self._operations = 0
+            self._bytes = 0
+            self._started = None
+            self._finished = None
+
+
+class TransferBatch:
+    """Группа операций, при выходе из with ждём их все,
+    первая ошибка пробрасывается дальше"""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.futures = []
+
+    def submit(self, function, *args, size=0, **kwargs):
+        self.futures.append(self.executor.submit(size, function, *args, **kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wait(self.futures)
+        if exc_type is None:
+            for future in self.futures:
+                future.result()
+        return False
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def remove_nested_folders(folders):
+    """Оставляет только папки, которые не лежат внутри других папок списка"""
+    folders = sorted(folders, key=lambda folder: folder.count(os.path.sep))
+    result = []
+    for folder in folders:
+        if not any(folder.startswith(parent + os.path.sep) for parent in result):
+            result.append(folder)
+    return result
@@ -0,0 +1,88 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.transfer import TRANSFER_WORKERS, DEFAULT_TRANSFER_WORKERS
+
+# (подключение, чтение) в секундах, ожидание чтения - между порциями данных
+DEFAULT_TIMEOUT = (10, 60)
+# соединений сверх пула передач: запросы метаданных из потоков папок
+EXTRA_CONNECTIONS = 8
+# повторяем только установку соединения, запрос до сервера ещё не дошёл
+CONNECT_RETRIES = Retry(total=None, connect=3, read=0, status=0, backoff_factor=0.5)
+
+# файл отправляется порциями по 1 МБ, а не по 8 КБ, как читает http.client
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(cloud_name):
+    """Общий HTTP-транспорт облака, один на все его папки и потоки"""
+    with _transports_lock:
+        if cloud_name not in _transports:
+            _transports[cloud_name] = Transport(
+                TRANSFER_WORKERS.get(cloud_name, DEFAULT_TRANSFER_WORKERS)
+                + EXTRA_CONNECTIONS
+            )
+        return _transports[cloud_name]
+
+
+class Transport:
+    """requests.Session с пулом keep-alive соединений и таймаутами по умолчанию.
+
+    Соединение с сервером облака устанавливается один раз
+    и переиспользуется всеми запросами"""
+
+    def __init__(self, pool_size, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=CONNECT_RETRIES,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class FileBody:
+    """Тело запроса из файла: передаётся как есть, без multipart,
+    с известным Content-Length и читается большими порциями,
+    поэтому память не растёт с размером файла"""
+
+    def __init__(self, path, buffer_size=UPLOAD_BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.size = os.path.getsize(path)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # каждый повтор запроса читает файл заново
+        with open(self.path, "rb") as file:
+            yield from iter(lambda: file.read(self.buffer_size), b"")
@@ -0,0 +1,172 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# события inotify, после которых папку нужно синхронизировать
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+# после последнего события ждём тишины, но не дольше MAX_DELAY с первого
+DEBOUNCE_SECONDS = 2.0
+MAX_DELAY_SECONDS = 30.0
+
+
+def load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify поддерживается только в Linux")
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class FolderWatcher:
+    """Следит через inotify за отслеживаемыми папками и всеми их подпапками.
+
+    read_changes() ждёт событий без опроса, поэтому без изменений
+    процесс не потребляет процессорное время"""
+
+    def __init__(self, folders):
+        self.libc = load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 не удался")
+        self.folders = list(folders)
+        self.watches = {}  # wd -> путь папки
+        for folder in self.folders:
+            self.add_tree(folder)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # папку успели удалить или это не папка - следить не за чем
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return
+            if error == errno.ENOSPC:
+                print(
+                    "Превышен лимит inotify, увеличьте " "fs.inotify.max_user_watches"
+                )
+            raise OSError(error, f"Не удалось следить за {path}")
+        self.watches[wd] = path
+
+    def add_tree(self, path):
+        for root, _, _ in os.walk(path):
+            self.add_watch(root)
+
+    def get_watched_folder(self, path):
+        for folder in self.folders:
+            if path == folder or path.startswith(folder + os.path.sep):
+                return folder
+        return None
+
+    def read_changes(self, timeout=None):
+        """Ждёт событий до timeout секунд (None - без ограничения).
+
+        Returns:
+            Множество отслеживаемых папок, в которых что-то изменилось
+
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # события потерялись - проверяем все папки
+                changed.update(self.folders)
+                continue
+
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+
+            if name and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # новая папка могла появиться уже с содержимым
+                self.add_tree(os.path.join(path, os.fsdecode(name)))
+
+            folder = self.get_watched_folder(path)
+            if folder is not None:
+                changed.add(folder)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_folders(
+    watcher,
+    sync,
+    debounce=DEBOUNCE_SECONDS,
+    max_delay=MAX_DELAY_SECONDS,
+    clock=time.monotonic,
+):
+    """Вызывает sync(папки) с изменившимися отслеживаемыми папками,
+    когда поток событий затихнет на debounce секунд"""
+    pending = set()
+    first_change = last_change = None
+    while True:
+        if pending:
+            deadline = min(last_change + debounce, first_change + max_delay)
+            timeout = max(0.0, deadline - clock())
+        else:
+            timeout = None
+
+        changed = watcher.read_changes(timeout)
+        if changed:
+            last_change = clock()
+            if not pending:
+                first_change = last_change
+            pending.update(changed)
+            if last_change - first_change < max_delay:
+                continue
+
+        if pending:
+            folders = sorted(pending)
+            pending.clear()
+            sync(folders)